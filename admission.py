@@ -0,0 +1,175 @@
+"""
+Admission control for new sessions, with a FIFO waiting room.
+
+Every Streamlit session shares one process and one API quota, so once too
+many chats run at the same time everyone gets slow together. Sessions ask
+for a slot when they leave the check-in (see app.py). While the number of
+active chats is below the limit they go straight in. Otherwise they wait in
+a first-in, first-out queue and are shown their position.
+
+The limit adapts to the completion latency that admitted users actually see
+(additive increase, multiplicative decrease). While replies meet the latency
+SLO the limit grows by about one slot per limit's worth of replies. When
+replies are slower than the SLO it is cut by a quarter, at most once per
+cool-down period. It always stays between the floor and the configured
+maximum.
+
+Configuration (environment):
+    POCKET_AI_MAX_ACTIVE        maximum concurrent active chats (default 20)
+    POCKET_AI_MIN_ACTIVE        the adaptive limit never drops below this (default 2)
+    POCKET_AI_LATENCY_SLO       target reply latency in seconds (default 8)
+    POCKET_AI_ADMISSION_IDLE    seconds without a rerun before a slot is freed (default 900,
+                                well above the longest exercise, during which a
+                                user may not interact at all)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import metrics
+
+# Fraction of the limit kept when replies miss the SLO
+DECREASE_FACTOR = 0.75
+
+# Minimum seconds between two decreases, so one slow burst is not punished repeatedly
+DECREASE_COOLDOWN_SECONDS = 10
+
+# Queued sessions that stop polling for this long have left the waiting room
+QUEUE_TIMEOUT_SECONDS = 30
+
+
+class AdmissionController:
+    """
+    Process-wide gate on the number of concurrently active chats.
+
+    Args:
+        max_active: Upper bound for the adaptive limit
+        min_active: Lower bound for the adaptive limit
+        latency_slo: Target reply latency in seconds
+        idle_timeout: Seconds without a touch() before an active session is released
+    """
+
+    def __init__(self, max_active: int = 20, min_active: int = 2,
+                 latency_slo: float = 8.0, idle_timeout: float = 900.0):
+        self.max_active = max_active
+        self.min_active = min(min_active, max_active)
+        self.latency_slo = latency_slo
+        self.idle_timeout = idle_timeout
+        self._limit = float(max_active)
+        self._lock = threading.Lock()
+        self._active: Dict[str, float] = {}
+        self._queue: "OrderedDict[str, float]" = OrderedDict()
+        self._last_decrease = float("-inf")
+
+    @property
+    def limit(self) -> int:
+        """Current number of chats allowed to run at once."""
+        return int(self._limit)
+
+    def request(self, session_id: str) -> Optional[int]:
+        """
+        Ask for a slot; call again on every rerun while waiting.
+
+        Args:
+            session_id: The session asking to start an exercise
+
+        Returns:
+            None once the session is admitted, otherwise its 1-based queue position
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if session_id in self._active:
+                self._active[session_id] = now
+                return None
+
+            if session_id not in self._queue:
+                self._queue[session_id] = now
+                metrics.incr("admission.requests")
+            else:
+                self._queue[session_id] = now
+
+            # First come, first served: only the head of the queue may take a free slot
+            position = list(self._queue).index(session_id) + 1
+            if len(self._active) + position <= self.limit:
+                del self._queue[session_id]
+                self._active[session_id] = now
+                metrics.incr("admission.admitted")
+                return None
+
+            metrics.incr("admission.waiting_polls")
+            return position
+
+    def touch(self, session_id: str):
+        """
+        Record that an admitted session is still in use.
+
+        A session whose slot expired while it sat idle is mid-exercise, so it
+        takes its slot back instead of being sent to the waiting room; it
+        counts towards the limit again either way.
+        """
+        with self._lock:
+            if session_id not in self._active:
+                self._queue.pop(session_id, None)
+                metrics.incr("admission.readmitted")
+            self._active[session_id] = time.monotonic()
+
+    def release(self, session_id: str):
+        """Free the session's slot (or leave the queue)."""
+        with self._lock:
+            self._active.pop(session_id, None)
+            self._queue.pop(session_id, None)
+
+    def observe_latency(self, seconds: float):
+        """
+        Adapt the limit to the latency of a completed reply.
+
+        Args:
+            seconds: Time the user waited for the reply
+        """
+        with self._lock:
+            if seconds > self.latency_slo:
+                now = time.monotonic()
+                if now - self._last_decrease < DECREASE_COOLDOWN_SECONDS:
+                    return
+                self._last_decrease = now
+                self._limit = max(float(self.min_active), self._limit * DECREASE_FACTOR)
+                metrics.incr("admission.limit_decreased")
+            else:
+                self._limit = min(float(self.max_active), self._limit + 1.0 / max(self._limit, 1.0))
+
+    def stats(self) -> Dict[str, int]:
+        """Return the current limit, active chats and queue length."""
+        with self._lock:
+            self._expire(time.monotonic())
+            return {"limit": self.limit, "active": len(self._active), "waiting": len(self._queue)}
+
+    def _expire(self, now: float):
+        """Drop sessions whose tab was closed (caller holds the lock)."""
+        for session_id, seen in list(self._active.items()):
+            if now - seen > self.idle_timeout:
+                del self._active[session_id]
+                metrics.incr("admission.expired")
+        for session_id, seen in list(self._queue.items()):
+            if now - seen > QUEUE_TIMEOUT_SECONDS:
+                del self._queue[session_id]
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_controller() -> AdmissionController:
+    """Return the process-wide admission controller, configured from the environment."""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController(
+                max_active=int(os.getenv("POCKET_AI_MAX_ACTIVE", "20")),
+                min_active=int(os.getenv("POCKET_AI_MIN_ACTIVE", "2")),
+                latency_slo=float(os.getenv("POCKET_AI_LATENCY_SLO", "8")),
+                idle_timeout=float(os.getenv("POCKET_AI_ADMISSION_IDLE", "900")),
+            )
+        return _controller
@@ -0,0 +1,227 @@
+"""
+Columnar event sink for session analytics.
+
+The app records one event at each step of a session: check-in, exercise
+selection, setup, every completed turn, and the end of an exercise. Events
+are buffered in memory and a background thread writes them to Parquet files
+in batches. The UI never waits on disk, and the files can be scanned
+column by column (see analytics_report.py).
+
+Columns:
+    ts            event time (UTC, milliseconds)
+    session_id    ties a session's events together
+    event         one of EVENTS
+    exercise      selected exercise (selection and later)
+    mood_rating   1-5 (checkin)
+    sensations    sorted body sensations (checkin)
+    attention     attention focus (checkin)
+    turn_kind     greeting, chat or finished_exercise (turn)
+    latency_ms    time the user waited for the reply (turn)
+    fallback      a fallback message was shown while waiting (turn)
+    turns         user turns in the exercise so far (chat, finished)
+
+Recording is off unless POCKET_AI_ANALYTICS_DIR is set. It needs pyarrow,
+which is optional (pip install -r requirements-analytics.txt); without it
+the sink is disabled.
+
+Configuration (environment):
+    POCKET_AI_ANALYTICS_DIR       directory for the Parquet files
+    POCKET_AI_ANALYTICS_BATCH     events per file before an early flush (default 5000)
+    POCKET_AI_ANALYTICS_FLUSH     seconds between flushes (default 60)
+"""
+import atexit
+import glob
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Funnel steps, in order, followed by the per-turn event
+EVENTS = ["checkin", "selection", "setup", "chat", "finished", "turn"]
+FUNNEL = EVENTS[:5]
+
+_COLUMNS = ["ts", "session_id", "event", "exercise", "mood_rating", "sensations",
+            "attention", "turn_kind", "latency_ms", "fallback", "turns"]
+
+
+def event_schema():
+    """Arrow schema of the event files."""
+    return pa.schema([
+        ("ts", pa.timestamp("ms", tz="UTC")),
+        ("session_id", pa.string()),
+        ("event", pa.dictionary(pa.int8(), pa.string())),
+        ("exercise", pa.dictionary(pa.int8(), pa.string())),
+        ("mood_rating", pa.int8()),
+        ("sensations", pa.list_(pa.string())),
+        ("attention", pa.dictionary(pa.int8(), pa.string())),
+        ("turn_kind", pa.dictionary(pa.int8(), pa.string())),
+        ("latency_ms", pa.float32()),
+        ("fallback", pa.bool_()),
+        ("turns", pa.int16()),
+    ])
+
+
+class EventSink:
+    """
+    Buffers events and writes them to Parquet from a background thread.
+
+    Args:
+        directory: Where the Parquet files go (created if missing)
+        batch_size: Buffered events that trigger a flush before the interval
+        flush_seconds: Maximum seconds an event waits in memory
+    """
+
+    def __init__(self, directory: str, batch_size: int = 5000, flush_seconds: float = 60.0):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._schema = event_schema()
+        self._buffer: Dict[str, list] = {name: [] for name in _COLUMNS}
+        self._buffered = 0
+        self._files = 0
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._run, name="analytics-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def record(self, event: str, session_id: str, exercise: Optional[str] = None,
+               mood_rating: Optional[int] = None, sensations: Optional[List[str]] = None,
+               attention: Optional[str] = None, turn_kind: Optional[str] = None,
+               latency_ms: Optional[float] = None, fallback: Optional[bool] = None,
+               turns: Optional[int] = None):
+        """
+        Buffer one event; cheap enough to call from a rerun.
+
+        Args:
+            event: One of EVENTS
+            session_id: The session the event belongs to
+            exercise, mood_rating, sensations, attention, turn_kind, latency_ms,
+            fallback, turns: Columns that apply to this event (see module docstring)
+        """
+        row = (int(time.time() * 1000), session_id, event, exercise, mood_rating,
+               sorted(sensations) if sensations is not None else None,
+               attention, turn_kind, latency_ms, fallback, turns)
+        with self._cond:
+            for name, value in zip(_COLUMNS, row):
+                self._buffer[name].append(value)
+            self._buffered += 1
+            if self._buffered >= self.batch_size:
+                self._cond.notify()
+        metrics.incr("analytics.events")
+
+    def flush(self):
+        """Write buffered events to a new Parquet file now."""
+        with self._cond:
+            if not self._buffered:
+                return
+            columns, self._buffer = self._buffer, {name: [] for name in _COLUMNS}
+            self._buffered = 0
+
+        with self._write_lock:
+            self._files += 1
+            path = os.path.join(
+                self.directory,
+                f"events-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._files}.parquet"
+            )
+            table = pa.Table.from_pydict(columns, schema=self._schema)
+            _write_atomically(table, path)
+        metrics.incr("analytics.files")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._buffered >= self.batch_size, timeout=self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                # Analytics must never take the app down; the batch is dropped
+                metrics.incr("analytics.flush_errors")
+                print(f"Analytics flush failed: {e}", file=sys.stderr)
+
+
+def _write_atomically(table: "pa.Table", path: str):
+    """
+    Write a Parquet file so readers never see it half-written.
+
+    The file is written under a hidden temporary name first; dataset
+    discovery skips names starting with "." (and so does event_files()),
+    even if a crashed writer leaves one behind.
+    """
+    directory, name = os.path.split(path)
+    tmp = os.path.join(directory, f".{name}.tmp")
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path)
+
+
+def event_files(directory: str) -> List[str]:
+    """Complete event files in a directory, oldest first."""
+    return sorted(glob.glob(os.path.join(directory, "events-*.parquet")))
+
+
+class NullSink:
+    """Stand-in used when analytics are off; every call is a no-op."""
+
+    def record(self, event: str, session_id: str, **columns):
+        pass
+
+    def flush(self):
+        pass
+
+
+def compact(directory: str) -> Optional[str]:
+    """
+    Merge all event files in a directory into one, so scans open fewer files.
+
+    Only call it while no process is writing to the directory.
+
+    Args:
+        directory: Directory written by EventSink
+
+    Returns:
+        Path of the merged file, or None if there was nothing to merge
+    """
+    paths = event_files(directory)
+    if len(paths) < 2:
+        return None
+    table = pa.concat_tables(pq.read_table(path, schema=event_schema()) for path in paths)
+    merged = os.path.join(directory, f"events-{time.strftime('%Y%m%d-%H%M%S')}-merged.parquet")
+    _write_atomically(table, merged)
+    for path in paths:
+        os.remove(path)
+    return merged
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_sink():
+    """Return the process-wide event sink (a NullSink unless analytics are configured)."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            directory = os.getenv("POCKET_AI_ANALYTICS_DIR")
+            if not directory:
+                _sink = NullSink()
+            elif pa is None:
+                print("POCKET_AI_ANALYTICS_DIR is set but pyarrow is not installed; "
+                      "analytics are disabled", file=sys.stderr)
+                _sink = NullSink()
+            else:
+                _sink = EventSink(
+                    directory,
+                    batch_size=int(os.getenv("POCKET_AI_ANALYTICS_BATCH", "5000")),
+                    flush_seconds=float(os.getenv("POCKET_AI_ANALYTICS_FLUSH", "60")),
+                )
+        return _sink
@@ -0,0 +1,258 @@
+"""
+Aggregate report over the session events written by analytics.py.
+
+Every aggregate is computed column-wise with Arrow compute kernels over the
+whole dataset (no Python loop per row), so millions of events take seconds:
+
+- funnel: sessions reaching check-in -> selection -> setup -> chat -> finished,
+  with step-to-step and overall conversion
+- reply latency percentiles per turn kind and exercise, and the fallback rate
+- mood ratings, the most common sensation combinations, attention focus
+- exercise choices and user turns per finished exercise
+
+Needs pyarrow (pip install -r requirements-analytics.txt).
+
+Usage:
+    python analytics_report.py                       # reads POCKET_AI_ANALYTICS_DIR or ./analytics
+    python analytics_report.py --dir /var/lib/pocket-ai/analytics
+    python analytics_report.py --compact             # merge small files first
+    python analytics_report.py --generate 2000000 --dir /tmp/events   # synthetic data, then report
+"""
+import argparse
+import os
+import random
+import time
+from typing import Dict, List
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from analytics import FUNNEL, compact, event_files, event_schema
+
+PERCENTILES = [0.5, 0.9, 0.95, 0.99]
+
+
+def load(directory: str) -> pa.Table:
+    """Read every complete event file in the directory into one table."""
+    return ds.dataset(event_files(directory), format="parquet", schema=event_schema()).to_table()
+
+
+def funnel(events: pa.Table) -> List[Dict]:
+    """
+    Distinct sessions per funnel step.
+
+    Returns:
+        One row per step: sessions, share of the previous step, share of check-ins
+    """
+    counts = (events.filter(pc.is_in(pc.cast(events["event"], pa.string()), pa.array(FUNNEL)))
+              .group_by("event").aggregate([("session_id", "count_distinct")]))
+    by_step = dict(zip(pc.cast(counts["event"], pa.string()).to_pylist(),
+                       counts["session_id_count_distinct"].to_pylist()))
+
+    rows, previous, first = [], None, by_step.get(FUNNEL[0], 0)
+    for step in FUNNEL:
+        sessions = by_step.get(step, 0)
+        rows.append({
+            "step": step,
+            "sessions": sessions,
+            "from_previous": sessions / previous if previous else None,
+            "from_checkin": sessions / first if first else None,
+        })
+        previous = sessions
+    return rows
+
+
+def latency_percentiles(events: pa.Table, by: List[str]) -> pa.Table:
+    """
+    Reply latency percentiles (t-digest) and fallback rate, grouped by columns.
+
+    Args:
+        events: Event table
+        by: Grouping columns, e.g. ["turn_kind"] or ["exercise", "turn_kind"]
+    """
+    turns = events.filter(pc.equal(events["event"], "turn"))
+    # group_by needs plain keys; dictionary columns are decoded first
+    turns = pa.table({
+        **{name: pc.cast(turns[name], pa.string()) for name in by},
+        "latency_ms": turns["latency_ms"],
+        "fallback": pc.cast(turns["fallback"], pa.int8()),
+    })
+    return turns.group_by(by).aggregate([
+        ("latency_ms", "count"),
+        ("latency_ms", "tdigest", pc.TDigestOptions(q=PERCENTILES)),
+        ("fallback", "mean"),
+    ]).sort_by([(name, "ascending") for name in by])
+
+
+def value_counts(column: pa.Array, top: int = 10) -> List[tuple]:
+    """Most common values of a column, largest first."""
+    counts = pc.value_counts(pc.drop_null(column))
+    order = pc.array_sort_indices(counts.field("counts"), order="descending")
+    counts = counts.take(order[:top])
+    return list(zip(counts.field("values").to_pylist(), counts.field("counts").to_pylist()))
+
+
+def checkin_breakdown(events: pa.Table) -> Dict[str, List[tuple]]:
+    """Mood ratings, sensation combinations and attention focus at check-in."""
+    checkins = events.filter(pc.equal(events["event"], "checkin"))
+    return {
+        "mood_rating": sorted(value_counts(checkins["mood_rating"], top=5)),
+        "sensations": value_counts(pc.binary_join(checkins["sensations"], " + ")),
+        "attention": value_counts(pc.cast(checkins["attention"], pa.string())),
+    }
+
+
+def exercise_breakdown(events: pa.Table) -> pa.Table:
+    """Per exercise: selections and the user turns of finished exercises."""
+    event = pc.cast(events["event"], pa.string())
+    exercise = pc.cast(events["exercise"], pa.string())
+    selection_mask = pc.equal(event, "selection")
+    selections = pa.table({
+        "exercise": pc.filter(exercise, selection_mask),
+        "selections": pc.filter(event, selection_mask),
+    }).group_by("exercise").aggregate([("selections", "count")])
+    finished_mask = pc.equal(event, "finished")
+    finished = pa.table({
+        "exercise": pc.filter(exercise, finished_mask),
+        "turns": pc.filter(events["turns"], finished_mask),
+    }).group_by("exercise").aggregate([
+        ("turns", "count"),
+        ("turns", "mean"),
+        ("turns", "approximate_median"),
+    ])
+    return selections.join(finished, "exercise", join_type="left outer").sort_by("exercise")
+
+
+def generate(directory: str, rows: int, seed: int = 7, files: int = 8):
+    """
+    Write synthetic events shaped like real sessions, for benchmarking the report.
+
+    Args:
+        directory: Output directory
+        rows: Approximate number of events
+        seed: Random seed
+        files: Number of Parquet files to spread the rows over
+    """
+    import pyarrow.parquet as pq
+
+    rng = random.Random(seed)
+    sensations = ["Tension in body", "Numbness", "Tight chest or breathing", "Heavy or tired",
+                  "Light and energetic", "Restless or fidgety", "Emptiness", "Palpitations"]
+    attention = ["A conversation I need to have", "Personal care or self-care", "Work tasks or projects",
+                 "Expressing emotions I've held back", "Reaching out to someone", "Physical sensations"]
+    exercises = ["empty_chair", "breathing", "body_scan", "reflection"]
+    schema = event_schema()
+    os.makedirs(directory, exist_ok=True)
+
+    per_file = rows // files
+    now = int(time.time() * 1000)
+    for n in range(files):
+        columns = {field.name: [] for field in schema}
+
+        def add(ts, session_id, event, **values):
+            columns["ts"].append(ts)
+            columns["session_id"].append(session_id)
+            columns["event"].append(event)
+            for name in ("exercise", "mood_rating", "sensations", "attention",
+                         "turn_kind", "latency_ms", "fallback", "turns"):
+                columns[name].append(values.get(name))
+
+        while len(columns["ts"]) < per_file:
+            session_id = f"{n}-{rng.getrandbits(64):016x}"
+            ts = now - rng.randrange(30 * 24 * 3600 * 1000)
+            add(ts, session_id, "checkin", mood_rating=rng.randint(1, 5),
+                sensations=sorted(rng.sample(sensations, rng.randint(1, 3))), attention=rng.choice(attention))
+            if rng.random() < 0.15:
+                continue
+            exercise = rng.choice(exercises)
+            add(ts, session_id, "selection", exercise=exercise)
+            if rng.random() < 0.1:
+                continue
+            add(ts, session_id, "setup", exercise=exercise)
+            add(ts, session_id, "turn", exercise=exercise, turn_kind="greeting",
+                latency_ms=rng.lognormvariate(7.3, 0.5), fallback=False)
+            if rng.random() < 0.2:
+                continue
+            turns = rng.randint(1, 12)
+            add(ts, session_id, "chat", exercise=exercise, turns=1)
+            for _ in range(turns):
+                latency = rng.lognormvariate(7.0, 0.6)
+                add(ts, session_id, "turn", exercise=exercise, turn_kind="chat",
+                    latency_ms=latency, fallback=latency > 4000)
+            if rng.random() < 0.6:
+                add(ts, session_id, "finished", exercise=exercise, turns=turns)
+
+        pq.write_table(pa.Table.from_pydict(columns, schema=schema),
+                       os.path.join(directory, f"events-synthetic-{n}.parquet"), compression="zstd")
+
+
+def _pct(value) -> str:
+    return f"{value:.1%}" if value is not None else "-"
+
+
+def print_report(events: pa.Table):
+    print(f"{events.num_rows:,} events, "
+          f"{pc.count_distinct(events['session_id']).as_py():,} sessions\n")
+
+    print("Funnel (distinct sessions)")
+    print(f"  {'step':<12}{'sessions':>10}{'of prev':>10}{'of check-in':>13}")
+    for row in funnel(events):
+        print(f"  {row['step']:<12}{row['sessions']:>10,}{_pct(row['from_previous']):>10}"
+              f"{_pct(row['from_checkin']):>13}")
+
+    for by in (["turn_kind"], ["exercise", "turn_kind"]):
+        print(f"\nReply latency (ms) by {' / '.join(by)}")
+        table = latency_percentiles(events, by)
+        header = "".join(f"{name:<20}" for name in by)
+        print(f"  {header}{'turns':>9}" + "".join(f"{f'p{int(q * 100)}':>8}" for q in PERCENTILES)
+              + f"{'fallback':>10}")
+        for row in table.to_pylist():
+            keys = "".join(f"{str(row[name]):<20}" for name in by)
+            quantiles = "".join(f"{q:>8.0f}" for q in row["latency_ms_tdigest"])
+            print(f"  {keys}{row['latency_ms_count']:>9,}{quantiles}{_pct(row['fallback_mean']):>10}")
+
+    print("\nExercises")
+    print(f"  {'exercise':<14}{'selected':>10}{'finished':>10}{'mean turns':>12}{'median':>8}")
+    for row in exercise_breakdown(events).to_pylist():
+        mean = "-" if row["turns_mean"] is None else f"{row['turns_mean']:.1f}"
+        median = "-" if row["turns_approximate_median"] is None else f"{row['turns_approximate_median']:.0f}"
+        print(f"  {row['exercise']:<14}{row['selections_count']:>10,}{row['turns_count'] or 0:>10,}"
+              f"{mean:>12}{median:>8}")
+
+    breakdown = checkin_breakdown(events)
+    print("\nMood rating at check-in")
+    for rating, count in breakdown["mood_rating"]:
+        print(f"  {rating}/5  {count:>10,}")
+    print("\nMost common sensation combinations")
+    for combination, count in breakdown["sensations"]:
+        print(f"  {count:>10,}  {combination}")
+    print("\nAttention focus")
+    for focus, count in breakdown["attention"]:
+        print(f"  {count:>10,}  {focus}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report funnel, latency and check-in aggregates from session events.")
+    parser.add_argument("--dir", default=os.getenv("POCKET_AI_ANALYTICS_DIR", "analytics"),
+                        help="Directory of event files")
+    parser.add_argument("--compact", action="store_true", help="Merge the event files into one first")
+    parser.add_argument("--generate", type=int, metavar="ROWS", help="Write synthetic events to --dir first")
+    args = parser.parse_args()
+
+    if args.generate:
+        started = time.perf_counter()
+        generate(args.dir, args.generate)
+        print(f"Generated synthetic events in {time.perf_counter() - started:.1f}s")
+    if args.compact:
+        compact(args.dir)
+
+    started = time.perf_counter()
+    events = load(args.dir)
+    loaded = time.perf_counter() - started
+    print_report(events)
+    print(f"\nLoaded in {loaded:.2f}s, report computed in {time.perf_counter() - started - loaded:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+"""
+Headless HTTP API for PersonaChat sessions.
+
+A lightweight async alternative to the Streamlit app for integrating persona
+chat into other applications. Sessions live in a bounded in-memory
+SessionManager; completions run on the shared worker pool (see workers.py),
+so deleting or evicting a session cancels its in-flight request.
+
+Endpoints:
+    POST   /sessions                      {"persona_name", "persona_description"} -> {"session_id"}
+    POST   /sessions/{session_id}/messages {"message"} -> {"reply"}
+    POST   /sessions/{session_id}/stream   {"message"} -> text/event-stream of reply pieces
+    DELETE /sessions/{session_id}
+    POST   /groups                        {"personas": [{"persona_name", "persona_description"}, ...]} -> {"group_id"}
+    POST   /groups/{group_id}/messages    {"message"} -> {"replies": {name: reply}, "errors": {name: error}}
+    POST   /groups/{group_id}/stream      {"message"} -> text/event-stream, one event per persona
+    DELETE /groups/{group_id}
+    GET    /health
+    GET    /ready                          200 once warmed up (see warmup.py), 503 before
+
+The stream endpoint sends one "token" event per piece ({"text": ...}), then a
+"done" event with the full reply, or an "error" event.
+
+Each session counts its tokens in a ledger (see ledger.py). Once a token
+budget is spent, messages get a 429 (an "error" event when streaming).
+
+User messages are screened for crisis signals while the reply is generated
+(see safety.py). Replies carry the result as "screening" ({"level", "score",
+"categories"}). On the "crisis" level the model's reply is cancelled and
+safety.CRISIS_REPLY is returned instead. A "concern" is only reported, so
+clients can decide how to show it.
+
+A group (see group.py) sends every message to all of its personas at once.
+The group stream sends a "reply" event ({"persona_name", "reply",
+"seconds"}) or an "error" event ({"persona_name", "error"}) as each persona
+finishes, then a "done" event with all replies. A round takes as long as
+its slowest reply. Group messages are screened before they go out, so a
+crisis message is never sent to the personas: the response (or the "done"
+event) has no replies and carries "reply": CRISIS_REPLY instead. Group
+responses carry "screening" like single-chat replies.
+
+Usage:
+    python api_server.py --port 8000
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
+from aiohttp import web
+
+from early_stop import budget_for
+from group import GroupReply, GroupSession
+from ledger import TokenBudgetExceeded, get_process_budget
+from safety import CRISIS, CRISIS_REPLY, screen, screening_enabled
+from script import CompletionCancelled, PersonaChat
+from warmup import get_shared_client, is_ready, mark_ready, start_keepalive, timings, warm_up
+from workers import get_pool
+
+_DONE = object()
+
+# Most personas a group may hold
+MAX_GROUP_SIZE = 5
+
+SAFETY_SCREEN = screening_enabled()
+
+
+class ApiSession:
+    """One persona conversation (or group of them) held by the server."""
+
+    def __init__(self, session_id: str, chat: Union[PersonaChat, GroupSession]):
+        self.id = session_id
+        self.chat = chat
+        # Turns on the same conversation must not interleave
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class SessionManager:
+    """
+    Bounded in-memory store of API sessions.
+
+    Sessions idle for longer than idle_timeout are dropped, and when the store
+    is full the least recently used session is evicted. Evicted sessions have
+    their in-flight requests cancelled.
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_timeout: float = 1800):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions: "OrderedDict[str, ApiSession]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self, persona_name: str, persona_description: str) -> ApiSession:
+        """Create a session with its persona environment already set."""
+        chat = PersonaChat(verbose=False, client=get_shared_client())
+        chat.set_persona_environment(persona_name, persona_description)
+        return self._add(ApiSession(uuid.uuid4().hex, chat))
+
+    def create_group(self, personas: List[dict]) -> ApiSession:
+        """Create a group session holding every given persona."""
+        session_id = uuid.uuid4().hex
+        group = GroupSession(client=get_shared_client(), session_id=session_id)
+        for persona in personas:
+            group.add_persona(persona["persona_name"], persona["persona_description"])
+        return self._add(ApiSession(session_id, group))
+
+    def _add(self, session: ApiSession) -> ApiSession:
+        self._evict_idle()
+        while len(self._sessions) >= self.max_sessions:
+            oldest_id = next(iter(self._sessions))
+            self.delete(oldest_id)
+        self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[ApiSession]:
+        """Return a session and mark it as recently used, or None if unknown."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        """Drop a session and cancel its in-flight requests."""
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        get_pool().cancel_session(session_id)
+        return True
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for session_id in [sid for sid, s in self._sessions.items() if now - s.last_used > self.idle_timeout]:
+            self.delete(session_id)
+
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({"error": message}, status=status)
+
+
+async def _read_json(request: web.Request, *fields: str) -> dict:
+    """Parse the request body (a JSON object) and check that the given fields are non-empty strings."""
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        body = None
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Body must be JSON"}), content_type="application/json")
+    missing = [f for f in fields if not isinstance(body.get(f), str) or not body[f].strip()]
+    if missing:
+        raise web.HTTPBadRequest(
+            text=json.dumps({"error": f"Missing field(s): {', '.join(missing)}"}), content_type="application/json"
+        )
+    return body
+
+
+def _get_session(request: web.Request, group: bool = False) -> Optional[ApiSession]:
+    """Look up the session in the URL; None if unknown or of the other kind."""
+    session = request.app["sessions"].get(request.match_info["session_id"])
+    if session is None or isinstance(session.chat, GroupSession) != group:
+        return None
+    return session
+
+
+def _screen(message: str) -> Optional[dict]:
+    """Screen a user message; call it after submitting the reply so both overlap."""
+    return screen(message)._asdict() if SAFETY_SCREEN else None
+
+
+async def _preempt(session: ApiSession, job, message: str):
+    """Cancel the reply to a crisis message and record the crisis reply in its place."""
+    job.cancel()
+    # Wait for the call to unwind so it cannot touch the history afterwards
+    unwound = asyncio.wrap_future(job.future)
+    await asyncio.wait({unwound})
+    if not unwound.cancelled():
+        unwound.exception()  # expected to be CompletionCancelled; mark it as handled
+    session.chat.settle_exchange(message, CRISIS_REPLY)
+
+
+def _stream_into_queue(chat: PersonaChat, message: str, loop: asyncio.AbstractEventLoop,
+                       queue: asyncio.Queue, cancel_event: threading.Event):
+    """Worker-thread side of a streamed turn: push reply pieces onto an asyncio queue."""
+    try:
+        for piece in chat.stream_chat(message, cancel_event=cancel_event,
+                                      sentence_budget=budget_for(None, "chat")):
+            loop.call_soon_threadsafe(queue.put_nowait, piece)
+    except BaseException as e:
+        loop.call_soon_threadsafe(queue.put_nowait, e)
+        raise
+    loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+
+async def create_session(request: web.Request) -> web.Response:
+    body = await _read_json(request, "persona_name", "persona_description")
+    session = request.app["sessions"].create(body["persona_name"], body["persona_description"])
+    return web.json_response({"session_id": session.id}, status=201)
+
+
+async def send_message(request: web.Request) -> web.Response:
+    session = _get_session(request)
+    if session is None:
+        return _error(404, "Unknown session")
+    body = await _read_json(request, "message")
+
+    async with session.lock:
+        # A retried request that repeats the last message gets the reply already made
+        job = get_pool().submit_turn(session.id, "chat", session.chat.turn_key(body["message"]),
+                                     session.chat.chat, body["message"], sentence_budget=budget_for(None, "chat"))
+        screening = _screen(body["message"])
+        if screening is not None and screening["level"] == CRISIS:
+            await _preempt(session, job, body["message"])
+            return web.json_response({"reply": CRISIS_REPLY, "screening": screening})
+        try:
+            reply = await asyncio.wrap_future(job.future)
+        except asyncio.CancelledError:
+            # Client went away - stop paying for the reply
+            job.cancel()
+            raise
+        except CompletionCancelled:
+            return _error(409, "Request was cancelled")
+        except TokenBudgetExceeded as e:
+            return _error(429, str(e))
+        except Exception as e:
+            return _error(502, f"Upstream error: {e}")
+    return web.json_response({"reply": reply, "screening": screening})
+
+
+async def stream_message(request: web.Request) -> web.StreamResponse:
+    session = _get_session(request)
+    if session is None:
+        return _error(404, "Unknown session")
+    body = await _read_json(request, "message")
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # don't let nginx buffer the stream
+    })
+    await response.prepare(request)
+
+    async with session.lock:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        # A stream feeds one response, so it is never shared with a repeated request
+        job = get_pool().submit_turn(session.id, "chat", None, _stream_into_queue, session.chat, body["message"],
+                                     loop, queue)
+        screening = _screen(body["message"])
+        if screening is not None and screening["level"] == CRISIS:
+            await _send_event(response, "token", {"text": CRISIS_REPLY})
+            await _send_event(response, "done", {"reply": CRISIS_REPLY, "screening": screening})
+            await _preempt(session, job, body["message"])
+            await response.write_eof()
+            return response
+        # A job cancelled before it started never reaches _stream_into_queue
+        job.future.add_done_callback(
+            lambda f: f.cancelled() and loop.call_soon_threadsafe(queue.put_nowait, CompletionCancelled("Request was cancelled"))
+        )
+        parts = []
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    await _send_event(response, "done", {"reply": "".join(parts), "screening": screening})
+                    break
+                if isinstance(item, BaseException):
+                    await _send_event(response, "error", {"error": str(item) or type(item).__name__})
+                    break
+                parts.append(item)
+                await _send_event(response, "token", {"text": item})
+        except (ConnectionResetError, asyncio.CancelledError):
+            # Client went away - stop paying for the rest of the reply
+            job.cancel()
+            raise
+
+    await response.write_eof()
+    return response
+
+
+async def _send_event(response: web.StreamResponse, event: str, data: dict):
+    payload = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    await response.write(payload.encode("utf-8"))
+
+
+async def delete_session(request: web.Request) -> web.Response:
+    if _get_session(request) is None:
+        return _error(404, "Unknown session")
+    request.app["sessions"].delete(request.match_info["session_id"])
+    return web.Response(status=204)
+
+
+async def create_group(request: web.Request) -> web.Response:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        body = None
+    if not isinstance(body, dict):
+        return _error(400, "Body must be JSON")
+    personas = body.get("personas")
+    if not isinstance(personas, list) or not 2 <= len(personas) <= MAX_GROUP_SIZE:
+        return _error(400, f"'personas' must list 2 to {MAX_GROUP_SIZE} personas")
+    for persona in personas:
+        if not isinstance(persona, dict) or not all(
+                isinstance(persona.get(f), str) and persona[f].strip()
+                for f in ("persona_name", "persona_description")):
+            return _error(400, "Every persona needs a persona_name and a persona_description")
+    names = [p["persona_name"] for p in personas]
+    if len(set(names)) != len(names):
+        return _error(400, "Persona names must be unique within a group")
+
+    session = request.app["sessions"].create_group(personas)
+    return web.json_response({"group_id": session.id, "personas": names}, status=201)
+
+
+async def _group_replies(group: GroupSession, message: str) -> AsyncIterator[GroupReply]:
+    """Fan a message out to the group and yield replies as each persona finishes."""
+    jobs = group.submit(message)
+    pending = {asyncio.wrap_future(job.future): name for name, job in jobs.items()}
+    answered = {}
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    reply = future.result()
+                except Exception as e:
+                    yield GroupReply(name, None, e, jobs[name].elapsed)
+                    continue
+                answered[name] = reply
+                yield GroupReply(name, reply, None, jobs[name].elapsed)
+    finally:
+        # Client went away - stop paying for the remaining replies
+        for job in jobs.values():
+            if not job.done():
+                job.cancel()
+    group.share_round(answered)
+
+
+def _screen_group(session: ApiSession, message: str) -> Tuple[Optional[dict], bool]:
+    """
+    Screen a group message before it is sent to every persona.
+
+    Returns:
+        The screening result, and True if it was a crisis: the crisis reply
+        is then recorded for every persona and no reply should be requested
+    """
+    screening = _screen(message)
+    if screening is not None and screening["level"] == CRISIS:
+        session.chat.record_exchange(message, CRISIS_REPLY)
+        return screening, True
+    return screening, False
+
+
+async def send_group_message(request: web.Request) -> web.Response:
+    session = _get_session(request, group=True)
+    if session is None:
+        return _error(404, "Unknown group")
+    body = await _read_json(request, "message")
+
+    replies, errors = {}, {}
+    async with session.lock:
+        screening, crisis = _screen_group(session, body["message"])
+        if crisis:
+            return web.json_response({"replies": {}, "errors": {}, "reply": CRISIS_REPLY, "screening": screening})
+        async with aclosing(_group_replies(session.chat, body["message"])) as results:
+            async for result in results:
+                if result.error is None:
+                    replies[result.persona_name] = result.reply
+                else:
+                    errors[result.persona_name] = str(result.error) or type(result.error).__name__
+    return web.json_response({"replies": replies, "errors": errors, "screening": screening})
+
+
+async def stream_group_message(request: web.Request) -> web.StreamResponse:
+    session = _get_session(request, group=True)
+    if session is None:
+        return _error(404, "Unknown group")
+    body = await _read_json(request, "message")
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await response.prepare(request)
+
+    replies = {}
+    async with session.lock:
+        screening, crisis = _screen_group(session, body["message"])
+        if crisis:
+            await _send_event(response, "done", {"replies": {}, "reply": CRISIS_REPLY, "screening": screening})
+            await response.write_eof()
+            return response
+        async with aclosing(_group_replies(session.chat, body["message"])) as results:
+            async for result in results:
+                if result.error is None:
+                    replies[result.persona_name] = result.reply
+                    await _send_event(response, "reply", {
+                        "persona_name": result.persona_name, "reply": result.reply,
+                        "seconds": round(result.seconds, 3),
+                    })
+                else:
+                    await _send_event(response, "error", {
+                        "persona_name": result.persona_name,
+                        "error": str(result.error) or type(result.error).__name__,
+                    })
+    await _send_event(response, "done", {"replies": replies, "screening": screening})
+    await response.write_eof()
+    return response
+
+
+async def delete_group(request: web.Request) -> web.Response:
+    if _get_session(request, group=True) is None:
+        return _error(404, "Unknown group")
+    request.app["sessions"].delete(request.match_info["session_id"])
+    return web.Response(status=204)
+
+
+async def health(request: web.Request) -> web.Response:
+    body = {"status": "ok", "sessions": len(request.app["sessions"]), "tokens": get_process_budget().report()}
+    report = getattr(get_shared_client(), "report", None)
+    if report is not None:
+        # Routed backends (see backends.py): health and latency of each
+        body["backends"] = report()
+    return web.json_response(body)
+
+
+async def ready(request: web.Request) -> web.Response:
+    return web.json_response({"ready": is_ready(), "timings": timings}, status=200 if is_ready() else 503)
+
+
+def _warm_up_in_background():
+    warm_up()
+    start_keepalive()
+    mark_ready()
+
+
+async def _start_warm_up(app: web.Application):
+    app["warm_up"] = asyncio.get_running_loop().run_in_executor(None, _warm_up_in_background)
+
+
+def create_app(max_sessions: int = 1000, idle_timeout: float = 1800) -> web.Application:
+    """
+    Build the aiohttp application.
+
+    Args:
+        max_sessions: Maximum number of sessions held in memory
+        idle_timeout: Seconds after which an unused session is dropped
+
+    Returns:
+        The configured aiohttp Application
+    """
+    app = web.Application()
+    app["sessions"] = SessionManager(max_sessions=max_sessions, idle_timeout=idle_timeout)
+    app.router.add_post("/sessions", create_session)
+    app.router.add_post("/sessions/{session_id}/messages", send_message)
+    app.router.add_post("/sessions/{session_id}/stream", stream_message)
+    app.router.add_delete("/sessions/{session_id}", delete_session)
+    # Group ids share the session store, so the routes reuse its {session_id} key
+    app.router.add_post("/groups", create_group)
+    app.router.add_post("/groups/{session_id}/messages", send_group_message)
+    app.router.add_post("/groups/{session_id}/stream", stream_group_message)
+    app.router.add_delete("/groups/{session_id}", delete_group)
+    app.router.add_get("/health", health)
+    app.router.add_get("/ready", ready)
+    app.on_startup.append(_start_warm_up)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve PersonaChat sessions over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("POCKET_AI_API_PORT", "8000")))
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--idle-timeout", type=float, default=1800, help="Seconds before an unused session is dropped")
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.max_sessions, args.idle_timeout), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
 import streamlit as st
 from dotenv import load_dotenv
-from script import PersonaChat
+from script import MAIN_BRANCH, PersonaChat, CompletionCancelled, CompletionStats
+from history import ConversationHistory
+from prefetch import SpeculativePrefetcher, global_hit_rate
+from workers import get_pool
+from fallbacks import deadline_for, fallback_rates, get_fallback, record_fallback, record_turn
+from flows import FlowTracker
+from phases import PHASES, initial_phase, phased_prompts_enabled
+from profiling import MAX_PROFILE_FILES, NullProfiler, RerunProfiler, profiling_requested
+from admission import get_controller
+from warmup import get_shared_client
+from analytics import get_sink
+from archive import WeakArchiveKey, context_block, get_archive, new_archive_key, user_id_for
+import early_stop
+from ledger import BUDGET_REPLY, TokenBudgetExceeded, TokenLedger
+from safety import CRISIS, CRISIS_REPLY, NONE, annotate, screen, screening_enabled
+from prompts import (FINISHED_EXERCISE_INSTRUCTION, body_scan_prompts, breathing_prompts,
+                     describe_checkin, empty_chair_prompts, reflection_prompts)
 import os
 import json
 import re
+import sqlite3
+import time
+import uuid
 
 # Load environment variables
 load_dotenv()
@@ -45,12 +64,30 @@ EXERCISES = {
     "reflection": "💭 Reflection Exercise"
 }
 
+# Send only the current phase's instructions for multi-phase exercises (POCKET_AI_PHASED_PROMPTS=1)
+PHASED_PROMPTS = phased_prompts_enabled()
+
+# Screen user messages for crisis signals while their reply is generated (POCKET_AI_SAFETY_SCREEN=0 to disable)
+SAFETY_SCREEN = screening_enabled()
+
+# Opt-in archive of past sessions with full-text search (None unless POCKET_AI_ARCHIVE_DB is set)
+ARCHIVE = get_archive()
+
+# Speculatively prefetch predictable turns (set POCKET_AI_PREFETCH=0 to disable)
+PREFETCH_ENABLED = os.getenv("POCKET_AI_PREFETCH", "1") != "0"
+
+# How often the UI checks the worker pool for a pending reply
+POLL_INTERVAL_SECONDS = 0.3
+
+# How often a queued session checks whether a chat slot has opened
+WAITING_ROOM_POLL_SECONDS = 2.0
+
 # Initialize session state
 def init_session_state():
     defaults = {
         'chat_system': None,
         'messages': [],
-        'step': 'initial_assessment',  # initial_assessment -> exercise_selection -> exercise_setup -> chat
+        'step': 'initial_assessment',  # initial_assessment -> [waiting_room] -> exercise_selection -> exercise_setup -> chat
         'mood_rating': 3,
         'body_sensations': [],
         'attention_focus': None,
@@ -59,7 +96,26 @@ def init_session_state():
         'persona_name': '',
         'breathing_exercise_given': False,
         'breathing_exercises_used': [],
-        'show_finished_button': False
+        'show_finished_button': False,
+        'prefetcher': None,
+        'session_id': None,
+        'pending_turn': None,
+        'pending_fallback_shown': False,
+        'pending_screen': None,
+        'pending_preempt': None,
+        'flow': None,
+        'profiler': None,
+        'admitted': False,
+        'queue_position': None,
+        'user_turns': 0,
+        'exercise_finished': False,
+        'archive_user': None,
+        'archive_key_generated': None,
+        'archive_session': None,
+        'archived_count': 0,
+        'archive_context': '',
+        'message_branches': {},
+        'token_ledger': None
     }
     for key, value in defaults.items():
         if key not in st.session_state:
@@ -70,190 +126,428 @@ init_session_state()
 
 def reset_all():
     """Reset everything to start over."""
+    cancel_session_work()
+    release_slot()
+    # Opting in to the archive outlives a restart, and so do the tokens used
+    archive_user = st.session_state.archive_user
+    token_ledger = st.session_state.token_ledger
     for key in list(st.session_state.keys()):
         del st.session_state[key]
     init_session_state()
+    st.session_state.archive_user = archive_user
+    st.session_state.token_ledger = token_ledger
 
 
-def get_mood_description(rating):
-    """Convert mood rating to description."""
-    mood_map = {
-        1: "not good at all",
-        2: "not so good",
-        3: "neutral/okay",
-        4: "good",
-        5: "very good"
-    }
-    return mood_map.get(rating, "neutral")
+def get_session_id():
+    """Return the id that ties this session's background work together."""
+    if st.session_state.session_id is None:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+
+def get_token_ledger():
+    """Return the ledger that counts this session's tokens across exercises (see ledger.py)."""
+    if st.session_state.token_ledger is None:
+        st.session_state.token_ledger = TokenLedger()
+    return st.session_state.token_ledger
+
+
+def record_event(event, **columns):
+    """Record an analytics event for this session (a no-op unless analytics are on)."""
+    get_sink().record(event, get_session_id(), **columns)
+
+
+def record_finished():
+    """Record the end of the current exercise, once per exercise."""
+    if st.session_state.exercise_finished:
+        return
+    st.session_state.exercise_finished = True
+    record_event("finished", exercise=st.session_state.selected_exercise, turns=st.session_state.user_turns)
+
+
+def choose_exercise(exercise):
+    """Remember the chosen exercise and move on to its setup."""
+    st.session_state.selected_exercise = exercise
+    st.session_state.step = 'exercise_setup'
+    record_event("selection", exercise=exercise)
+
+
+def start_chat(initial_prompt):
+    """Open the chat step with the exercise's greeting turn."""
+    st.session_state.messages = []
+    st.session_state.message_branches = {}
+    st.session_state.user_turns = 0
+    st.session_state.exercise_finished = False
+    st.session_state.archive_session = None
+    record_event("setup", exercise=st.session_state.selected_exercise)
+    start_turn(initial_prompt, "greeting")
+    st.session_state.step = 'chat'
+
+
+def branch_conversation(keep):
+    """
+    Branch the chat after its first `keep` displayed messages and switch to the branch.
+    
+    The persona's history branches at the same point. Both share the kept
+    messages with the original instead of copying them (see history.py).
+    """
+    messages = st.session_state.messages
+    if not isinstance(messages, ConversationHistory):
+        messages = ConversationHistory(messages)
+    chat_system = st.session_state.chat_system
+    # The history holds every displayed message except deadline fallbacks,
+    # after the system prompt and the hidden opening prompt
+    shown = sum(1 for m in messages if not m.get("fallback"))
+    kept = sum(1 for m in messages[:keep] if not m.get("fallback"))
+    hidden = len(chat_system.conversation_history) - shown
+    
+    st.session_state.message_branches[chat_system.active_branch] = messages
+    name = chat_system.branch(keep=hidden + kept)
+    st.session_state.message_branches[name] = messages.fork(keep)
+    show_branch(name)
+
+
+def show_branch(name):
+    """Switch the chat (messages and persona history) to another branch."""
+    st.session_state.message_branches.setdefault(st.session_state.chat_system.active_branch, st.session_state.messages)
+    st.session_state.chat_system.switch_branch(name)
+    st.session_state.messages = st.session_state.message_branches[name]
+    # Messages shared with other branches are archived already
+    st.session_state.archived_count = len(st.session_state.messages)
+
+
+def resend_from(index, text):
+    """Branch the chat just before the user message at index and send text in its place."""
+    branch_conversation(index)
+    st.session_state.messages.append({"role": "user", "content": text})
+    send_user_message(text)
+
+
+def past_context(*setup_answers):
+    """
+    Snippets from the user's archived sessions that relate to this setup.
+    
+    Returns an empty string unless the user opted in to the archive. The
+    block is also kept for apply_phase_prompt(), which rebuilds the persona
+    description.
+    """
+    block = ''
+    if ARCHIVE is not None and st.session_state.archive_user is not None:
+        checkin = get_checkin()
+        text = " ".join([checkin.mood, checkin.sensations, checkin.attention, *map(str, setup_answers)])
+        try:
+            block = context_block(ARCHIVE.relevant_snippets(st.session_state.archive_user, text))
+        except sqlite3.Error:
+            pass
+    st.session_state.archive_context = block
+    return block
+
+
+def generate_archive_key():
+    """Fill the archive key field with a new random key (runs before the sidebar is drawn)."""
+    key = new_archive_key()
+    st.session_state.archive_key = key
+    st.session_state.archive_key_generated = key
+
+
+def archive_messages():
+    """Save the chat's new messages to the archive, if the user opted in."""
+    if ARCHIVE is None or st.session_state.archive_user is None or st.session_state.step != 'chat':
+        return
+    messages = st.session_state.messages
+    if st.session_state.archived_count > len(messages):
+        # Chat cleared: carry on in the same archived session
+        st.session_state.archived_count = 0
+    try:
+        if st.session_state.archive_session is None:
+            archive_session = uuid.uuid4().hex
+            ARCHIVE.start_session(
+                archive_session, st.session_state.archive_user,
+                st.session_state.selected_exercise, st.session_state.persona_name,
+                st.session_state.mood_rating, st.session_state.body_sensations,
+                st.session_state.attention_focus
+            )
+            st.session_state.archive_session = archive_session
+            st.session_state.archived_count = 0
+        # Deadline fallbacks and the hidden "finished" instruction are not part of the conversation
+        new = [
+            {"role": m["role"], "content": m["content"]}
+            for m in messages[st.session_state.archived_count:]
+            if not m.get("fallback") and m["content"] != FINISHED_EXERCISE_INSTRUCTION
+        ]
+        ARCHIVE.add_messages(st.session_state.archive_session, st.session_state.archive_user, new)
+        st.session_state.archived_count = len(messages)
+    except sqlite3.Error:
+        # Archiving is best-effort; the next rerun tries again
+        pass
+
+
+def start_turn(user_message, kind):
+    """Submit a turn to the worker pool; the chat step polls for the reply."""
+    record_turn(st.session_state.selected_exercise, kind)
+    apply_phase_prompt()
+    st.session_state.pending_fallback_shown = False
+    st.session_state.pending_screen = None
+    st.session_state.pending_turn = get_pool().submit_turn(
+        get_session_id(), kind, st.session_state.chat_system.turn_key(user_message),
+        get_prefetcher().chat, st.session_state.chat_system, user_message,
+        sentence_budget=early_stop.budget_for(st.session_state.selected_exercise, kind),
+        stats=CompletionStats()
+    )
+
+
+def is_duplicate_submit(user_message, kind):
+    """
+    Return True if this input was just sent, e.g. by a double click.
+    
+    Call it before handling a submit; the turn already sent answers it
+    (see CompletionPool.duplicate_of()).
+    """
+    if st.session_state.session_id is None or st.session_state.chat_system is None:
+        return False
+    key = st.session_state.chat_system.turn_key(user_message)
+    return get_pool().duplicate_of(st.session_state.session_id, kind, key) is not None
+
+
+def collect_pending_turn():
+    """Move a finished reply from the worker pool into the message list."""
+    job = st.session_state.pending_turn
+    if job is None:
+        return
+    
+    preempted = st.session_state.pending_preempt
+    if not job.done():
+        # Deadline missed: show a fallback now and keep waiting for the real reply
+        if (preempted is None and not st.session_state.pending_fallback_shown
+                and job.elapsed > deadline_for(job.kind)):
+            exercise = st.session_state.selected_exercise
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": get_fallback(exercise, job.kind),
+                "fallback": True
+            })
+            st.session_state.pending_fallback_shown = True
+            record_fallback(exercise, job.kind)
+        return
+    
+    st.session_state.pending_turn = None
+    profiler.last_llm_seconds = job.duration
+    if preempted is not None:
+        # The crisis reply is already shown; now that the cancelled call has
+        # unwound, make the history match what the user saw
+        st.session_state.pending_preempt = None
+        try:
+            job.result()
+        except Exception:
+            pass
+        st.session_state.chat_system.settle_exchange(*preempted)
+        return
+    
+    try:
+        response = job.result()
+    except CompletionCancelled:
+        return
+    except TokenBudgetExceeded:
+        # Soft stop: no more model replies in this session
+        st.session_state.messages.append({"role": "assistant", "content": BUDGET_REPLY, "fallback": True})
+        return
+    except Exception as e:
+        st.error(f"Error: {str(e)}")
+        return
+    if job.stats is None or not job.stats.prefetched:
+        # A prefetched reply was ready before it was asked for; it says nothing about load
+        get_controller().observe_latency(job.duration)
+    if early_stop.early_stop_enabled() and job.stats is not None:
+        early_stop.record(st.session_state.selected_exercise, job.kind,
+                          job.stats.stopped_early, job.stats.chunks)
+    record_event("turn", exercise=st.session_state.selected_exercise, turn_kind=job.kind,
+                 latency_ms=job.duration * 1000, fallback=st.session_state.pending_fallback_shown)
+    st.session_state.messages.append({
+        "role": "assistant",
+        "content": annotate(response, st.session_state.pending_screen)
+    })
+    get_flow().on_assistant_reply(job.kind, response)
+
+
+def apply_phase_prompt():
+    """With phased prompts, swap in the current phase's instructions before a turn."""
+    exercise = st.session_state.selected_exercise
+    if not PHASED_PROMPTS or exercise not in PHASES:
+        return
+    
+    phase = get_flow().phases.phase
+    if exercise == 'breathing':
+        persona_description, _ = build_breathing_prompts(phase)
+    else:
+        persona_description, _ = body_scan_prompts(get_checkin(), phase=phase, **st.session_state.exercise_context)
+    st.session_state.chat_system.update_persona_description(persona_description + st.session_state.archive_context)
+
+
+def get_flow():
+    """Return the tracker for this exercise's scripted decision points."""
+    flow = st.session_state.flow
+    if flow is None or flow.exercise != st.session_state.selected_exercise:
+        flow = st.session_state.flow = FlowTracker(st.session_state.selected_exercise)
+    return flow
+
+
+def send_user_message(prompt):
+    """
+    Answer scripted decision points locally; everything else goes to the LLM.
+    
+    The message is screened for crisis signals first (see safety.py; it
+    takes microseconds). A crisis gets the crisis resources, and any message
+    that raises a concern goes to the LLM: a scripted line such as "That's
+    wonderful - well done" is never the answer to distress, and the flow
+    does not move on.
+    """
+    st.session_state.user_turns += 1
+    if st.session_state.user_turns == 1:
+        record_event("chat", exercise=st.session_state.selected_exercise, turns=1)
+    
+    screening = screen(prompt) if SAFETY_SCREEN else None
+    if screening is not None and screening.level == CRISIS:
+        preempt_turn(prompt)
+        return
+    
+    local_reply = None
+    if screening is None or screening.level == NONE:
+        local_reply = get_flow().handle_user_message(prompt)
+    if local_reply is None:
+        start_turn(prompt, "chat")
+        st.session_state.pending_screen = screening
+        return
+    
+    st.session_state.chat_system.record_exchange(prompt, local_reply)
+    st.session_state.messages.append({"role": "assistant", "content": annotate(local_reply, screening)})
+
+
+def preempt_turn(prompt):
+    """Answer a crisis message with crisis resources instead of the model's reply."""
+    job = st.session_state.pending_turn
+    if job is not None:
+        job.cancel()
+        # The history is settled once the cancelled call has unwound (see collect_pending_turn())
+        st.session_state.pending_preempt = (prompt, CRISIS_REPLY)
+    else:
+        st.session_state.chat_system.record_exchange(prompt, CRISIS_REPLY)
+    st.session_state.messages.append({"role": "assistant", "content": CRISIS_REPLY, "crisis": True})
+
+
+def cancel_session_work():
+    """Cancel in-flight and prefetched requests when the session is abandoned."""
+    if st.session_state.session_id is not None:
+        get_pool().cancel_session(st.session_state.session_id)
+    st.session_state.pending_turn = None
+    st.session_state.pending_preempt = None
+    if st.session_state.prefetcher is not None:
+        st.session_state.prefetcher.invalidate()
+
+
+def request_slot():
+    """
+    Ask the admission controller for a chat slot after the check-in.
+
+    Returns:
+        True if admitted; otherwise the session waits in the queue
+    """
+    position = get_controller().request(get_session_id())
+    st.session_state.queue_position = position
+    if position is not None:
+        st.session_state.step = 'waiting_room'
+        return False
+    
+    st.session_state.admitted = True
+    st.session_state.step = 'exercise_selection'
+    prefetch_breathing_greeting()
+    return True
+
+
+def release_slot():
+    """Give this session's chat slot (or queue place) back."""
+    if st.session_state.session_id is not None:
+        get_controller().release(st.session_state.session_id)
+    st.session_state.admitted = False
+
+
+def get_prefetcher():
+    """Return this session's speculative prefetcher, creating it if needed."""
+    if st.session_state.prefetcher is None:
+        st.session_state.prefetcher = SpeculativePrefetcher()
+    return st.session_state.prefetcher
+
+
+def get_checkin():
+    """Return the check-in answers, ready to put into a prompt."""
+    return describe_checkin(
+        st.session_state.mood_rating,
+        st.session_state.body_sensations,
+        st.session_state.attention_focus
+    )
 
 
 def setup_empty_chair(who, characteristics, topic, situation):
     """Set up the Empty Chair exercise."""
     try:
         if st.session_state.chat_system is None:
-            st.session_state.chat_system = PersonaChat()
-        
-        # Get initial assessment context
-        mood_desc = get_mood_description(st.session_state.mood_rating)
-        sensations = ", ".join(st.session_state.body_sensations) if st.session_state.body_sensations else "none specified"
-        attention = st.session_state.attention_focus or "general"
+            st.session_state.chat_system = PersonaChat(client=get_shared_client(), ledger=get_token_ledger())
         
-        persona_description = f"""You are participating in an Empty Chair therapeutic exercise. You are role-playing as the user's {who}.
-
-CRITICAL: Analyze ALL context below holistically before responding. Consider how their mood, body sensations, attention focus, and the specific situation all interconnect.
-
-User's Complete Assessment:
-- Mood: {mood_desc} ({st.session_state.mood_rating}/5)
-- Body sensations: {sensations}
-- Their attention is on: {attention}
-
-Empty Chair Context:
-- Who you are: {who}
-- Your characteristics: {characteristics}
-- Topic they want to discuss: {topic}
-- Situation/Environment: {situation}
-
-IMPORTANT - Use ALL the above information to:
-1. Understand the FULL emotional landscape (mood + body + attention + topic)
-2. Recognize how their body sensations might relate to what they want to discuss
-3. Be sensitive to their mood level while staying in character
-4. Address the specific topic while being aware of their broader state
-
-Response Guidelines:
-- KEEP RESPONSES BRIEF: 2-3 sentences maximum
-- Stay in character as {who} with the described characteristics
-- Be authentic to how this person would actually respond
-- Show you understand their complete state (don't just focus on one aspect)
-- Be warm, therapeutic, and supportive while staying in character
-- Help them express what they need to express
-- Let the conversation flow naturally - don't force everything at once
-"""
+        persona_description, initial_prompt = empty_chair_prompts(get_checkin(), who, characteristics, topic, situation)
+        persona_description += past_context(who, characteristics, topic, situation)
         
         st.session_state.chat_system.set_persona_environment(who, persona_description)
         st.session_state.persona_name = who
         
-        # Generate initial greeting with full context awareness
-        initial_prompt = f"""ANALYZE ALL CONTEXT:
-- User's mood: {mood_desc} ({st.session_state.mood_rating}/5)
-- Body sensations: {sensations}
-- Attention on: {attention}
-- They want to discuss: {topic}
-- Setting: {situation}
-
-You are {who} with these characteristics: {characteristics}
-
-Consider how ALL these elements connect. Their body might be reacting to thoughts about this topic. Their mood and attention reveal what's truly important.
-
-Now, as {who}, open the conversation naturally and warmly. Acknowledge that you're here to listen. 
-CRITICAL: Keep it to 1-2 sentences maximum. Be warm but brief."""
-        
-        initial_response = st.session_state.chat_system.chat(initial_prompt)
-        st.session_state.messages = [{"role": "assistant", "content": initial_response}]
-        st.session_state.step = 'chat'
+        start_chat(initial_prompt)
         return True
     except Exception as e:
         st.error(f"Error setting up: {e}")
         return False
 
 
+def build_breathing_prompts(phase=None):
+    """Build the breathing guide's persona description and opening prompt from the check-in."""
+    if phase is None and PHASED_PROMPTS:
+        phase = initial_phase('breathing')
+    return breathing_prompts(get_checkin(), st.session_state.breathing_exercises_used, phase=phase)
+
+
+def prefetch_breathing_greeting():
+    """
+    Start generating the breathing greeting as soon as the check-in is known.
+    
+    The greeting depends only on the check-in answers, so it can be built while
+    the user is still choosing an exercise. If they pick something else, the
+    persona (and therefore the history) changes and the result is discarded.
+    """
+    if not PREFETCH_ENABLED:
+        return
+    try:
+        if st.session_state.chat_system is None:
+            st.session_state.chat_system = PersonaChat(client=get_shared_client(), ledger=get_token_ledger())
+        
+        persona_description, initial_prompt = build_breathing_prompts()
+        persona_description += past_context()
+        st.session_state.chat_system.set_persona_environment("Breathing Guide", persona_description)
+        get_prefetcher().prefetch(st.session_state.chat_system, initial_prompt,
+                                  sentence_budget=early_stop.budget_for('breathing', "greeting"))
+    except Exception:
+        # Prefetch is best-effort; the setup step will make the call itself
+        pass
+
+
 def setup_breathing_exercise():
     """Set up the Breathing Exercise."""
     try:
         if st.session_state.chat_system is None:
-            st.session_state.chat_system = PersonaChat()
-        
-        # Get initial assessment context
-        mood_desc = get_mood_description(st.session_state.mood_rating)
-        sensations = ", ".join(st.session_state.body_sensations) if st.session_state.body_sensations else "none specified"
-        attention = st.session_state.attention_focus or "general"
-        
-        persona_description = f"""You are a gentle, calming breathing exercise guide. Your role is to help the user with breathing exercises.
-
-CRITICAL: Analyze ALL context below holistically before responding. Consider how their mood, body sensations, and attention focus all interconnect to determine the BEST breathing approach.
-
-User's Complete Assessment:
-- Mood: {mood_desc} ({st.session_state.mood_rating}/5)
-- Body sensations: {sensations}
-- Their attention is on: {attention}
-
-IMPORTANT - Use ALL the above information to:
-1. Understand the FULL picture (mood + body + attention working together)
-2. Choose breathing techniques that address their COMPLETE state, not just one symptom
-3. Recognize patterns (e.g., tight chest + low mood + worry = need calming + grounding)
-4. Tailor your approach to their entire emotional-physical landscape
-
-FLOW - NEVER-ENDING CONVERSATION PREVENTION:
-This is NOT a never-ending conversation. Your role is:
-1. Provide ONE breathing exercise based on their complete state
-2. Wait for user to complete it and click "Finished Exercise" button
-3. When button is clicked, ask: "Did you complete the breathing exercise?"
-4. **If YES:**
-   - Ask "How do you feel?"
-   - Listen to their response
-   - Give ONE concluding, supportive message
-   - DONE - don't keep asking questions
-5. **If NO (they didn't complete it):**
-   - Gently ask: "That's okay. What made it difficult for you?" or "Is there a reason you weren't able to complete it?"
-   - Listen to their response with empathy
-   - Then ask: "Would you like to try a different breathing exercise that might work better for you?"
-   - If they say yes: Provide a DIFFERENT exercise (check previously used list)
-   - If they say no: Acknowledge and conclude supportively
-6. DO NOT keep asking follow-up questions after conclusion
-7. If user sends another message after conclusion, you can respond but keep it brief
-
-Response Guidelines:
-- KEEP RESPONSES BRIEF: 2-3 sentences maximum unless providing exercise instructions
-- You ONLY provide breathing exercises - this is your specialty
-- NEVER repeat the same exercise twice
-- Know many techniques: Box breathing, 4-7-8, Diaphragmatic, Alternate nostril, Pursed lip, Resonant, Lion's breath, Humming bee, etc.
-- Select techniques based on their COMPLETE state (all factors together)
-- After giving exercise and user completes it, CONCLUDE gracefully
-
-Previously used exercises: {", ".join(st.session_state.breathing_exercises_used) if st.session_state.breathing_exercises_used else "none"}
-
-CRITICAL OUTPUT FORMAT for exercises:
-When providing a breathing exercise (after initial greeting), output in this exact JSON format:
-```json
-{{
-  "exerciseName": "Name of the breathing exercise",
-  "mood": "The mood/state this exercise helps with",
-  "duration": 300,
-  "inhaleSeconds": 4,
-  "holdSeconds": 4,
-  "exhaleSeconds": 4,
-  "description": "Brief, calming description with step-by-step instructions"
-}}
-```
-
-- duration is total exercise duration in seconds (e.g., 300 for 5 minutes)
-- Always wrap JSON in ```json``` code blocks
-- You can add a short friendly message before or after the JSON (keep it 1-2 sentences)
-- After providing JSON, the user will see a "Finished Exercise" button
-"""
+            st.session_state.chat_system = PersonaChat(client=get_shared_client(), ledger=get_token_ledger())
         
+        persona_description, initial_prompt = build_breathing_prompts()
+        persona_description += past_context()
         st.session_state.chat_system.set_persona_environment("Breathing Guide", persona_description)
         st.session_state.persona_name = "Breathing Guide"
         
-        # Generate initial casual greeting with full context awareness
-        initial_prompt = f"""ANALYZE ALL CONTEXT:
-- User's mood: {mood_desc} ({st.session_state.mood_rating}/5)
-- Body sensations: {sensations}
-- Attention on: {attention}
-
-Consider how ALL these elements connect. Their body sensations might be physical manifestations of their emotional state. Their attention focus reveals what's causing stress or distraction.
-
-DO NOT start the breathing exercise yet. DO NOT output any JSON yet. 
-
-First, send a very brief (2-3 sentences max), warm, reassuring message:
-- Acknowledge you're here for them
-- Be conversational and caring
-- Keep it SHORT - no instructions yet, no JSON yet
-- Wait for their response before providing the breathing exercise"""
-        
-        initial_response = st.session_state.chat_system.chat(initial_prompt)
-
-        st.session_state.messages = [{"role": "assistant", "content": initial_response}]
-        st.session_state.step = 'chat'
+        start_chat(initial_prompt)
         return True
     except Exception as e:
         st.error(f"Error setting up: {e}")
@@ -264,106 +558,22 @@ def setup_body_scan(uncomfortable_area, body_feeling):
     """Set up the Body Scan exercise."""
     try:
         if st.session_state.chat_system is None:
-            st.session_state.chat_system = PersonaChat()
+            st.session_state.chat_system = PersonaChat(client=get_shared_client(), ledger=get_token_ledger())
         
-        # Get initial assessment context
-        mood_desc = get_mood_description(st.session_state.mood_rating)
-        sensations = ", ".join(st.session_state.body_sensations) if st.session_state.body_sensations else "none specified"
-        attention = st.session_state.attention_focus or "general"
-        
-        persona_description = f"""You are a gentle, mindful body scan guide and emotional wellness expert. Your role is to help the user understand the emotional/psychological reasons behind their physical discomfort.
-
-CRITICAL: Analyze ALL context below holistically before responding. Consider how their mood, body sensations, attention focus, uncomfortable area, and current body feeling all interconnect.
-
-User's Complete Assessment:
-- Mood: {mood_desc} ({st.session_state.mood_rating}/5)
-- Initial body sensations: {sensations}
-- Their attention is on: {attention}
-
-Body Scan Specific Context:
-- Uncomfortable area: {uncomfortable_area}
-- How body feels now: {body_feeling}
-
-IMPORTANT - Use ALL the above information to:
-1. See the COMPLETE picture (initial sensations + uncomfortable area + body feeling + mood + attention)
-2. Understand how their discomfort might relate to what's on their mind
-3. Notice patterns (e.g., tense shoulders + worry about work = stress manifestation)
-4. Recognize how mood affects body perception and vice versa
-5. YOU are the expert - YOU provide insights about emotional/psychological reasons
-
-FLOW - NEVER-ENDING CONVERSATION PREVENTION:
-This is NOT a never-ending conversation. Follow this EXACT structured approach:
-
-**PHASE 1: Gather ALL Incidents**
-   - "Has anything stressful happened recently?"
-   - If they mention something: "I see. Was there anything else that happened?"
-   - Continue asking: "Were there any other incidents or situations?"
-   - Keep asking variations until user clearly says "no", "that's all", "nothing else", or similar
-   - Do NOT move to next phase until user confirms there are no more incidents
-
-**PHASE 2: Ask About Emotional Impact**
-   - "Did these incidents create any emotional impact on you? Like anxiety, frustration, worry, or hurt?"
-   - Wait for their response
-
-**PHASE 3: Console the User (3-4 messages)**
-   - Message 1: Acknowledge their pain/struggle with deep empathy and validation
-   - Message 2: Normalize their feelings and reassure them it's okay to feel this way
-   - Message 3: Offer comfort and understanding about their situation
-   - Message 4 (optional): Express care and support
-   - BE WARM, CARING, and SUPPORTIVE in each message
-   - Keep each message 2-3 sentences
-
-**PHASE 4: Check How They're Feeling**
-   - "How are you feeling right now? Are you okay?"
-   - Wait for their response
-
-**PHASE 5: Provide the Psychological/Emotional Reason**
-   - NOW explain how their body is manifesting the emotional stress
-   - Connect the specific incidents they mentioned to the physical symptoms
-   - Be specific and insightful based on ALL the context
-   - Example: "The tension in your shoulders is your body's response to the anxiety from [incident]. When we experience [emotion], our bodies often hold it in [area]."
-
-**PHASE 6: Conclude Naturally**
-   - Don't keep asking more questions
-   - User can continue chatting if they want, but you've given the core insight
-
-Response Guidelines:
-- KEEP RESPONSES BRIEF: 2-3 sentences maximum per message
-- Be gentle, calming, and non-judgmental
-- YOU are the expert - provide insights, don't just ask questions
-- DO NOT ask "What do you think the reason is?" - YOU tell them the reason
-- Pay special attention to the uncomfortable area they mentioned
-- Connect everything: mood + sensations + attention + incidents + emotions + physical pain
-"""
+        st.session_state.exercise_context = {
+            "uncomfortable_area": uncomfortable_area,
+            "body_feeling": body_feeling
+        }
+        persona_description, initial_prompt = body_scan_prompts(
+            get_checkin(), phase=initial_phase('body_scan') if PHASED_PROMPTS else None,
+            **st.session_state.exercise_context
+        )
+        persona_description += past_context(uncomfortable_area, body_feeling)
         
         st.session_state.chat_system.set_persona_environment("Body Scan Guide", persona_description)
         st.session_state.persona_name = "Body Scan Guide"
         
-        # Generate initial casual, reassuring message with full context awareness
-        initial_prompt = f"""ANALYZE ALL CONTEXT:
-- User's mood: {mood_desc} ({st.session_state.mood_rating}/5)
-- Initial sensations: {sensations}
-- Attention on: {attention}
-- Uncomfortable area: {uncomfortable_area}
-- Body feeling: {body_feeling}
-
-Consider how ALL these connect. The uncomfortable area might relate to what's on their mind. Their body sensations and mood are interconnected. See the FULL picture.
-
-Send a very brief (2-3 sentences max), warm, reassuring message:
-- Be conversational and caring
-- Acknowledge their discomfort with empathy
-- Show you understand and will help them explore what's happening
-- Keep it SHORT and comforting
-- Then you'll start asking about incidents in the next exchange"""
-        
-        initial_response = st.session_state.chat_system.chat(initial_prompt)
-        st.session_state.messages = [{"role": "assistant", "content": initial_response}]
-        st.session_state.step = 'chat'
-        return True
-    except Exception as e:
-        st.error(f"Error setting up: {e}")
-        return False
-        st.session_state.step = 'chat'
+        start_chat(initial_prompt)
         return True
     except Exception as e:
         st.error(f"Error setting up: {e}")
@@ -374,80 +584,37 @@ def setup_reflection_exercise(feeling_moment, body_feeling, mind_content):
     """Set up the Reflection Exercise."""
     try:
         if st.session_state.chat_system is None:
-            st.session_state.chat_system = PersonaChat()
-        
-        # Get initial assessment context
-        mood_desc = get_mood_description(st.session_state.mood_rating)
-        sensations = ", ".join(st.session_state.body_sensations) if st.session_state.body_sensations else "none specified"
-        attention = st.session_state.attention_focus or "general"
+            st.session_state.chat_system = PersonaChat(client=get_shared_client(), ledger=get_token_ledger())
         
-        persona_description = f"""You are a compassionate reflection guide and active listener. Your role is to help the user reflect on their thoughts and feelings through gentle inquiry and validation.
-
-CRITICAL: Analyze ALL context below holistically before responding. Consider how EVERYTHING interconnects - their mood, initial body sensations, attention focus, current feelings, body state, and thoughts.
-
-User's Complete Assessment:
-- Mood rating: {mood_desc} ({st.session_state.mood_rating}/5)
-- Initial body sensations: {sensations}
-- Attention is on: {attention}
-
-Reflection Responses:
-- Feeling at this moment: {feeling_moment}
-- Body feeling now: {body_feeling}
-- What's on their mind: {mind_content}
-
-IMPORTANT - Use ALL the above information to:
-1. See the COMPLETE picture (how mood, body, attention, feelings, and thoughts all connect)
-2. Notice patterns and connections (e.g., anxious feelings + tight chest + worried thoughts = stress cycle)
-3. Understand how their current feelings relate to what's on their mind
-4. Recognize how their body is responding to their emotional/mental state
-5. Help them discover insights by connecting all these elements
-
-Response Guidelines:
-- KEEP RESPONSES BRIEF: 2-3 sentences maximum
-- Create a safe, non-judgmental space for reflection
-- Ask ONE thoughtful follow-up question at a time to deepen self-awareness
-- Validate their experiences and emotions
-- Help them notice connections between feelings, body, and thoughts
-- Be empathetic, warm, and genuinely curious
-- DON'T give long analyses - instead, ask questions that help THEM discover
-- Guide them to their own insights rather than telling them what to think
-- Maintain a conversational, supportive tone
-"""
+        persona_description, initial_prompt = reflection_prompts(get_checkin(), feeling_moment, body_feeling, mind_content)
+        persona_description += past_context(feeling_moment, body_feeling, mind_content)
         
         st.session_state.chat_system.set_persona_environment("Reflection Guide", persona_description)
         st.session_state.persona_name = "Reflection Guide"
         
-        # Generate initial response with full context awareness
-        initial_prompt = f"""ANALYZE ALL CONTEXT:
-- Initial mood: {mood_desc} ({st.session_state.mood_rating}/5)
-- Initial sensations: {sensations}
-- Initial attention: {attention}
-- Current feeling: {feeling_moment}
-- Body feeling: {body_feeling}
-- Mind content: {mind_content}
-
-Consider how ALL these elements interconnect. Notice:
-- How their feelings relate to what's on their mind
-- How their body is responding to their emotional state
-- Patterns between initial state and current reflection
-- The complete emotional-physical-mental landscape
-
-Now send a very brief (2-3 sentences max), warm, empathetic response:
-- Acknowledge what they've shared
-- Reflect back ONE key observation you notice in their complete state
-- Express appreciation for their openness
-- Keep it SHORT and meaningful
-- Be conversational and genuinely caring"""
-        
-        initial_response = st.session_state.chat_system.chat(initial_prompt)
-        st.session_state.messages = [{"role": "assistant", "content": initial_response}]
-        st.session_state.step = 'chat'
+        start_chat(initial_prompt)
         return True
     except Exception as e:
         st.error(f"Error setting up: {e}")
         return False
 
 
+def get_profiler():
+    """Return this session's rerun profiler (a no-op one unless profiling is on)."""
+    if not profiling_requested(st.query_params):
+        return NullProfiler()
+    if st.session_state.profiler is None:
+        st.session_state.profiler = RerunProfiler(get_session_id())
+    return st.session_state.profiler
+
+
+profiler = get_profiler()
+profiler.begin(st.session_state.step)
+
+if st.session_state.admitted:
+    get_controller().touch(get_session_id())
+
+
 # ============= UI COMPONENTS =============
 
 # App Title
@@ -455,6 +622,7 @@ st.title("🧘 Pocket AI - Mental Wellness")
 st.markdown("---")
 
 # Sidebar
+profiler.start_section("sidebar")
 with st.sidebar:
     st.header("🌟 Your Session")
     
@@ -471,13 +639,116 @@ with st.sidebar:
         if st.session_state.attention_focus:
             st.write(f"• Focus: {st.session_state.attention_focus}")
     
+    if PREFETCH_ENABLED and st.session_state.prefetcher is not None:
+        prefetcher = st.session_state.prefetcher
+        st.caption(
+            f"Prefetch hit rate: {prefetcher.hit_rate():.0%} this session "
+            f"({prefetcher.hits} used, {prefetcher.wasted} discarded) • "
+            f"{global_hit_rate():.0%} overall"
+        )
+    
+    rates = fallback_rates()
+    if rates:
+        st.caption("Fallback rate (all sessions): " + " • ".join(
+            f"{EXERCISES.get(exercise, exercise)} {rate:.0%}" for exercise, rate in rates.items()
+        ))
+    
+    if st.session_state.token_ledger is not None and st.session_state.token_ledger.requests:
+        ledger = st.session_state.token_ledger
+        text = (f"Tokens: {ledger.spent:,} ({ledger.prompt_tokens:,} prompt, {ledger.completion_tokens:,} reply) "
+                f"in {ledger.requests} requests • about ${ledger.cost():.4f}")
+        if st.session_state.chat_system is not None and st.session_state.chat_system.system_prompt:
+            next_turn = ledger.predict(list(st.session_state.chat_system.conversation_history))
+            text += f" • next message ≈ {next_turn:,}"
+        st.caption(text)
+        if ledger.budget:
+            st.progress(min(1.0, ledger.spent / ledger.budget), text=f"Session budget: {ledger.budget:,} tokens")
+    
+    if isinstance(profiler, RerunProfiler):
+        with st.expander("⏱️ Profiling", expanded=True):
+            st.caption("Timings of the last reruns (sections can overlap)")
+            if profiler.history:
+                st.table(profiler.summary())
+            if profiler.last_llm_seconds is not None:
+                st.write(f"Last LLM call: {profiler.last_llm_seconds * 1000:.0f} ms")
+            profiler.capture_cprofile = st.checkbox(
+                "Capture cProfile for this session",
+                value=profiler.capture_cprofile,
+                help=f"Writes one .prof file per rerun and keeps the newest {MAX_PROFILE_FILES}"
+            )
+            if profiler.capture_cprofile:
+                st.caption(f"Writing to `{profiler.profile_path()}`")
+    
+    if ARCHIVE is not None:
+        with st.expander("📚 Past sessions"):
+            if st.session_state.archive_user is None:
+                st.caption(
+                    "Save your sessions on this server so you can search them later, and so new "
+                    "sessions can pick up on what you talked about before. Generate a private key "
+                    "(or choose a long one), keep it somewhere safe and use the same one next time."
+                )
+                st.button("Generate a key", use_container_width=True, on_click=generate_archive_key)
+                archive_key = st.text_input("Archive key", type="password", key="archive_key")
+                if st.session_state.archive_key_generated:
+                    st.caption("Your new key (copy it now):")
+                    st.code(st.session_state.archive_key_generated, language=None)
+                if st.button("Save my sessions", use_container_width=True, disabled=not archive_key.strip()):
+                    try:
+                        st.session_state.archive_user = user_id_for(archive_key)
+                    except WeakArchiveKey as e:
+                        st.error(f"{e}. Generate a key, or choose a longer, less repetitive one.")
+                    else:
+                        st.session_state.archive_key_generated = None
+                        st.rerun()
+            else:
+                st.caption("Your sessions are being saved.")
+                query = st.text_input("Search what you wrote before", key="archive_query")
+                if query.strip():
+                    try:
+                        hits = ARCHIVE.search(st.session_state.archive_user, query)
+                    except sqlite3.Error:
+                        st.write("Search isn't available right now.")
+                    else:
+                        if not hits:
+                            st.write("No matches.")
+                        for hit in hits:
+                            when = time.strftime('%d %b %Y', time.localtime(hit.started_at))
+                            st.markdown(f"**{when}** · {EXERCISES.get(hit.exercise, hit.exercise)}  \n{hit.snippet}")
+                else:
+                    try:
+                        recent = ARCHIVE.recent_sessions(st.session_state.archive_user, limit=5)
+                    except sqlite3.Error:
+                        recent = []
+                    for past in recent:
+                        when = time.strftime('%d %b %Y', time.localtime(past['started_at']))
+                        st.write(f"• {when}: {EXERCISES.get(past['exercise'], past['exercise'])} "
+                                 f"({past['messages']} messages)")
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button("Stop saving", use_container_width=True):
+                        st.session_state.archive_user = None
+                        st.session_state.archive_session = None
+                        st.rerun()
+                with col2:
+                    if st.button("Forget my history", use_container_width=True):
+                        try:
+                            ARCHIVE.forget_user(st.session_state.archive_user)
+                        except sqlite3.Error:
+                            st.error("Your history couldn't be deleted right now. Please try again.")
+                        else:
+                            st.session_state.archive_user = None
+                            st.session_state.archive_session = None
+                            st.rerun()
+    
     st.markdown("---")
     if st.button("🔄 Start Over", use_container_width=True):
         reset_all()
         st.rerun()
+profiler.stop_section("sidebar")
 
 
 # ============= STEP 1: INITIAL ASSESSMENT =============
+profiler.start_section("step_dispatch")
 if st.session_state.step == 'initial_assessment':
     st.header("📋 Let's Check In With You")
     st.markdown("Before we begin, I'd like to understand how you're feeling right now.")
@@ -533,10 +804,26 @@ if st.session_state.step == 'initial_assessment':
                 st.session_state.mood_rating = mood
                 st.session_state.body_sensations = sensations
                 st.session_state.attention_focus = attention
-                st.session_state.step = 'exercise_selection'
+                record_event("checkin", mood_rating=mood, sensations=sensations, attention=attention)
+                request_slot()
                 st.rerun()
 
 
+# ============= WAITING ROOM (only when all chat slots are busy) =============
+elif st.session_state.step == 'waiting_room':
+    st.header("⏳ Almost There")
+    st.markdown("A lot of people are checking in right now. We'll start your session as soon as a spot opens up.")
+    
+    position = st.session_state.queue_position
+    if position is not None:
+        st.info(f"You are **#{position}** in line. This page updates automatically.")
+    
+    if st.button("← Leave the queue"):
+        release_slot()
+        st.session_state.step = 'initial_assessment'
+        st.rerun()
+
+
 # ============= STEP 2: EXERCISE SELECTION =============
 elif st.session_state.step == 'exercise_selection':
     st.header("🎯 Choose Your Exercise")
@@ -563,16 +850,14 @@ elif st.session_state.step == 'exercise_selection':
         st.markdown("#### 🪑 Empty Chair")
         st.markdown("*Talk to someone who isn't here - express what you need to say.*")
         if st.button("Choose Empty Chair", use_container_width=True, key="btn_empty"):
-            st.session_state.selected_exercise = 'empty_chair'
-            st.session_state.step = 'exercise_setup'
+            choose_exercise('empty_chair')
             st.rerun()
     
     with col2:
         st.markdown("#### 🌬️ Breathing")
         st.markdown("*Guided breathing exercises to calm your mind and body.*")
         if st.button("Choose Breathing", use_container_width=True, key="btn_breathing"):
-            st.session_state.selected_exercise = 'breathing'
-            st.session_state.step = 'exercise_setup'
+            choose_exercise('breathing')
             st.rerun()
     
     col3, col4 = st.columns(2)
@@ -581,16 +866,14 @@ elif st.session_state.step == 'exercise_selection':
         st.markdown("#### 🧘 Body Scan")
         st.markdown("*Mindful awareness of your body sensations.*")
         if st.button("Choose Body Scan", use_container_width=True, key="btn_body"):
-            st.session_state.selected_exercise = 'body_scan'
-            st.session_state.step = 'exercise_setup'
+            choose_exercise('body_scan')
             st.rerun()
     
     with col4:
         st.markdown("#### 💭 Reflection")
         st.markdown("*Explore your feelings, body, and thoughts in depth.*")
         if st.button("Choose Reflection", use_container_width=True, key="btn_reflection"):
-            st.session_state.selected_exercise = 'reflection'
-            st.session_state.step = 'exercise_setup'
+            choose_exercise('reflection')
             st.rerun()
     
     st.markdown("---")
@@ -791,103 +1074,141 @@ elif st.session_state.step == 'chat':
     if st.session_state.persona_name:
         st.caption(f"Chatting with: {st.session_state.persona_name}")
     
+    collect_pending_turn()
+    waiting_for_reply = st.session_state.pending_turn is not None
+    
     # Check if any message contains a breathing exercise (for button display)
     has_breathing_exercise = False
     latest_exercise_index = -1
-    if st.session_state.selected_exercise == 'breathing':
-        for idx, message in enumerate(st.session_state.messages):
-            if message["role"] == "assistant" and "```json" in message["content"]:
-                has_breathing_exercise = True
-                latest_exercise_index = idx
-                # Extract exercise name from JSON to track it
-                try:
-                    json_match = re.search(r'```json\s*(\{.*?\})\s*```', message["content"], re.DOTALL)
-                    if json_match:
-                        exercise_data = json.loads(json_match.group(1))
-                        exercise_name_from_json = exercise_data.get("exerciseName", "")
-                        if exercise_name_from_json and exercise_name_from_json not in st.session_state.breathing_exercises_used:
-                            st.session_state.breathing_exercises_used.append(exercise_name_from_json)
-                            # New exercise added - reset button flag so it appears again
-                            if st.session_state.show_finished_button:
-                                st.session_state.show_finished_button = False
-                except:
-                    pass
+    with profiler.section("json_scan"):
+        if st.session_state.selected_exercise == 'breathing':
+            for idx, message in enumerate(st.session_state.messages):
+                if message["role"] == "assistant" and "```json" in message["content"]:
+                    has_breathing_exercise = True
+                    latest_exercise_index = idx
+                    # Extract exercise name from JSON to track it
+                    try:
+                        json_match = re.search(r'```json\s*(\{.*?\})\s*```', message["content"], re.DOTALL)
+                        if json_match:
+                            exercise_data = json.loads(json_match.group(1))
+                            exercise_name_from_json = exercise_data.get("exerciseName", "")
+                            if exercise_name_from_json and exercise_name_from_json not in st.session_state.breathing_exercises_used:
+                                st.session_state.breathing_exercises_used.append(exercise_name_from_json)
+                                # New exercise added - reset button flag so it appears again
+                                if st.session_state.show_finished_button:
+                                    st.session_state.show_finished_button = False
+                    except:
+                        pass
     
     # Display chat messages
     chat_container = st.container()
-    with chat_container:
+    with chat_container, profiler.section("render_messages"):
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+        if waiting_for_reply and st.session_state.pending_preempt is None:
+            with st.chat_message("assistant"):
+                st.markdown("...")
+    
+    # Empty chair: retry a reply, or try saying something else, on a branch of the conversation
+    user_indexes = [i for i, m in enumerate(st.session_state.messages) if m["role"] == "user"]
+    if st.session_state.selected_exercise == 'empty_chair' and user_indexes and not waiting_for_reply:
+        branches = list(st.session_state.chat_system.branches)
+        if len(branches) > 1:
+            chosen = st.radio(
+                "Version of this conversation", branches,
+                index=branches.index(st.session_state.chat_system.active_branch), horizontal=True,
+                format_func=lambda name: "Original" if name == MAIN_BRANCH else name.capitalize()
+            )
+            if chosen != st.session_state.chat_system.active_branch:
+                show_branch(chosen)
+                st.rerun()
+        
+        last_user = user_indexes[-1]
+        if st.button("🔁 Try another reply", use_container_width=True,
+                     disabled=st.session_state.messages[-1]["role"] != "assistant"):
+            resend_from(last_user, st.session_state.messages[last_user]["content"])
+            st.rerun()
+        with st.expander("✏️ What if I'd said something else?"):
+            said = st.selectbox(
+                "Instead of", user_indexes, index=len(user_indexes) - 1,
+                format_func=lambda i, messages=st.session_state.messages: messages[i]["content"][:60]
+            )
+            instead = st.text_area("I'd say", key="what_if_text")
+            if st.button("Try it", disabled=not instead.strip(), key="what_if_send"):
+                resend_from(said, instead.strip())
+                st.rerun()
     
     # Show "Finished Exercise" button for breathing exercise
     # Button appears when exercise is given, disappears after user clicks it (marked by show_finished_button)
-    if st.session_state.selected_exercise == 'breathing' and has_breathing_exercise and not st.session_state.show_finished_button:
+    if (st.session_state.selected_exercise == 'breathing' and has_breathing_exercise
+            and not st.session_state.show_finished_button and not waiting_for_reply):
+        # The follow-up is fixed, so build it while the user is breathing
+        if PREFETCH_ENABLED:
+            apply_phase_prompt()
+            get_prefetcher().prefetch(st.session_state.chat_system, FINISHED_EXERCISE_INSTRUCTION,
+                                      sentence_budget=early_stop.budget_for('breathing', "finished_exercise"))
+        
         st.markdown("---")
-        if st.button("✅ Finished Exercise", type="primary", use_container_width=True, key="finished_breathing"):
+        if (st.button("✅ Finished Exercise", type="primary", use_container_width=True, key="finished_breathing")
+                and not is_duplicate_submit(FINISHED_EXERCISE_INSTRUCTION, "finished_exercise")):
             # User clicked the button - add a system instruction instead of direct question
             # This tells the AI to ask, rather than us asking directly
-            system_instruction = "[SYSTEM: User clicked 'Finished Exercise' button. Ask them if they completed the breathing exercise.]"
+            system_instruction = FINISHED_EXERCISE_INSTRUCTION
             st.session_state.messages.append({"role": "user", "content": system_instruction})
+            st.session_state.show_finished_button = True  # Hide button after click
+            record_finished()
             
             # Get AI to ask the question
-            with st.spinner("..."):
-                try:
-                    response = st.session_state.chat_system.chat(system_instruction)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                    st.session_state.show_finished_button = True  # Hide button after click
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
-    
-    # Chat input
-    if prompt := st.chat_input("Type your message..."):
+            start_turn(system_instruction, "finished_exercise")
+            st.rerun()
+    
+    # Chat input (disabled until the pending reply arrives)
+    prompt = st.chat_input("Type your message...", disabled=waiting_for_reply)
+    if prompt and not is_duplicate_submit(prompt, "chat"):
         # Add user message
         st.session_state.messages.append({"role": "user", "content": prompt})
         
-        with st.chat_message("user"):
-            st.markdown(prompt)
-        
-        # Get AI response
-        with st.chat_message("assistant"):
-            with st.spinner("..."):
-                try:
-                    response = st.session_state.chat_system.chat(prompt)
-                    st.markdown(response)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                    
-                    # Check if new exercise was provided in breathing module
-                    if (st.session_state.selected_exercise == 'breathing' and 
-                        "```json" in response):
-                        st.rerun()
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
+        # Get AI response in the background; the reply is picked up on a later rerun
+        send_user_message(prompt)
+        st.rerun()
     
     # Action buttons
     st.markdown("---")
     col1, col2, col3 = st.columns(3)
     with col1:
         if st.button("🗑️ Clear Chat", use_container_width=True):
+            cancel_session_work()
             if st.session_state.chat_system:
                 st.session_state.chat_system.reset_conversation()
             st.session_state.messages = []
+            st.session_state.message_branches = {}
             st.session_state.breathing_exercises_used = []
             st.session_state.show_finished_button = False
+            st.session_state.flow = None
             st.rerun()
     with col2:
         if st.button("🔄 Change Exercise", use_container_width=True):
+            if st.session_state.user_turns:
+                record_finished()
+            cancel_session_work()
             st.session_state.step = 'exercise_selection'
             st.session_state.messages = []
             st.session_state.chat_system = None
             st.session_state.breathing_exercises_used = []
             st.session_state.show_finished_button = False
+            st.session_state.flow = None
             st.rerun()
     with col3:
         if st.button("🏠 Start Over", use_container_width=True):
+            if st.session_state.user_turns:
+                record_finished()
             reset_all()
             st.rerun()
 
 
+profiler.stop_section("step_dispatch")
+
 # Footer
 st.markdown("---")
 st.markdown(
@@ -897,3 +1218,22 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# Save what this run added to the chat before waiting for the next reply
+archive_messages()
+
+# Poll the worker pool until the pending reply arrives. Buttons above stay
+# clickable: a click interrupts this run and triggers a fresh one.
+if st.session_state.pending_turn is not None:
+    get_pool().touch(get_session_id())
+    with profiler.section("llm_wait"):
+        time.sleep(POLL_INTERVAL_SECONDS)
+    st.rerun()
+
+# Queued sessions keep asking for a slot; request_slot() moves them on once admitted
+if st.session_state.step == 'waiting_room':
+    time.sleep(WAITING_ROOM_POLL_SECONDS)
+    request_slot()
+    st.rerun()
+
+profiler.end()
+
@@ -0,0 +1,349 @@
+"""
+Opt-in archive of past sessions, with full-text search.
+
+Everything in st.session_state is lost when the user starts over or closes
+the tab. Users who opt in (sidebar, "Past sessions") get every exercise they
+do saved to a local SQLite database. They can search what they wrote before,
+and a new session can start with a few relevant snippets from earlier ones
+in its context.
+
+A user is identified only by a private archive key: one the app generates
+for them, or one they choose that is at least MIN_KEY_LENGTH characters and
+not repetitive. The database stores an HMAC-SHA256 of the key, keyed with
+the server secret POCKET_AI_ARCHIVE_SECRET, never the key itself; without
+the secret, the stored ids cannot be checked against guessed keys. The user
+can delete their whole archive at any time.
+
+Schema:
+    sessions       one row per exercise: user, start time, exercise,
+                   persona_name, mood_rating, sensations, attention
+    messages       the conversation, one row per message
+    messages_fts   FTS5 index over message content. It also indexes the
+                   user id, so a search only walks that user's postings
+                   instead of filtering every match in the database.
+                   Triggers keep it in sync with messages.
+
+Searches stay in the millisecond range at hundreds of thousands of messages
+(see bench_archive.py). Three choices make that possible:
+- the user-id term narrows each query to a few hundred rows
+- hits come back newest first (ORDER BY rowid) rather than by bm25, which
+  would count every document that contains each term
+- search words are whole (stemmed) words rather than prefixes, which would
+  expand to many terms
+Context snippets are re-ranked in Python, and only among the user's newest
+matches.
+
+The archive is off unless POCKET_AI_ARCHIVE_DB names the database file and
+POCKET_AI_ARCHIVE_SECRET is set; without the secret it stays disabled.
+"""
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import metrics
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    exercise TEXT,
+    persona_name TEXT,
+    mood_rating INTEGER,
+    sensations TEXT,
+    attention TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user_id, started_at);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    content, user_id, content='messages', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content, user_id) VALUES (new.id, new.content, new.user_id);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content, user_id)
+    VALUES ('delete', old.id, old.content, old.user_id);
+END;
+"""
+
+# Words too common to help find a relevant past session
+_STOPWORDS = {
+    "a", "about", "after", "again", "all", "also", "am", "an", "and", "any", "are", "as", "at", "be",
+    "been", "but", "by", "can", "could", "did", "do", "feel", "feeling", "for", "from", "get", "had",
+    "has", "have", "i", "i'm", "if", "in", "into", "is", "it", "just", "like", "me", "more", "my",
+    "myself", "need", "not", "of", "on", "or", "so", "some", "that", "the", "them", "then", "there",
+    "they", "this", "to", "too", "up", "very", "want", "was", "we", "were", "what", "when", "with",
+    "would", "you", "your",
+}
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Past snippets added to a new session's context, chosen among this many newest matches
+CONTEXT_SNIPPETS = 3
+CONTEXT_CANDIDATES = 50
+
+# A chosen archive key needs this many characters, and this many different ones
+MIN_KEY_LENGTH = 16
+MIN_KEY_CHARACTERS = 8
+
+
+class SearchHit(NamedTuple):
+    session_id: str
+    started_at: float
+    exercise: str
+    persona_name: str
+    role: str
+    snippet: str
+
+
+class WeakArchiveKey(ValueError):
+    """Raised for an archive key that would be easy to guess."""
+
+
+def new_archive_key() -> str:
+    """A random archive key to offer the user (144 bits)."""
+    return secrets.token_urlsafe(18)
+
+
+def check_archive_key(archive_key: str):
+    """
+    Reject archive keys that another user could pick or guess.
+
+    Raises:
+        WeakArchiveKey: If the key is too short or too repetitive
+    """
+    key = archive_key.strip()
+    if len(key) < MIN_KEY_LENGTH:
+        raise WeakArchiveKey(f"An archive key needs at least {MIN_KEY_LENGTH} characters")
+    if len(set(key)) < MIN_KEY_CHARACTERS:
+        raise WeakArchiveKey(f"An archive key needs at least {MIN_KEY_CHARACTERS} different characters")
+
+
+def user_id_for(archive_key: str) -> str:
+    """
+    Derive the stored user id from the user's private archive key.
+
+    Raises:
+        WeakArchiveKey: If the key is too short or too repetitive
+        RuntimeError: If POCKET_AI_ARCHIVE_SECRET is not set
+    """
+    check_archive_key(archive_key)
+    secret = os.getenv("POCKET_AI_ARCHIVE_SECRET")
+    if not secret:
+        raise RuntimeError("POCKET_AI_ARCHIVE_SECRET is not set")
+    return hmac.new(secret.encode("utf-8"), archive_key.strip().encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def _search_query(text: str) -> Optional[str]:
+    """Turn what the user typed into an FTS5 query that needs every word."""
+    words = _words(text)
+    if not words:
+        return None
+    return " ".join(f'"{w}"' for w in words)
+
+
+def _keywords(text: str) -> List[str]:
+    """The meaningful words of a new session's setup."""
+    return list(dict.fromkeys(w for w in _words(text) if w not in _STOPWORDS and len(w) > 2))[:20]
+
+
+def _overlap(keywords: List[str], content: str) -> int:
+    """How many keywords a message mentions (matching on a word's first letters, like a stem)."""
+    words = _words(content)
+    return sum(1 for k in keywords if any(w.startswith(k[:max(4, len(k) - 2)]) for w in words))
+
+
+class SessionArchive:
+    """
+    Process-wide archive backed by one SQLite database.
+
+    Streamlit sessions are threads of one process, so they share a single
+    connection guarded by a lock. WAL mode keeps writes cheap.
+
+    Args:
+        path: Database file (created if missing)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+
+    def start_session(self, session_id: str, user_id: str, exercise: str, persona_name: str,
+                      mood_rating: int, sensations: List[str], attention: str):
+        """
+        Record the start of an exercise.
+
+        Args:
+            session_id: Id of this exercise run (messages refer to it)
+            user_id: From user_id_for()
+            exercise, persona_name, mood_rating, sensations, attention: Session metadata
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, user_id, time.time(), exercise, persona_name, mood_rating,
+                 json.dumps(sensations), attention)
+            )
+
+    def add_messages(self, session_id: str, user_id: str, messages: List[Dict[str, str]]):
+        """Append messages (dicts with "role" and "content") to an archived session."""
+        if not messages:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO messages (session_id, user_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, user_id, m["role"], m["content"], now) for m in messages]
+            )
+        metrics.incr("archive.messages", len(messages))
+
+    def search(self, user_id: str, text: str, limit: int = 10, role: Optional[str] = None) -> List[SearchHit]:
+        """
+        Full-text search of one user's archived messages.
+
+        Args:
+            user_id: From user_id_for()
+            text: What the user typed; every word must appear (stemmed, so "meetings" finds "meeting")
+            limit: Maximum number of hits
+            role: Only search "user" or "assistant" messages
+
+        Returns:
+            Newest matches first, each with a highlighted snippet
+        """
+        return [hit for hit, _ in self._query(user_id, _search_query(text), limit, role)]
+
+    def relevant_snippets(self, user_id: str, text: str, limit: int = CONTEXT_SNIPPETS) -> List[SearchHit]:
+        """
+        What the user wrote in past sessions that best matches a new session's setup.
+
+        Args:
+            user_id: From user_id_for()
+            text: The new session's check-in and setup answers
+            limit: Maximum number of snippets
+        """
+        keywords = _keywords(text)
+        if not keywords:
+            return []
+        match = " OR ".join(f'"{k}"' for k in keywords)
+        candidates = self._query(user_id, match, CONTEXT_CANDIDATES, role="user")
+        # Most keywords first; candidates are newest first, and sorted() keeps that order on ties
+        ranked = sorted(candidates, key=lambda c: -_overlap(keywords, c[1]))
+        return [hit for hit, _ in ranked[:limit]]
+
+    def recent_sessions(self, user_id: str, limit: int = 10) -> List[Dict]:
+        """The user's latest sessions with their message counts, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.id, s.started_at, s.exercise, s.persona_name, s.mood_rating, "
+                "(SELECT count(*) FROM messages m WHERE m.session_id = s.id) "
+                "FROM sessions s WHERE s.user_id = ? ORDER BY s.started_at DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        return [dict(zip(("session_id", "started_at", "exercise", "persona_name", "mood_rating", "messages"), row))
+                for row in rows]
+
+    def forget_user(self, user_id: str) -> int:
+        """
+        Delete a user's whole archive.
+
+        Returns:
+            Number of sessions deleted
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+            deleted = self._conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,)).rowcount
+        metrics.incr("archive.forgotten")
+        return deleted
+
+    def _query(self, user_id: str, match: Optional[str], limit: int,
+               role: Optional[str]) -> List[Tuple[SearchHit, str]]:
+        """Newest matching messages of one user, with their full content."""
+        if match is None:
+            return []
+        sql = (
+            "SELECT m.session_id, s.started_at, s.exercise, s.persona_name, m.role, "
+            "snippet(messages_fts, 0, '**', '**', '…', 16), m.content "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "JOIN sessions s ON s.id = m.session_id "
+            "WHERE messages_fts MATCH ? "
+        )
+        params = [f'user_id : "{user_id}" AND content : ({match})']
+        if role is not None:
+            sql += "AND m.role = ? "
+            params.append(role)
+        sql += "ORDER BY messages_fts.rowid DESC LIMIT ?"
+        params.append(limit)
+
+        started = time.perf_counter()
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        metrics.incr("archive.searches")
+        metrics.incr("archive.search_us", int((time.perf_counter() - started) * 1e6))
+        return [(SearchHit(*row[:6]), row[6]) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def context_block(hits: List[SearchHit]) -> str:
+    """Text appended to a persona description so the model knows relevant history."""
+    if not hits:
+        return ""
+    lines = [f"- {time.strftime('%Y-%m-%d', time.localtime(h.started_at))} ({h.exercise}): "
+             f"{h.snippet.replace('**', '')}" for h in hits]
+    return (
+        "\n\nFROM THE USER'S PAST SESSIONS (things they wrote before; refer to them only "
+        "if relevant, gently, and never invent details beyond them):\n" + "\n".join(lines)
+    )
+
+
+_archive: Optional[SessionArchive] = None
+_archive_lock = threading.Lock()
+_warned_no_secret = False
+
+
+def get_archive() -> Optional[SessionArchive]:
+    """Return the process-wide archive, or None unless POCKET_AI_ARCHIVE_DB and POCKET_AI_ARCHIVE_SECRET are set."""
+    global _archive, _warned_no_secret
+    path = os.getenv("POCKET_AI_ARCHIVE_DB")
+    if not path:
+        return None
+    with _archive_lock:
+        if _archive is None:
+            if not os.getenv("POCKET_AI_ARCHIVE_SECRET"):
+                if not _warned_no_secret:
+                    print("POCKET_AI_ARCHIVE_DB is set but POCKET_AI_ARCHIVE_SECRET is not; "
+                          "the archive is disabled", file=sys.stderr)
+                    _warned_no_secret = True
+                return None
+            _archive = SessionArchive(path)
+        return _archive
@@ -0,0 +1,307 @@
+"""
+Completion backends with model mapping, health-checked failover and
+latency-aware routing.
+
+By default PersonaChat talks to the hosted OpenAI API. Latency- and
+privacy-sensitive deployments can instead point it at a co-located
+OpenAI-compatible inference server (llama.cpp server, vLLM, Ollama, ...),
+or at several backends with failover between them.
+
+Selected with POCKET_AI_BACKEND (see build_client() in script.py):
+
+    local    one OpenAI-compatible server
+                 POCKET_AI_BASE_URL      e.g. http://127.0.0.1:8080/v1
+                 POCKET_AI_LOCAL_MODEL   model it serves in place of gpt-4o-mini
+                 POCKET_AI_LOCAL_API_KEY if the server wants one
+    routed   several backends, listed in POCKET_AI_BACKENDS (a JSON file
+             path or inline JSON):
+
+        [
+          {"name": "local", "base_url": "http://127.0.0.1:8080/v1",
+           "models": {"gpt-4o-mini": "qwen2.5-3b-instruct"}, "timeout": 30},
+          {"name": "openai"}
+        ]
+
+        name         label for metrics and /health
+        base_url     omit for the hosted OpenAI API
+        models       requested model -> model the backend serves ("*" for any)
+        api_key_env  variable holding the key (default OPENAI_API_KEY for
+                     the hosted API; local servers get a placeholder)
+        timeout      seconds per request (default POCKET_AI_REQUEST_TIMEOUT)
+
+Routing (POCKET_AI_ROUTING):
+    fastest  (default) healthy backends in order of their recent latency
+    ordered  healthy backends in the order listed, e.g. to keep traffic on
+             the local server and only fail over to the hosted API
+
+Latency is a moving average per backend, kept apart for streamed requests
+(time to the first chunk) and plain ones (time to the full reply).
+A small share of requests goes to another healthy backend, so a backend
+that got faster is noticed.
+
+A backend is marked down when a request fails with a connection error, a
+timeout, a 5xx or a 429. The request then fails over to the next backend
+at once. A background thread checks every backend (GET /models) every
+POCKET_AI_HEALTH_SECONDS (default 10) and brings recovered ones back. If
+every backend is down, they are still tried, in order, and any backend that
+answers a request is marked up again (with a single backend, e.g.
+POCKET_AI_BACKEND=local, that is the only way back). Streams fail over
+only before the first chunk, so a reply is never stitched together from
+two models.
+"""
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import metrics
+
+# Weight of the newest sample in the latency moving averages
+LATENCY_ALPHA = 0.2
+
+# Share of requests routed to a healthy backend other than the fastest
+EXPLORE_RATE = 0.05
+
+HEALTH_SECONDS = float(os.getenv("POCKET_AI_HEALTH_SECONDS", "10"))
+
+
+class Backend:
+    """
+    One completion backend and what is known about it.
+
+    Args:
+        name: Label for metrics and reports
+        client: Object exposing chat.completions.create() (and, for health
+            checks, models.list())
+        models: Requested model -> model this backend serves; "*" maps any
+        base_url: Where the backend lives (for reports only)
+    """
+
+    def __init__(self, name: str, client, models: Optional[Dict[str, str]] = None,
+                 base_url: Optional[str] = None):
+        self.name = name
+        self.client = client
+        self.models = models or {}
+        self.base_url = base_url
+        self.healthy = True
+        self.last_error: Optional[str] = None
+        self.requests = 0
+        self.failures = 0
+        # Moving average seconds, for plain (False) and streamed (True) requests
+        self.latency: Dict[bool, Optional[float]] = {False: None, True: None}
+
+    def model_for(self, model: str) -> str:
+        """The model name to send this backend for a requested model."""
+        return self.models.get(model, self.models.get("*", model))
+
+    def observe(self, seconds: float, stream: bool):
+        previous = self.latency[stream]
+        self.latency[stream] = seconds if previous is None else previous + LATENCY_ALPHA * (seconds - previous)
+
+    def report(self) -> dict:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ms": {kind: None if self.latency[stream] is None else round(self.latency[stream] * 1000, 1)
+                           for kind, stream in (("reply", False), ("first_chunk", True))},
+            "last_error": self.last_error,
+        }
+
+
+def should_fail_over(error: Exception) -> bool:
+    """True for errors another backend might not have: unreachable, overloaded or broken."""
+    try:
+        import openai
+    except ImportError:
+        openai = None
+    if openai is not None:
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class _TimedStream:
+    """Passes a stream through and reports the time to its first chunk."""
+
+    def __init__(self, stream, started: float, on_first_chunk):
+        self._stream = stream
+        self._started = started
+        self._on_first_chunk = on_first_chunk
+
+    def __iter__(self):
+        first = True
+        for chunk in self._stream:
+            if first:
+                first = False
+                self._on_first_chunk(time.perf_counter() - self._started)
+            yield chunk
+
+    def close(self):
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            close()
+
+
+class _RoutedCompletions:
+    def __init__(self, router: "RoutingClient"):
+        self._router = router
+
+    def create(self, **kwargs):
+        return self._router.create(**kwargs)
+
+
+class RoutingClient:
+    """
+    Drop-in completion client that spreads requests over several backends.
+
+    Args:
+        backends: Backends in preference order
+        routing: "fastest" or "ordered" (see the module docstring)
+        health_interval: Seconds between health checks; 0 disables the checker
+    """
+
+    def __init__(self, backends: List[Backend], routing: str = "fastest",
+                 health_interval: float = HEALTH_SECONDS):
+        if not backends:
+            raise ValueError("At least one backend is needed")
+        if routing not in ("fastest", "ordered"):
+            raise ValueError(f"Unknown routing {routing!r}; use 'fastest' or 'ordered'")
+        self.backends = backends
+        self.routing = routing
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self.chat = SimpleNamespace(completions=_RoutedCompletions(self))
+        # warmup.ping() calls models.retrieve(); warm every backend's connection
+        self.models = SimpleNamespace(retrieve=lambda model: self.check_health())
+        if health_interval > 0 and len(backends) > 1:
+            threading.Thread(target=self._health_loop, args=(health_interval,),
+                             name="backend-health", daemon=True).start()
+
+    def candidates(self, stream: bool = False) -> List[Backend]:
+        """Backends in the order the next request would try them."""
+        with self._lock:
+            healthy = [b for b in self.backends if b.healthy]
+            down = [b for b in self.backends if not b.healthy]
+            if self.routing == "fastest" and len(healthy) > 1:
+                # Unmeasured backends first, so each gets measured
+                healthy.sort(key=lambda b: -1.0 if b.latency[stream] is None else b.latency[stream])
+                if self._random.random() < EXPLORE_RATE:
+                    i = self._random.randrange(1, len(healthy))
+                    healthy.insert(0, healthy.pop(i))
+        return healthy + down
+
+    def create(self, **kwargs):
+        """chat.completions.create() on the best backend, failing over to the next ones."""
+        stream = bool(kwargs.get("stream"))
+        requested = kwargs.get("model")
+        last_error = None
+        for attempt, backend in enumerate(self.candidates(stream)):
+            if attempt:
+                metrics.incr("backends.failovers")
+            started = time.perf_counter()
+            try:
+                response = backend.client.chat.completions.create(**{**kwargs, "model": backend.model_for(requested)})
+            except Exception as e:
+                if not should_fail_over(e):
+                    raise
+                self._mark_down(backend, e)
+                last_error = e
+                continue
+            with self._lock:
+                backend.requests += 1
+            metrics.incr(f"backends.{backend.name}.requests")
+            # A backend that answers is up again, with or without a health checker
+            self._mark_up(backend)
+            if stream:
+                return _TimedStream(response, started, lambda seconds, b=backend: self._observe(b, seconds, True))
+            self._observe(backend, time.perf_counter() - started, False)
+            return response
+        raise last_error
+
+    def check_health(self) -> Dict[str, bool]:
+        """Check every backend now; returns which ones are healthy."""
+        for backend in self.backends:
+            models = getattr(backend.client, "models", None)
+            if models is None:
+                continue
+            try:
+                models.list()
+            except Exception as e:
+                self._mark_down(backend, e)
+            else:
+                self._mark_up(backend)
+        return {b.name: b.healthy for b in self.backends}
+
+    def report(self) -> List[dict]:
+        """State, request counts and latency of every backend."""
+        with self._lock:
+            return [b.report() for b in self.backends]
+
+    def _observe(self, backend: Backend, seconds: float, stream: bool):
+        with self._lock:
+            backend.observe(seconds, stream)
+
+    def _mark_up(self, backend: Backend):
+        with self._lock:
+            recovered, backend.healthy = not backend.healthy, True
+        if recovered:
+            metrics.incr(f"backends.{backend.name}.recovered")
+
+    def _mark_down(self, backend: Backend, error: Exception):
+        with self._lock:
+            backend.healthy = False
+            backend.failures += 1
+            backend.last_error = f"{type(error).__name__}: {error}"[:200]
+        metrics.incr(f"backends.{backend.name}.failures")
+
+    def _health_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            self.check_health()
+
+
+def _openai_backend(name: str, base_url: Optional[str], api_key: Optional[str],
+                    models: Optional[Dict[str, str]], timeout: float) -> Backend:
+    from openai import OpenAI
+    # No client-side retries: a failing backend should fail over, not back off
+    client = OpenAI(base_url=base_url, api_key=api_key, timeout=timeout, max_retries=0)
+    return Backend(name, client, models, base_url or "https://api.openai.com/v1")
+
+
+def _load_config(value: str) -> List[dict]:
+    if value.lstrip().startswith("["):
+        return json.loads(value)
+    with open(value, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def local_client(timeout: float) -> RoutingClient:
+    """The client for POCKET_AI_BACKEND=local: one OpenAI-compatible server."""
+    model = os.getenv("POCKET_AI_LOCAL_MODEL")
+    backend = _openai_backend(
+        "local", os.getenv("POCKET_AI_BASE_URL", "http://127.0.0.1:8080/v1"),
+        os.getenv("POCKET_AI_LOCAL_API_KEY", "not-needed"), {"*": model} if model else None, timeout
+    )
+    return RoutingClient([backend], routing="ordered", health_interval=0)
+
+
+def routed_client(timeout: float) -> RoutingClient:
+    """The client for POCKET_AI_BACKEND=routed, built from POCKET_AI_BACKENDS."""
+    backends = []
+    for i, entry in enumerate(_load_config(os.environ["POCKET_AI_BACKENDS"])):
+        base_url = entry.get("base_url")
+        key_env = entry.get("api_key_env", "OPENAI_API_KEY" if base_url is None else None)
+        api_key = os.getenv(key_env) if key_env else "not-needed"
+        backends.append(_openai_backend(
+            entry.get("name", f"backend{i}"), base_url, api_key, entry.get("models"),
+            float(entry.get("timeout", timeout))
+        ))
+    return RoutingClient(backends, routing=os.getenv("POCKET_AI_ROUTING", "fastest"))
@@ -0,0 +1,205 @@
+"""
+Offline batch runner for scripted persona conversations.
+
+Each scenario is one JSON line with a persona and a list of user turns:
+
+    {"id": "dad-01", "persona_name": "father",
+     "persona_description": "Wise, supportive, uses dad jokes",
+     "turns": ["Hey dad", "I got the job!"]}
+
+Scenarios run concurrently on a bounded thread pool (one PersonaChat per
+scenario, built with create_persona_session, all sharing one client and so
+one connection pool). One result line per scenario is
+appended to the output file as soon as it finishes, with every reply, its
+token usage and its latency. Re-running with --resume skips scenarios that
+already finished successfully, so an interrupted run picks up where it left off.
+
+Usage:
+    python batch_runner.py scenarios.jsonl -o results.jsonl --concurrency 8
+    python batch_runner.py scenarios.jsonl -o results.jsonl --resume
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Set
+
+from script import CompletionStats, build_client, create_persona_session
+
+
+def load_scenarios(path: str) -> List[Dict]:
+    """
+    Read scenarios from a JSONL file.
+
+    Args:
+        path: Path to the scenarios file
+
+    Returns:
+        List of scenario dicts (blank lines are skipped)
+    """
+    scenarios = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            scenario = json.loads(line)
+            missing = [key for key in ("id", "persona_name", "persona_description", "turns") if key not in scenario]
+            if missing:
+                raise ValueError(f"{path}:{line_number}: scenario is missing {', '.join(missing)}")
+            scenarios.append(scenario)
+    return scenarios
+
+
+def load_completed_ids(path: str) -> Set[str]:
+    """Return ids of scenarios that already finished successfully in an output file."""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run
+                continue
+            if result.get("status") == "ok":
+                completed.add(result["id"])
+    return completed
+
+
+def run_scenario(scenario: Dict, api_key: str = None, client=None) -> Dict:
+    """
+    Play one scripted conversation and collect replies, token usage and latencies.
+
+    Args:
+        scenario: Scenario dict (id, persona_name, persona_description, turns)
+        api_key: Optional OpenAI API key
+        client: Client shared by the batch's scenarios; if None, one is built
+
+    Returns:
+        Result dict ready to be written as one JSON line
+    """
+    started = time.perf_counter()
+    result = {"id": scenario["id"], "status": "ok", "turns": [], "error": None}
+    totals = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+    try:
+        chat = create_persona_session(
+            scenario["persona_name"], scenario["persona_description"], api_key=api_key, verbose=False,
+            client=client
+        )
+        for user_message in scenario["turns"]:
+            turn_started = time.perf_counter()
+            stats = CompletionStats()
+            reply = chat.chat(user_message, stats=stats)
+            usage = stats.usage or {}
+            result["turns"].append({
+                "user": user_message,
+                "reply": reply,
+                "latency_ms": round((time.perf_counter() - turn_started) * 1000, 1),
+                "usage": usage,
+            })
+            for key in totals:
+                totals[key] += usage.get(key, 0)
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["usage"] = totals
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def _end_last_line(path: str):
+    """Terminate a final line cut short by an interrupted run, so new results start on their own line."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def run_batch(scenarios: List[Dict], output_path: str, concurrency: int = 8,
+              resume: bool = False, api_key: str = None) -> Dict:
+    """
+    Run scenarios concurrently and append one result line per scenario.
+
+    Args:
+        scenarios: Scenarios to run
+        output_path: JSONL file to write results to
+        concurrency: Maximum number of scenarios in flight at once
+        resume: Skip scenarios already completed in output_path instead of overwriting it
+        api_key: Optional OpenAI API key
+
+    Returns:
+        Summary dict with counts, total tokens and latency percentiles
+    """
+    if resume:
+        completed = load_completed_ids(output_path)
+        todo = [s for s in scenarios if s["id"] not in completed]
+        _end_last_line(output_path)
+    else:
+        completed = set()
+        todo = scenarios
+        open(output_path, "w").close()
+
+    client = build_client(api_key)
+    write_lock = threading.Lock()
+    results = []
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        futures = [executor.submit(run_scenario, scenario, api_key, client) for scenario in todo]
+        for future in as_completed(futures):
+            result = future.result()
+            with write_lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+            results.append(result)
+            print(f"[{len(results)}/{len(todo)}] {result['id']}: {result['status']}", file=sys.stderr)
+
+    return summarize(results, skipped=len(completed))
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(results: List[Dict], skipped: int = 0) -> Dict:
+    """Aggregate results into counts, token totals and turn latency percentiles."""
+    turn_latencies = [turn["latency_ms"] for r in results for turn in r["turns"]]
+    return {
+        "ran": len(results),
+        "skipped": skipped,
+        "failed": sum(1 for r in results if r["status"] != "ok"),
+        "total_tokens": sum(r["usage"]["total_tokens"] for r in results),
+        "turns": len(turn_latencies),
+        "turn_latency_p50_ms": _percentile(turn_latencies, 50),
+        "turn_latency_p95_ms": _percentile(turn_latencies, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run scripted persona conversations in parallel.")
+    parser.add_argument("scenarios", help="JSONL file with one scenario per line")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL file for results")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="Scenarios in flight at once")
+    parser.add_argument("--resume", action="store_true", help="Skip scenarios already completed in the output file")
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.scenarios)
+    summary = run_batch(scenarios, args.output, concurrency=args.concurrency, resume=args.resume)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Throughput benchmark: headless HTTP API vs. the Streamlit app.
+
+Both paths run against the offline mock backend (mock_backend.py) by
+default, so the numbers show the serving overhead of each path rather than
+OpenAI latency. To benchmark real traffic shapes, record a run once with
+--record (needs OPENAI_API_KEY) and replay it with --replay (no key needed,
+recorded timing is reproduced; see cassette.py).
+
+- API path: api_server is started in-process; simulated clients create a
+  session, stream every turn over SSE and delete the session, with bounded
+  concurrency.
+- Streamlit path: app.py is driven with streamlit.testing's AppTest. Every
+  chat turn costs full script reruns, exactly as in a browser.
+
+Usage:
+    python bench_api.py --sessions 20 --turns 5 --concurrency 10
+    python bench_api.py --record bench.cassette.jsonl
+    python bench_api.py --replay bench.cassette.jsonl
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+# Default transport; main() switches to record/replay when asked
+os.environ["POCKET_AI_BACKEND"] = "mock"
+os.environ.setdefault("POCKET_AI_PREFETCH", "0")
+
+PERSONA_NAME = "mentor"
+PERSONA_DESCRIPTION = "Calm, encouraging, speaks in short practical sentences."
+TURNS = [
+    "I've been feeling stuck at work lately.",
+    "I keep putting off a hard conversation with my manager.",
+    "What if it goes badly?",
+    "Okay, I think I can try that.",
+    "Thanks for listening.",
+]
+
+
+def _turns(count: int):
+    return [TURNS[i % len(TURNS)] for i in range(count)]
+
+
+def _summary(name: str, wall: float, latencies: list, turns: int) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "path": name,
+        "turns": turns,
+        "wall_s": round(wall, 2),
+        "turns_per_s": round(turns / wall, 2) if wall else 0.0,
+        "p50_ms": round(statistics.median(ordered) * 1000, 1) if ordered else 0.0,
+        "p95_ms": round(ordered[max(0, int(len(ordered) * 0.95) - 1)] * 1000, 1) if ordered else 0.0,
+    }
+
+
+async def _api_client(http, base_url: str, turns: int, latencies: list, ttfts: list):
+    async with http.post(f"{base_url}/sessions", json={
+        "persona_name": PERSONA_NAME, "persona_description": PERSONA_DESCRIPTION
+    }) as resp:
+        session_id = (await resp.json())["session_id"]
+
+    for message in _turns(turns):
+        started = time.perf_counter()
+        first_token = None
+        async with http.post(f"{base_url}/sessions/{session_id}/stream", json={"message": message}) as resp:
+            async for line in resp.content:
+                if first_token is None and line.startswith(b"event: token"):
+                    first_token = time.perf_counter() - started
+                if line.startswith(b"event: done") or line.startswith(b"event: error"):
+                    break
+        latencies.append(time.perf_counter() - started)
+        ttfts.append(first_token or 0.0)
+
+    await http.delete(f"{base_url}/sessions/{session_id}")
+
+
+async def bench_api(sessions: int, turns: int, concurrency: int) -> dict:
+    """Run simulated clients against an in-process API server."""
+    import aiohttp
+    from aiohttp import web
+    from api_server import create_app
+
+    runner = web.AppRunner(create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    latencies, ttfts = [], []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_session(http):
+        async with semaphore:
+            await _api_client(http, base_url, turns, latencies, ttfts)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as http:
+        await asyncio.gather(*(one_session(http) for _ in range(sessions)))
+    wall = time.perf_counter() - started
+    await runner.cleanup()
+
+    result = _summary(f"api (concurrency {concurrency})", wall, latencies, len(latencies))
+    result["ttft_p50_ms"] = round(statistics.median(ttfts) * 1000, 1) if ttfts else 0.0
+    return result
+
+
+def bench_streamlit(sessions: int, turns: int) -> dict:
+    """Drive app.py through check-in, reflection setup and chat turns with AppTest."""
+    from streamlit.testing.v1 import AppTest
+
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(sessions):
+        at = AppTest.from_file(app_path, default_timeout=120).run()
+        at.multiselect[0].set_value(["Tension in body"])
+        at.radio[0].set_value("Work tasks or projects")
+        at.button[0].click().run()
+        at.button(key="btn_reflection").click().run()
+        at.text_area[0].input("Anxious")
+        at.text_area[1].input("Tight shoulders")
+        at.text_area[2].input("A hard conversation at work")
+        [b for b in at.button if "Begin Reflection" in b.label][0].click().run()
+
+        for message in _turns(turns):
+            turn_started = time.perf_counter()
+            at.chat_input[0].set_value(message).run()
+            latencies.append(time.perf_counter() - turn_started)
+    wall = time.perf_counter() - started
+
+    return _summary("streamlit (sequential reruns)", wall, latencies, len(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare API and Streamlit serving throughput on the mock backend.")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--ttft-ms", type=float, default=100, help="Mock time to first token")
+    parser.add_argument("--token-ms", type=float, default=2, help="Mock delay per token")
+    parser.add_argument("--skip-streamlit", action="store_true")
+    transport = parser.add_mutually_exclusive_group()
+    transport.add_argument("--record", metavar="CASSETTE", help="Call the real API and record the traffic")
+    transport.add_argument("--replay", metavar="CASSETTE", help="Replay recorded traffic at its recorded timing")
+    args = parser.parse_args()
+
+    os.environ["POCKET_AI_MOCK_TTFT_MS"] = str(args.ttft_ms)
+    os.environ["POCKET_AI_MOCK_TOKEN_MS"] = str(args.token_ms)
+    if args.record:
+        os.environ["POCKET_AI_BACKEND"] = "record"
+        os.environ["POCKET_AI_CASSETTE"] = args.record
+    elif args.replay:
+        os.environ["POCKET_AI_BACKEND"] = "replay-realtime"
+        os.environ["POCKET_AI_CASSETTE"] = args.replay
+
+    results = [
+        asyncio.run(bench_api(args.sessions, args.turns, 1)),
+        asyncio.run(bench_api(args.sessions, args.turns, args.concurrency)),
+    ]
+    if not args.skip_streamlit:
+        results.append(bench_streamlit(args.sessions, args.turns))
+
+    print(f"{'path':<32}{'turns':>7}{'wall_s':>9}{'turns/s':>9}{'p50_ms':>9}{'p95_ms':>9}")
+    for r in results:
+        print(f"{r['path']:<32}{r['turns']:>7}{r['wall_s']:>9}{r['turns_per_s']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark: archive search latency at hundreds of thousands of messages.
+
+Fills a throwaway SQLite archive (see archive.py) with synthetic sessions
+for many users, then times the lookups the app makes:
+
+- search      a user's own search box query (every word must appear)
+- context     relevant_snippets() for a new session's setup (any of its words, re-ranked)
+- recent      the user's latest sessions
+- like-scan   the same search as a LIKE scan without the FTS index, for reference
+
+Usage:
+    python bench_archive.py
+    python bench_archive.py --users 2000 --messages-per-user 200 --db /tmp/archive.db
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+from archive import SessionArchive, user_id_for
+
+VOCABULARY = (
+    "work manager deadline meeting criticised project team email boss presentation "
+    "mother father sister brother partner friend family dinner argument call message "
+    "shoulders chest stomach jaw neck tension tight heavy tired restless numb breathing "
+    "anxious worried angry frustrated sad lonely calm relieved hopeful proud guilty ashamed "
+    "sleep morning evening weekend holiday exam money rent move city home walk park "
+    "remember childhood school birthday conversation apology forgive miss love trust"
+).split()
+
+FILLER = "i really it was and then the a my so but just felt like when about".split()
+
+EXERCISES = ["empty_chair", "breathing", "body_scan", "reflection"]
+
+
+def _sentence(rng: random.Random, words: int = 18) -> str:
+    return " ".join(rng.choice(VOCABULARY) if rng.random() < 0.45 else rng.choice(FILLER)
+                    for _ in range(words)).capitalize() + "."
+
+
+def populate(archive: SessionArchive, users: int, messages_per_user: int, seed: int = 11):
+    """Archive synthetic sessions of 10 messages each for every user."""
+    rng = random.Random(seed)
+    for n in range(users):
+        user_id = user_id_for(f"bench-user-{n:08d}")
+        for _ in range(max(1, messages_per_user // 10)):
+            session_id = uuid.uuid4().hex
+            archive.start_session(session_id, user_id, rng.choice(EXERCISES), "Guide",
+                                  rng.randint(1, 5), ["Tension in body"], "Work tasks or projects")
+            archive.add_messages(session_id, user_id, [
+                {"role": "user" if i % 2 else "assistant", "content": _sentence(rng, rng.randint(8, 40))}
+                for i in range(10)
+            ])
+
+
+def _time(fn, runs: int) -> dict:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings) * 1000, 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time archive lookups on a large synthetic archive.")
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--messages-per-user", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--db", help="Database file (default: a temporary file)")
+    args = parser.parse_args()
+    # Synthetic users only; any secret will do
+    os.environ.setdefault("POCKET_AI_ARCHIVE_SECRET", "bench-archive")
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "archive.db")
+    archive = SessionArchive(path)
+    started = time.perf_counter()
+    populate(archive, args.users, args.messages_per_user)
+    total = archive._conn.execute("SELECT count(*) FROM messages").fetchone()[0]
+    print(f"{total:,} messages from {args.users:,} users archived in {time.perf_counter() - started:.1f}s ({path})\n")
+
+    rng = random.Random(3)
+    users = [user_id_for(f"bench-user-{rng.randrange(args.users):08d}") for _ in range(args.runs)]
+    queries = [f"{rng.choice(VOCABULARY)} {rng.choice(VOCABULARY)}" for _ in range(args.runs)]
+    setups = [" ".join(rng.sample(VOCABULARY, 8)) for _ in range(args.runs)]
+    turn = iter(range(10 ** 9))
+
+    def like_scan():
+        i = next(turn) % args.runs
+        word = queries[i].split()[0]
+        archive._conn.execute(
+            "SELECT session_id, content FROM messages WHERE user_id = ? AND content LIKE ? LIMIT 10",
+            (users[i], f"%{word}%")
+        ).fetchall()
+
+    cases = [
+        ("search", lambda: archive.search(users[next(turn) % args.runs], queries[next(turn) % args.runs])),
+        ("context", lambda: archive.relevant_snippets(users[next(turn) % args.runs], setups[next(turn) % args.runs])),
+        ("recent", lambda: archive.recent_sessions(users[next(turn) % args.runs])),
+        ("like-scan", like_scan),
+    ]
+    print(f"{'lookup':<12}{'p50_ms':>9}{'p95_ms':>9}")
+    for name, fn in cases:
+        result = _time(fn, args.runs)
+        print(f"{name:<12}{result['p50_ms']:>9}{result['p95_ms']:>9}")
+
+    # For reference: bm25 ranking counts every document containing each term, in every user's archive
+    ranked = _time(lambda: archive._conn.execute(
+        "SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rank LIMIT 10",
+        (f'user_id : "{users[0]}" AND content : ("{VOCABULARY[0]}" "{VOCABULARY[1]}")',)
+    ).fetchall(), 20)
+    print(f"{'bm25-rank':<12}{ranked['p50_ms']:>9}{ranked['p95_ms']:>9}   (search ordered by bm25 instead)")
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
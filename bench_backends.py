@@ -0,0 +1,117 @@
+"""
+Benchmark: routing and failover across completion backends.
+
+Runs offline on mock backends (mock_backend.py) with different speeds:
+
+    local    a co-located server, fast to start answering
+    hosted   the remote API, slower
+    flaky    as fast as local, but it goes down part-way through the run
+
+and compares, per routing policy, the mean reply latency and where the
+requests went:
+
+    single   hosted only (today's default)
+    ordered  the backends in the order listed, failing over when one is down
+    fastest  healthy backends by recent latency (backends.py default)
+
+The flaky backend's outage shows what failover costs: the request that
+discovers the outage pays for one failed attempt, and later ones skip the
+backend until a health check brings it back.
+
+Usage:
+    python bench_backends.py
+    python bench_backends.py --requests 200 --outage 50:120
+"""
+import argparse
+import statistics
+import time
+from types import SimpleNamespace
+
+from backends import Backend, RoutingClient
+from mock_backend import MockOpenAI
+
+
+class FlakyClient:
+    """A MockOpenAI that refuses connections while `down` is set."""
+
+    def __init__(self, inner: MockOpenAI):
+        self.down = False
+        self._inner = inner
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.models = SimpleNamespace(list=self._list)
+
+    def _check(self):
+        if self.down:
+            time.sleep(0.002)
+            raise ConnectionError("connection refused")
+
+    def _create(self, **kwargs):
+        self._check()
+        return self._inner.chat.completions.create(**kwargs)
+
+    def _list(self):
+        self._check()
+        return []
+
+
+def _backends(flaky: FlakyClient, token_ms: float):
+    return {
+        "hosted": Backend("hosted", MockOpenAI(ttft_ms=300, prefill_us=0, token_ms=token_ms)),
+        "flaky": Backend("flaky", flaky),
+        "local": Backend("local", MockOpenAI(ttft_ms=120, prefill_us=0, token_ms=token_ms)),
+    }
+
+
+def run(policy: str, requests: int, outage: range, token_ms: float) -> dict:
+    flaky = FlakyClient(MockOpenAI(ttft_ms=60, prefill_us=0, token_ms=token_ms))
+    backends = _backends(flaky, token_ms)
+    if policy == "single":
+        client = RoutingClient([backends["hosted"]], health_interval=0)
+    else:
+        order = [backends["flaky"], backends["local"], backends["hosted"]]
+        client = RoutingClient(order, routing=policy, health_interval=0)
+
+    latencies = []
+    for i in range(requests):
+        flaky.down = i in outage
+        if i % 10 == 0:
+            # Stands in for the background health checker
+            client.check_health()
+        started = time.perf_counter()
+        stream = client.chat.completions.create(
+            model="gpt-4o-mini", messages=[{"role": "user", "content": "hello"}],
+            max_tokens=20, stream=True
+        )
+        next(iter(stream))
+        latencies.append(time.perf_counter() - started)
+        stream.close()
+
+    report = {b["name"]: b["requests"] for b in client.report()}
+    return {
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p95_ms": sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000,
+        "outage_ms": statistics.mean(latencies[outage.start:outage.stop]) * 1000 if policy != "single" else None,
+        "requests": report,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare backend routing policies on mock backends.")
+    parser.add_argument("--requests", type=int, default=120)
+    parser.add_argument("--outage", default="40:80", help="Requests during which the flaky backend is down")
+    parser.add_argument("--token-ms", type=float, default=0)
+    args = parser.parse_args()
+    start, stop = (int(x) for x in args.outage.split(":"))
+    outage = range(start, stop)
+
+    print(f"Time to first token over {args.requests} streamed requests; flaky backend down for requests {start}-{stop}\n")
+    print(f"{'routing':<10}{'mean_ms':>9}{'p95_ms':>9}{'outage_ms':>11}   requests per backend")
+    for policy in ("single", "ordered", "fastest"):
+        result = run(policy, args.requests, outage, args.token_ms)
+        during = "-" if result["outage_ms"] is None else f"{result['outage_ms']:.1f}"
+        spread = ", ".join(f"{name} {count}" for name, count in result["requests"].items())
+        print(f"{policy:<10}{result['mean_ms']:>9.1f}{result['p95_ms']:>9.1f}{during:>11}   {spread}")
+
+
+if __name__ == "__main__":
+    main()
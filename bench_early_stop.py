@@ -0,0 +1,113 @@
+"""
+Benchmark: tokens and time saved by stopping replies at their sentence budget.
+
+Streams over-long replies, of the kind the model produces when it ignores
+"2-3 sentences maximum", through PersonaChat on the offline mock backend
+(mock_backend.py), with and without early stop (early_stop.py). For every
+exercise and turn type it reports the tokens generated, the time until the
+reply was complete, and what early stop saved. Breathing turns carry
+exercise JSON, which must come through whole; the report checks it.
+
+Usage:
+    python bench_early_stop.py
+    python bench_early_stop.py --token-ms 20 --ttft-ms 300
+"""
+import argparse
+import json
+import re
+import time
+from typing import Optional
+
+from early_stop import SentenceBudget, budget_for
+from mock_backend import MockOpenAI
+from script import CompletionStats, PersonaChat
+
+_JSON = ('```json\n{"exerciseName": "Box Breathing", "description": "Breathe in a square. Equal counts.", '
+         '"steps": ["Breathe in for 4.", "Hold for 4.", "Breathe out for 4.", "Hold for 4."], "duration": 240}\n```')
+
+# (exercise, turn type, an over-long reply)
+REPLIES = [
+    ("empty_chair", "greeting",
+     "Hey, it's really good to see you. I've been thinking about you a lot lately. There's so much I want to say, "
+     "but first I want to hear from you. Take all the time you need. I'm not going anywhere, and nothing you "
+     "say will change how much I care about you."),
+    ("empty_chair", "chat",
+     "I hear how much that hurt you, and I'm sorry. I never meant for you to feel like you weren't enough. "
+     "Looking back, I think I was scared of saying the wrong thing, so I said nothing at all. That wasn't fair "
+     "to you. You deserved someone who showed up. I know words can't undo it, but I want you to know I see it "
+     "now. What do you wish I had said back then?"),
+    ("breathing", "greeting",
+     "Welcome, I'm really glad you're here. It sounds like today has been heavy, and it makes sense that your "
+     "body is holding some of that. We'll take this slowly together. There's no right or wrong way to feel "
+     "right now. When you're ready, let me know and we'll begin."),
+    ("breathing", "chat",
+     "Let's try something gentle that can steady your breathing. " + _JSON + " Take your time with it. Notice "
+     "how your shoulders feel as you go. If your mind wanders, that's completely normal. Simply come back to "
+     "the count. Click the button when you're done."),
+    ("breathing", "finished_exercise",
+     "Welcome back! Did you manage to complete the breathing exercise? I'd love to hear how it went for you. "
+     "Some people notice a shift straight away, and others need a few rounds. Either way is fine. Would you "
+     "like to try another one?"),
+    ("body_scan", "chat",
+     "Thank you for noticing that tightness in your shoulders. Let's stay with it for a moment. Breathe into "
+     "that area and imagine the breath softening it. Notice if the feeling changes in size or texture. There's "
+     "no need to force anything. What do you notice now?"),
+    ("reflection", "chat",
+     "It sounds like that moment at work really stayed with you. Feeling criticised in front of others can "
+     "leave us replaying it for hours. I'm noticing that your body tensed up exactly when you described it. "
+     "That tells us how much it mattered to you. Let's look at what you were needing in that moment. "
+     "What comes up when you think about it now?"),
+]
+
+
+def _stream(reply: str, budget: Optional[SentenceBudget], ttft_ms: float, token_ms: float):
+    chat = PersonaChat(verbose=False, client=MockOpenAI(reply=reply, ttft_ms=ttft_ms, prefill_us=0, token_ms=token_ms))
+    chat.set_persona_environment("Guide", "Warm and brief.")
+    stats = CompletionStats()
+    started = time.perf_counter()
+    text = "".join(chat.stream_complete(chat.conversation_history + [{"role": "user", "content": "hi"}],
+                                        sentence_budget=budget, stats=stats))
+    return text, time.perf_counter() - started, stats.chunks
+
+
+def _sentences(text: str) -> int:
+    prose = re.sub(r"```.*?```", " ", text, flags=re.S)
+    return len(re.findall(r"[.!?]+(?=\s|$)", prose))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure what early stop saves per exercise.")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="Mock time to first token")
+    parser.add_argument("--token-ms", type=float, default=15, help="Mock delay per token")
+    args = parser.parse_args()
+
+    print(f"{'exercise':<12}{'turn':<19}{'budget':>7}{'tokens':>8}{'kept':>6}{'saved':>7}"
+          f"{'full_ms':>9}{'stop_ms':>9}{'saved_ms':>10}  sentences  json")
+    totals = {}
+    for exercise, kind, reply in REPLIES:
+        budget = budget_for(exercise, kind)
+        full, full_s, full_chunks = _stream(reply, None, args.ttft_ms, args.token_ms)
+        cut, cut_s, cut_chunks = _stream(reply, budget, args.ttft_ms, args.token_ms)
+        json_ok = "-"
+        if "```json" in reply:
+            block = re.search(r"```json\s*(\{.*?\})\s*```", cut, re.S)
+            json_ok = "whole" if block and json.loads(block.group(1)) else "CUT"
+        # "2j": two sentences, counted after the exercise JSON
+        label = f"{budget.sentences}{'j' if budget.after_json else ''}"
+        print(f"{exercise:<12}{kind:<19}{label:>7}{full_chunks:>8}{cut_chunks:>6}"
+              f"{1 - cut_chunks / full_chunks:>7.0%}{full_s * 1000:>9.0f}{cut_s * 1000:>9.0f}"
+              f"{(full_s - cut_s) * 1000:>10.0f}  {_sentences(full):>2} -> {_sentences(cut):<4}  {json_ok}")
+        total = totals.setdefault(exercise, [0, 0, 0.0, 0.0])
+        total[0] += full_chunks
+        total[1] += cut_chunks
+        total[2] += full_s
+        total[3] += cut_s
+
+    print(f"\n{'exercise':<12}{'tokens saved':>14}{'time saved':>12}")
+    for exercise, (full_chunks, cut_chunks, full_s, cut_s) in totals.items():
+        print(f"{exercise:<12}{1 - cut_chunks / full_chunks:>14.0%}{1 - cut_s / full_s:>12.0%}")
+    print("\n(tokens are stream chunks; the mock streams one word per chunk)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Benchmark: crisis screening overlaps with generation, so it costs no reply latency.
+
+Runs on the offline mock backend (mock_backend.py):
+
+- matcher: time to screen() one message, over a corpus of short answers,
+  long check-in style messages and crisis statements
+- critical path: time until the reply is available, measured over the same
+  turns with:
+    none         no screening
+    concurrent   the request is submitted, then the message is screened while
+                 it is in flight (what app.py and api_server.py do)
+    sequential   a moderation round trip in front of the request, simulated
+                 as one more mock call
+- pre-emption: how soon a crisis message gets its reply, compared with a
+  normal reply
+- levels: what each labelled sample is screened as
+
+Usage:
+    python bench_safety.py
+    python bench_safety.py --turns 50 --ttft-ms 300
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Callable, List
+
+from mock_backend import MockOpenAI
+from safety import CONCERN, CRISIS, CRISIS_REPLY, NONE, screen
+from script import PersonaChat
+from workers import CompletionPool
+
+# (message, expected level)
+LABELLED = [
+    ("I want to kill myself", CRISIS),
+    ("I've been thinking about ending my life", CRISIS),
+    ("I have the pills ready and there's no reason to go on living", CRISIS),
+    ("sometimes I cut myself when it gets bad", CRISIS),
+    ("I don't want to wake up tomorrow", CRISIS),
+    ("I'm afraid for my life at home", CRISIS),
+    ("I just can't take it anymore", CONCERN),
+    ("I feel completely hopeless about work", CONCERN),
+    ("he hits me when he's drunk", CONCERN),
+    ("I'm a burden to everyone", CONCERN),
+    ("I would never hurt myself, I just feel tired", NONE),
+    ("this deadline is killing me", NONE),
+    ("I don't want to die, I want things to change", NONE),
+    ("My shoulders are tense and my chest feels tight", NONE),
+    ("yes I finished the exercise", NONE),
+]
+
+LONG_MESSAGE = (
+    "Today was really long. My manager criticised my work in front of the whole team and I "
+    "spent the afternoon replaying it. My shoulders are tense, my chest feels tight and I keep "
+    "thinking I should have said something. When I got home I couldn't focus on anything. "
+)
+
+
+def _corpus() -> List[str]:
+    texts = [text for text, _ in LABELLED] + [LONG_MESSAGE, LONG_MESSAGE * 4]
+    examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_examples.jsonl")
+    with open(examples, encoding="utf-8") as f:
+        texts += [json.loads(line)["text"] for line in f if line.strip()]
+    return texts
+
+
+def bench_matcher(rounds: int = 200) -> dict:
+    """Microseconds per screen() call."""
+    corpus = _corpus()
+    timings = []
+    for _ in range(rounds):
+        for text in corpus:
+            started = time.perf_counter()
+            screen(text)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "messages": len(timings),
+        "mean_us": round(statistics.mean(timings) * 1e6, 1),
+        "p99_us": round(timings[int(len(timings) * 0.99)] * 1e6, 1),
+        "max_chars": max(len(t) for t in corpus),
+    }
+
+
+def _chat(client: MockOpenAI) -> PersonaChat:
+    chat = PersonaChat(verbose=False, client=client)
+    chat.set_persona_environment("Reflection Guide", "Calm and encouraging.")
+    return chat
+
+
+def _turn_none(pool: CompletionPool, chat: PersonaChat, message: str, client: MockOpenAI):
+    return pool.submit("bench", "chat", chat.chat, message).result()
+
+
+def _turn_concurrent(pool: CompletionPool, chat: PersonaChat, message: str, client: MockOpenAI):
+    job = pool.submit("bench", "chat", chat.chat, message)
+    screen(message)
+    return job.result()
+
+
+def _turn_sequential(pool: CompletionPool, chat: PersonaChat, message: str, client: MockOpenAI):
+    # A remote moderation call: one more round trip before the request can start
+    client.chat.completions.create(model="moderation", messages=[{"role": "user", "content": message}],
+                                   max_tokens=1)
+    return pool.submit("bench", "chat", chat.chat, message).result()
+
+
+def bench_critical_path(turn: Callable, turns: int, client: MockOpenAI) -> List[float]:
+    """Seconds until each reply is available."""
+    pool = CompletionPool(max_workers=2)
+    chat = _chat(client)
+    messages = [text for text, level in LABELLED if level != CRISIS] + [LONG_MESSAGE]
+    latencies = []
+    for i in range(turns):
+        started = time.perf_counter()
+        turn(pool, chat, messages[i % len(messages)], client)
+        latencies.append(time.perf_counter() - started)
+        chat.reset_conversation()
+    return latencies
+
+
+def bench_preemption(turns: int, client: MockOpenAI) -> dict:
+    """Time until a crisis message has its reply, as the app pre-empts it."""
+    pool = CompletionPool(max_workers=2)
+    chat = _chat(client)
+    shown = []
+    for _ in range(turns):
+        started = time.perf_counter()
+        job = pool.submit("bench", "chat", chat.chat, "I want to kill myself")
+        if screen("I want to kill myself").level == CRISIS:
+            job.cancel()
+            reply = CRISIS_REPLY
+        shown.append(time.perf_counter() - started)
+        # The app settles the history once the cancelled call has unwound
+        try:
+            job.result()
+        except Exception:
+            pass
+        chat.settle_exchange("I want to kill myself", reply)
+    return {"mean_ms": round(statistics.mean(shown) * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show that concurrent screening adds no reply latency.")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--ttft-ms", type=float, default=300, help="Mock time to first token")
+    parser.add_argument("--token-ms", type=float, default=2, help="Mock delay per token")
+    args = parser.parse_args()
+
+    client = MockOpenAI(ttft_ms=args.ttft_ms, prefill_us=0, token_ms=args.token_ms)
+
+    matcher = bench_matcher()
+    print(f"screen(): {matcher['mean_us']} us mean, {matcher['p99_us']} us p99 "
+          f"over {matcher['messages']:,} messages (up to {matcher['max_chars']} chars)\n")
+
+    print(f"{'screening':<14}{'p50_ms':>9}{'mean_ms':>9}{'vs none':>10}")
+    baseline = None
+    for name, turn in (("none", _turn_none), ("concurrent", _turn_concurrent), ("sequential", _turn_sequential)):
+        latencies = bench_critical_path(turn, args.turns, client)
+        mean = statistics.mean(latencies) * 1000
+        baseline = baseline if baseline is not None else mean
+        print(f"{name:<14}{statistics.median(latencies) * 1000:>9.1f}{mean:>9.1f}{mean - baseline:>+10.1f}")
+
+    preemption = bench_preemption(min(args.turns, 10), client)
+    print(f"\nCrisis reply shown after {preemption['mean_ms']} ms (the model's reply is cancelled)")
+
+    print(f"\n{'expected':<10}{'screened':<10}{'score':>6}  message")
+    for text, expected in LABELLED:
+        result = screen(text)
+        mark = "" if result.level == expected else "  <-- differs"
+        print(f"{expected:<10}{result.level:<10}{result.score:>6}  {text}{mark}")
+
+
+if __name__ == "__main__":
+    main()
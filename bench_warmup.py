@@ -0,0 +1,98 @@
+"""
+First-request latency with and without warm-up.
+
+Every measurement runs in a fresh Python process, like the first user after a
+pm2 restart:
+
+- cold: nothing has run yet. The first request imports the app's modules,
+  builds a client and connects to the API on demand, as app.py does on its
+  first run.
+- warm: warmup.warm_up() runs first, as the launcher does before traffic is
+  routed to the process. Then the same request is timed.
+
+The second request of each process is shown for reference.
+
+The completion backend comes from POCKET_AI_BACKEND. With the default
+(openai) the DNS and TLS costs are included. With the mock backend only the
+import and client costs are; mock latency is set low here so they stand out.
+
+Usage:
+    python bench_warmup.py --runs 5
+    POCKET_AI_BACKEND=mock python bench_warmup.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def _first_request(mode: str) -> dict:
+    """Time the first and second request in this (fresh) process."""
+    if mode == "warm":
+        import warmup
+        warmup.warm_up()
+
+    started = time.perf_counter()
+    import prefetch  # noqa: F401
+    import workers  # noqa: F401
+    from flows import FlowTracker
+    from script import PersonaChat
+    from warmup import get_shared_client
+
+    FlowTracker("breathing").handle_user_message("hello")
+    chat = PersonaChat(verbose=False, client=get_shared_client())
+    chat.set_persona_environment("Breathing Guide", "A calm, encouraging breathing guide.")
+    chat.chat("Hi, I'd like to relax.")
+    first = time.perf_counter() - started
+
+    started = time.perf_counter()
+    chat.chat("Okay, what should I do?")
+    second = time.perf_counter() - started
+    return {"first_ms": first * 1000, "second_ms": second * 1000}
+
+
+def measure(mode: str, runs: int) -> dict:
+    """Run `runs` fresh processes and return median first/second request times."""
+    env = dict(os.environ)
+    env.setdefault("POCKET_AI_MOCK_TTFT_MS", "20")
+    env.setdefault("POCKET_AI_MOCK_TOKEN_MS", "0")
+    env["POCKET_AI_PREFETCH"] = "0"
+
+    results = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode],
+            capture_output=True, text=True, env=env, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    return {
+        "mode": mode,
+        "first_ms": round(statistics.median(r["first_ms"] for r in results), 1),
+        "second_ms": round(statistics.median(r["second_ms"] for r in results), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare first-request latency of cold and warmed-up processes.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per mode")
+    parser.add_argument("--child", choices=["cold", "warm"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_first_request(args.child)))
+        return
+
+    print(f"backend: {os.getenv('POCKET_AI_BACKEND', 'openai')}, {args.runs} processes per mode\n")
+    print(f"{'mode':<8}{'first_ms':>10}{'second_ms':>11}")
+    for mode in ("cold", "warm"):
+        r = measure(mode, args.runs)
+        print(f"{r['mode']:<8}{r['first_ms']:>10}{r['second_ms']:>11}")
+
+
+if __name__ == "__main__":
+    main()
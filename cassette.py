@@ -0,0 +1,240 @@
+"""
+Record/replay transport for OpenAI chat completions.
+
+RecordingClient wraps a real client and appends every completion to a
+cassette file. A cassette is JSONL with one interaction per line: the request,
+then either the full response or every streamed chunk with its offset from
+the start of the request. ReplayClient serves those interactions back without
+the network, either at full speed or at the recorded timing. This lets
+benchmarks and CI run real traffic shapes with no API key.
+
+Select a transport for PersonaChat (and so for the app, CLI, batch runner and
+API server) with environment variables:
+    POCKET_AI_BACKEND=record            record real traffic
+    POCKET_AI_BACKEND=replay            replay as fast as possible
+    POCKET_AI_BACKEND=replay-realtime   replay with the recorded timing
+    POCKET_AI_CASSETTE=path/to/file.jsonl
+
+A stream the caller closes part-way (an early stop, see early_stop.py, or a
+cancellation) is recorded up to that point and marked "stopped".
+
+Requests are matched on model and messages. A recording made without
+streaming can be replayed to a streaming request (as a single chunk) and
+the other way round.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Deque, Dict, Iterator, List
+
+
+class CassetteMiss(LookupError):
+    """Raised when a replayed request was never recorded."""
+
+
+def request_key(kwargs: Dict[str, Any]) -> str:
+    """Key an interaction on what determines the reply: model and messages."""
+    payload = json.dumps({"model": kwargs.get("model"), "messages": kwargs.get("messages")},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def to_plain(obj: Any) -> Any:
+    """Convert an API object (pydantic model or SimpleNamespace) into JSON-safe data."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, SimpleNamespace):
+        return {k: to_plain(v) for k, v in vars(obj).items()}
+    if isinstance(obj, dict):
+        return {k: to_plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_plain(v) for v in obj]
+    return obj
+
+
+def to_namespace(data: Any) -> Any:
+    """Convert recorded JSON back into objects with attribute access."""
+    if isinstance(data, dict):
+        return SimpleNamespace(**{k: to_namespace(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return [to_namespace(v) for v in data]
+    return data
+
+
+class _RecordingStream:
+    """Passes chunks through to the caller while recording them."""
+
+    def __init__(self, stream, on_finish):
+        self._stream = stream
+        self._on_finish = on_finish
+        self._started = time.perf_counter()
+        self._chunks: List[Dict] = []
+        self._iterator = None
+
+    def __iter__(self) -> Iterator:
+        self._iterator = self._record()
+        return self._iterator
+
+    def _record(self) -> Iterator:
+        try:
+            for chunk in self._stream:
+                self._chunks.append({"offset": time.perf_counter() - self._started, "data": to_plain(chunk)})
+                yield chunk
+        except GeneratorExit:
+            # Closed part-way (early stop or cancellation): keep what was received
+            self._on_finish(self._chunks, time.perf_counter() - self._started, True)
+            raise
+        self._on_finish(self._chunks, time.perf_counter() - self._started, False)
+
+    def close(self):
+        if self._iterator is not None:
+            self._iterator.close()
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            close()
+
+
+class _RecordingCompletions:
+    def __init__(self, inner, cassette: "RecordingClient"):
+        self._inner = inner
+        self._cassette = cassette
+
+    def create(self, **kwargs):
+        request = {k: v for k, v in kwargs.items() if k in ("model", "messages", "temperature", "max_tokens", "stream")}
+        started = time.perf_counter()
+        response = self._inner.create(**kwargs)
+
+        if kwargs.get("stream"):
+            return _RecordingStream(
+                response,
+                lambda chunks, elapsed, stopped: self._cassette.write(
+                    {"request": request, "chunks": chunks, "elapsed": elapsed, "stopped": stopped}
+                ),
+            )
+
+        self._cassette.write({
+            "request": request,
+            "response": to_plain(response),
+            "elapsed": time.perf_counter() - started,
+        })
+        return response
+
+
+class RecordingClient:
+    """Wraps a client and appends every completion to a cassette file."""
+
+    def __init__(self, inner_client, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_RecordingCompletions(inner_client.chat.completions, self))
+
+    def write(self, interaction: Dict):
+        """Append one interaction to the cassette."""
+        interaction["recorded_at"] = datetime.now(timezone.utc).isoformat()
+        line = json.dumps(interaction, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def load_cassette(path: str) -> List[Dict]:
+    """Read all interactions from a cassette file."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class _ReplayStream:
+    def __init__(self, chunks: Iterator):
+        self._chunks = chunks
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        self._chunks.close()
+
+
+class _ReplayCompletions:
+    def __init__(self, interactions: List[Dict], realtime: bool):
+        self._realtime = realtime
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, Deque[Dict]] = defaultdict(deque)
+        for interaction in interactions:
+            self._by_key[request_key(interaction["request"])].append(interaction)
+
+    def create(self, **kwargs):
+        key = request_key(kwargs)
+        with self._lock:
+            recorded = self._by_key.get(key)
+            if not recorded:
+                raise CassetteMiss("No recorded interaction matches this request")
+            interaction = recorded[0]
+            # Cycle through repeated recordings of the same request
+            recorded.rotate(-1)
+
+        if kwargs.get("stream"):
+            return _ReplayStream(self._stream(interaction))
+
+        if self._realtime:
+            time.sleep(interaction["elapsed"])
+        return to_namespace(interaction.get("response") or self._assemble(interaction["chunks"]))
+
+    def _stream(self, interaction: Dict) -> Iterator:
+        chunks = interaction.get("chunks")
+        if chunks is None:
+            # Recorded without streaming - replay the whole reply as one chunk
+            chunks = self._split(interaction)
+
+        started = time.perf_counter()
+        for chunk in chunks:
+            if self._realtime:
+                delay = chunk["offset"] - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            yield to_namespace(chunk["data"])
+
+    @staticmethod
+    def _split(interaction: Dict) -> List[Dict]:
+        response = interaction["response"]
+        choice = response["choices"][0]
+        elapsed = interaction.get("elapsed", 0.0)
+        return [
+            {"offset": elapsed, "data": {"choices": [{"index": 0, "delta": {"content": choice["message"]["content"]},
+                                                      "finish_reason": None}], "usage": None}},
+            {"offset": elapsed, "data": {"choices": [{"index": 0, "delta": {"content": None},
+                                                      "finish_reason": choice.get("finish_reason")}], "usage": None}},
+            {"offset": elapsed, "data": {"choices": [], "usage": response.get("usage")}},
+        ]
+
+    @staticmethod
+    def _assemble(chunks: List[Dict]) -> Dict:
+        """Build a non-streaming response from recorded chunks."""
+        content, finish_reason, usage = [], None, None
+        for chunk in chunks:
+            data = chunk["data"]
+            for choice in data.get("choices", []):
+                content.append(choice.get("delta", {}).get("content") or "")
+                finish_reason = choice.get("finish_reason") or finish_reason
+            usage = data.get("usage") or usage
+        return {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(content)},
+                         "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+
+class ReplayClient:
+    """
+    Serves recorded interactions instead of calling the API.
+
+    Args:
+        path: Cassette file to replay
+        realtime: Sleep to reproduce the recorded latency and chunk timing
+    """
+
+    def __init__(self, path: str, realtime: bool = False):
+        self.path = path
+        self.chat = SimpleNamespace(completions=_ReplayCompletions(load_cassette(path), realtime))
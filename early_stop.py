@@ -0,0 +1,163 @@
+"""
+Client-side early stop: close a streamed reply once it is long enough.
+
+Every prompt asks for "2-3 sentences maximum", but requests allow 500
+tokens, and a model that rambles is paid for and waited on to the last
+token. With a sentence budget, PersonaChat streams the reply and watches
+sentence boundaries. Once the budget for the turn type is reached, it
+closes the stream, which stops generation upstream.
+
+Exercise JSON is never cut:
+- a ```json ... ``` block is always streamed to its closing fence, and
+  sentences inside it are not counted
+- on turns that deliver an exercise (breathing chat and finished_exercise
+  turns), only the sentences after the JSON count. A reply that has not
+  given its JSON yet is never stopped, however long it gets.
+
+Budgets per turn type (override with POCKET_AI_SENTENCES_<KIND>, e.g.
+POCKET_AI_SENTENCES_CHAT=4). Set POCKET_AI_EARLY_STOP=0 to turn early stop
+off.
+
+The app records every turn per exercise (see record() and report()).
+bench_early_stop.py measures the tokens and time saved.
+"""
+import os
+import re
+from typing import Dict, NamedTuple, Optional
+
+import metrics
+
+# Sentences per turn type; at least what the prompts ask for, so a reply that follows them is never cut
+SENTENCE_BUDGETS = {
+    kind: int(os.getenv(f"POCKET_AI_SENTENCES_{kind.upper()}", default))
+    for kind, default in (("greeting", "3"), ("chat", "3"), ("finished_exercise", "3"), ("group", "3"))
+}
+
+# Sentences allowed after the JSON on turns that deliver an exercise (prompts allow 1-2)
+SENTENCES_AFTER_JSON = 2
+
+# (exercise, turn type) pairs whose reply may carry exercise JSON
+JSON_TURNS = {("breathing", "chat"), ("breathing", "finished_exercise")}
+
+# A run of sentence-ending punctuation, with closing quotes or brackets, followed by whitespace
+_BOUNDARY = re.compile(r"```|(?<![.!?])[.!?]+[\"'”’)\]]*(?=\s)")
+
+# Words whose trailing period does not end a sentence
+_ABBREVIATIONS = {"e.g", "i.e", "etc", "vs", "dr", "mr", "mrs", "ms", "st", "approx"}
+
+_WORD_BEFORE = re.compile(r"([\w.]+)$")
+
+
+class SentenceBudget(NamedTuple):
+    """How many sentences a reply may have."""
+    sentences: int
+    # Count only sentences after an exercise JSON block
+    after_json: bool = False
+
+
+def early_stop_enabled() -> bool:
+    """Return True unless early stop was turned off with POCKET_AI_EARLY_STOP=0."""
+    return os.getenv("POCKET_AI_EARLY_STOP", "1") != "0"
+
+
+def budget_for(exercise: Optional[str], kind: str) -> Optional[SentenceBudget]:
+    """
+    The sentence budget for a turn, or None when early stop is off.
+
+    Args:
+        exercise: Exercise key (e.g. "breathing"), or None outside the app
+        kind: Turn type (e.g. "greeting", "chat", "finished_exercise")
+    """
+    if not early_stop_enabled():
+        return None
+    if (exercise, kind) in JSON_TURNS:
+        return SentenceBudget(SENTENCES_AFTER_JSON, after_json=True)
+    return SentenceBudget(SENTENCE_BUDGETS.get(kind, SENTENCE_BUDGETS["chat"]))
+
+
+class SentenceWatcher:
+    """
+    Follows a streamed reply and says where to cut it.
+
+    Args:
+        budget: The reply's sentence budget
+    """
+
+    def __init__(self, budget: SentenceBudget):
+        self.budget = budget
+        self.sentences = 0
+        self.in_json = False
+        self.json_seen = False
+        self._text = ""
+        self._scanned = 0
+
+    def feed(self, piece: str) -> Optional[int]:
+        """
+        Add the next piece of the reply.
+
+        Returns:
+            None to keep streaming, or how many characters of this piece to
+            keep before stopping (0 when the budget ended in an earlier piece)
+        """
+        start = len(self._text)
+        self._text += piece
+        scanned = self._scanned
+        for match in _BOUNDARY.finditer(self._text, self._scanned):
+            scanned = match.end()
+            if match.group() == "```":
+                self.in_json = not self.in_json
+                self.json_seen = self.json_seen or not self.in_json
+                continue
+            if self.in_json or self._abbreviation(match.start()):
+                continue
+            if self.budget.after_json and not self.json_seen:
+                continue
+            self.sentences += 1
+            if self.sentences >= self.budget.sentences:
+                return max(0, match.end() - start)
+        # A fence or a boundary may still be completed by the next piece
+        self._scanned = max(scanned, len(self._text) - 8)
+        return None
+
+    def _abbreviation(self, end: int) -> bool:
+        if self._text[end] != ".":
+            return False
+        word = _WORD_BEFORE.search(self._text, max(0, end - 12), end)
+        if word is None:
+            return False
+        word = word.group(1).lower()
+        # "e.g.", "Dr.", list numbers ("1.") and initials ("J.")
+        return word in _ABBREVIATIONS or word.isdigit() or (len(word) == 1 and word.isalpha())
+
+
+def record(exercise: str, kind: str, stopped: bool, chunks: int):
+    """
+    Count a streamed turn for the per-exercise report.
+
+    Args:
+        exercise: Exercise key
+        kind: Turn type
+        stopped: Whether the reply was cut at its budget
+        chunks: Streamed chunks received (about one token each)
+    """
+    metrics.incr(f"early_stop.{exercise}.turns")
+    metrics.incr(f"early_stop.{exercise}.chunks", chunks)
+    if stopped:
+        metrics.incr(f"early_stop.{exercise}.stopped")
+        metrics.incr(f"early_stop.{exercise}.{kind}.stopped")
+
+
+def report() -> Dict[str, dict]:
+    """Turns, stopped share and average chunks per exercise, for exercises with turns."""
+    counters = metrics.snapshot()
+    result = {}
+    for name, turns in counters.items():
+        if not (name.startswith("early_stop.") and name.endswith(".turns")) or not turns:
+            continue
+        exercise = name[len("early_stop."):-len(".turns")]
+        result[exercise] = {
+            "turns": turns,
+            "stopped": counters.get(f"early_stop.{exercise}.stopped", 0) / turns,
+            "chunks": counters.get(f"early_stop.{exercise}.chunks", 0) / turns,
+        }
+    return result
@@ -1,9 +1,10 @@
 module.exports = {
   apps: [{
     name: 'pocket-ai',
-    script: '/var/www/pocket-ai-demo/venv/bin/streamlit',
-    args: 'run app.py --server.port 5000 --server.address 0.0.0.0 --server.headless true',
-    interpreter: 'none',
+    // warmup.py warms the process up, then runs Streamlit (see warmup.py)
+    script: 'warmup.py',
+    args: '--server.port 5000 --server.address 0.0.0.0 --server.headless true',
+    interpreter: '/var/www/pocket-ai-demo/venv/bin/python',
     cwd: '/var/www/pocket-ai-demo',
     instances: 1,
     autorestart: true,
@@ -11,7 +12,8 @@ module.exports = {
     max_memory_restart: '1G',
     env: {
       NODE_ENV: 'production',
-      OPENAI_API_KEY: process.env.OPENAI_API_KEY
+      OPENAI_API_KEY: process.env.OPENAI_API_KEY,
+      POCKET_AI_READY_PORT: '5001'
     },
     error_file: '/var/www/pocket-ai-demo/logs/pm2-error.log',
     out_file: '/var/www/pocket-ai-demo/logs/pm2-out.log',
@@ -0,0 +1,88 @@
+"""
+Deadline budgets per turn type, and the fallback messages shown when they are missed.
+
+A user in distress should never be left looking at a spinner. If a reply has
+not arrived within its deadline, the app shows a short pre-authored message
+that fits the exercise and keeps waiting for the real reply in the background.
+"""
+import os
+from typing import Dict
+
+import metrics
+
+# Seconds to wait before showing a fallback. Greetings are the first thing a
+# user sees, so they get the shortest budget.
+DEADLINES = {
+    "greeting": float(os.getenv("POCKET_AI_DEADLINE_GREETING", "5")),
+    "finished_exercise": float(os.getenv("POCKET_AI_DEADLINE_FINISHED", "6")),
+    "chat": float(os.getenv("POCKET_AI_DEADLINE_CHAT", "10")),
+}
+
+FALLBACK_MESSAGES = {
+    "empty_chair": {
+        "greeting": "I'm here, and I'm listening. Take your time - say whatever you need to say.",
+        "chat": "I hear you. Give me a moment to take that in.",
+    },
+    "breathing": {
+        "greeting": "I'm here with you. Let's slow things down together - while I prepare something for you, just notice your breath as it is.",
+        "finished_exercise": "Welcome back. Did you complete the breathing exercise?",
+        "chat": "Thank you for sharing that. Let's take one slow, comfortable breath together while I think about what will help most.",
+    },
+    "body_scan": {
+        "greeting": "Thank you for checking in with your body. I'm here with you, and we'll explore what you're feeling gently, at your own pace.",
+        "chat": "Thank you for telling me. Take a gentle breath - I'm taking a moment with what you've shared.",
+    },
+    "reflection": {
+        "greeting": "Thank you for being so open about how you're feeling. I'm here to reflect on this with you.",
+        "chat": "That's really worth pausing on. Give me a moment to reflect on what you've shared.",
+    },
+}
+
+DEFAULT_FALLBACK = "I'm here with you. Give me just a moment."
+
+
+def deadline_for(kind: str) -> float:
+    """Return the deadline in seconds for a turn type."""
+    return DEADLINES.get(kind, DEADLINES["chat"])
+
+
+def get_fallback(exercise: str, kind: str) -> str:
+    """
+    Return the pre-authored fallback for an exercise and turn type.
+
+    Args:
+        exercise: Exercise key (e.g. "breathing")
+        kind: Turn type (e.g. "greeting", "chat", "finished_exercise")
+
+    Returns:
+        A short message that is safe to show in place of the model's reply
+    """
+    messages = FALLBACK_MESSAGES.get(exercise, {})
+    return messages.get(kind) or messages.get("chat") or DEFAULT_FALLBACK
+
+
+def record_turn(exercise: str, kind: str):
+    """Count a turn that was sent for an exercise."""
+    metrics.incr(f"turns.{exercise}")
+    metrics.incr(f"turns.{exercise}.{kind}")
+
+
+def record_fallback(exercise: str, kind: str):
+    """Count a missed deadline for an exercise."""
+    metrics.incr(f"fallbacks.{exercise}")
+    metrics.incr(f"fallbacks.{exercise}.{kind}")
+
+
+def fallback_rates() -> Dict[str, float]:
+    """
+    Return how often fallbacks fired per exercise.
+
+    Returns:
+        Mapping of exercise key to fallbacks / turns (exercises with no turns are omitted)
+    """
+    rates = {}
+    for exercise in FALLBACK_MESSAGES:
+        turns = metrics.get(f"turns.{exercise}")
+        if turns:
+            rates[exercise] = metrics.get(f"fallbacks.{exercise}") / turns
+    return rates
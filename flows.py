@@ -0,0 +1,119 @@
+"""
+Local tracking of the scripted decision points in the breathing and body-scan flows.
+
+The exercise prompts script a few questions whose answers only steer the flow:
+"Did you complete the breathing exercise?", "Would you like to try a different
+one?" and, in body-scan Phase 1, "Was there anything else?". FlowTracker
+follows the conversation, classifies the user's reply with intents.classify()
+at those points, and answers with the scripted next line itself when no
+generated response is needed. It also keeps the exercise's PhaseTracker
+(see phases.py) up to date.
+"""
+from typing import Optional
+
+import metrics
+from intents import classify
+from phases import PhaseTracker
+
+SCRIPTED_REPLIES = {
+    # Breathing, step 4: the user completed the exercise
+    "breathing.completed": "That's wonderful - well done for taking that time for yourself. How do you feel now?",
+    # Breathing, step 5: the user did not complete it
+    "breathing.not_completed": "That's okay. What made it difficult for you?",
+    # Breathing, step 5: the user does not want a different exercise
+    "breathing.declined_retry": (
+        "That's completely okay. You showed up for yourself today, and that matters. "
+        "Be gentle with yourself, and come back whenever you need a calm moment."
+    ),
+    # Body scan, Phase 1 -> Phase 2
+    "body_scan.incidents_done": (
+        "Did these incidents create any emotional impact on you? "
+        "Like anxiety, frustration, worry, or hurt?"
+    ),
+}
+
+AWAITING_COMPLETION = "awaiting_completion_answer"
+AWAITING_DIFFICULTY = "awaiting_difficulty"
+AWAITING_RETRY = "awaiting_retry_answer"
+GATHERING_INCIDENTS = "gathering_incidents"
+
+
+class FlowTracker:
+    """
+    Follows one exercise session and answers scripted decision points locally.
+
+    The app calls on_assistant_reply() after every LLM reply and
+    handle_user_message() before sending a user message; when the latter
+    returns a reply, the LLM call is skipped.
+    """
+
+    def __init__(self, exercise: str):
+        self.exercise = exercise
+        self.state = GATHERING_INCIDENTS if exercise == "body_scan" else None
+        # User messages seen while gathering incidents (the first one answers the greeting)
+        self.incident_turns = 0
+        self.llm_calls_avoided = 0
+        self.phases = PhaseTracker(exercise)
+
+    def on_assistant_reply(self, kind: str, text: str):
+        """
+        Advance the flow after the LLM replied.
+
+        Args:
+            kind: Turn type that produced the reply (e.g. "finished_exercise", "chat")
+            text: The reply
+        """
+        self.phases.on_assistant_reply(kind, text)
+        if self.exercise != "breathing":
+            return
+        if kind == "finished_exercise":
+            # The model has just asked whether the exercise was completed
+            self.state = AWAITING_COMPLETION
+        elif self.state == AWAITING_DIFFICULTY:
+            # After listening, the model is scripted to offer a different exercise
+            self.state = AWAITING_RETRY if "different" in text.lower() else None
+
+    def handle_user_message(self, text: str) -> Optional[str]:
+        """
+        Answer the user's message locally if it is a scripted decision.
+
+        Args:
+            text: The user's message
+
+        Returns:
+            The scripted reply, or None if the LLM should respond
+        """
+        if self.state is None or self.state == AWAITING_DIFFICULTY:
+            return None
+
+        intent = classify(text).intent
+        reply_key = None
+
+        if self.state == AWAITING_COMPLETION:
+            if intent == "yes":
+                reply_key, self.state = "breathing.completed", None
+            elif intent == "no":
+                reply_key, self.state = "breathing.not_completed", AWAITING_DIFFICULTY
+            else:
+                self.state = None
+
+        elif self.state == AWAITING_RETRY:
+            # "Yes" needs a newly generated exercise, so only "no" is local
+            if intent == "no":
+                reply_key = "breathing.declined_retry"
+            self.state = None
+
+        elif self.state == GATHERING_INCIDENTS:
+            self.incident_turns += 1
+            # Only conclude Phase 1 once at least one incident question was answered
+            if self.incident_turns > 2 and intent in ("done", "no"):
+                reply_key, self.state = "body_scan.incidents_done", None
+
+        if reply_key is None:
+            return None
+
+        self.llm_calls_avoided += 1
+        self.phases.on_local_reply(reply_key)
+        metrics.incr("fast_path.hit")
+        metrics.incr(f"fast_path.{reply_key}")
+        return SCRIPTED_REPLIES[reply_key]
@@ -0,0 +1,255 @@
+"""
+Group conversations: one user message answered by several personas at once.
+
+For empty-chair work a user may want to speak to more than one person, for
+example both parents. A GroupSession keeps one PersonaChat (and history) per
+persona. A user message is submitted to every persona concurrently on the
+shared worker pool, and the replies come back in the order they finish. A
+round therefore takes as long as the slowest reply, not the sum of all of
+them.
+
+All personas are in the same room: each one's system prompt names the
+others, and after every round each persona's history gets a note with what
+the others replied. The next round can then build on it.
+
+Used by the CLI ('group' command in script.py) and by the /groups
+endpoints of api_server.py. Both screen the user message for crisis signals
+before it is sent (see safety.py); a crisis message is answered once with
+the crisis resources instead of by every persona.
+"""
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import as_completed
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from early_stop import budget_for
+from safety import CRISIS, CRISIS_REPLY, annotate, screen, screening_enabled
+from ledger import TokenLedger
+from script import PersonaChat, build_client
+from workers import CompletionJob, get_pool
+
+
+class GroupReply(NamedTuple):
+    """One persona's answer to a group message."""
+    persona_name: str
+    reply: Optional[str]
+    error: Optional[Exception]
+    seconds: float
+
+
+def group_note(persona_name: str, others: List[str]) -> str:
+    """Line added to a persona description so it knows who else is present."""
+    return (f"\n\nThis is a group conversation. {', '.join(others)} "
+            f"{'is' if len(others) == 1 else 'are'} also here and will answer the user separately. "
+            f"Speak only as {persona_name}; never speak for the others.")
+
+
+class GroupSession:
+    """
+    Several persona conversations driven by the same user messages.
+
+    Args:
+        client: Completion client shared by every persona (built if None)
+        session_id: Owner id for the worker pool, so cancel() stops every reply
+        ledger: Token ledger shared by every persona (see ledger.py); one is
+            made if None, so the session budget covers the whole group
+    """
+
+    def __init__(self, client=None, session_id: Optional[str] = None, ledger: Optional[TokenLedger] = None):
+        self.client = client if client is not None else build_client()
+        self.session_id = session_id or uuid.uuid4().hex
+        self.ledger = ledger if ledger is not None else TokenLedger()
+        self.members: "OrderedDict[str, PersonaChat]" = OrderedDict()
+        self._descriptions: Dict[str, str] = {}
+
+    def add_persona(self, persona_name: str, persona_description: str):
+        """
+        Add a persona to the group.
+
+        Args:
+            persona_name: Name/relationship of the persona; must be unique in the group
+            persona_description: Description of how this persona talks and behaves
+
+        Raises:
+            ValueError: If a persona of that name is already in the group
+        """
+        if persona_name in self.members:
+            raise ValueError(f"{persona_name} is already in the group")
+        chat = PersonaChat(verbose=False, client=self.client, ledger=self.ledger)
+        chat.set_persona_environment(persona_name, persona_description)
+        self.members[persona_name] = chat
+        self._descriptions[persona_name] = persona_description
+        self._introduce()
+
+    def remove_persona(self, persona_name: str):
+        """Take a persona out of the group."""
+        self.members.pop(persona_name, None)
+        self._descriptions.pop(persona_name, None)
+        self._introduce()
+
+    def submit(self, user_message: str) -> Dict[str, CompletionJob]:
+        """
+        Send a message to every persona at once.
+
+        Args:
+            user_message: The message from the user
+
+        Returns:
+            The running job of each persona, by name
+        """
+        pool = get_pool()
+        budget = budget_for(None, "group")
+        return OrderedDict(
+            (name, pool.submit(self.session_id, "group", chat.chat, user_message, sentence_budget=budget))
+            for name, chat in self.members.items()
+        )
+
+    def replies(self, user_message: str) -> Iterator[GroupReply]:
+        """
+        Send a message to every persona and yield their replies as each finishes.
+
+        Once the round is over, every persona is told what the others said
+        (see share_round()).
+
+        Args:
+            user_message: The message from the user
+
+        Yields:
+            GroupReply per persona, fastest first
+        """
+        jobs = self.submit(user_message)
+        names = {job.future: name for name, job in jobs.items()}
+        answered = {}
+        try:
+            for future in as_completed(names):
+                name = names[future]
+                try:
+                    reply = future.result()
+                except Exception as e:
+                    yield GroupReply(name, None, e, jobs[name].elapsed)
+                    continue
+                answered[name] = reply
+                yield GroupReply(name, reply, None, jobs[name].elapsed)
+        finally:
+            # Stopped early by the caller: don't keep paying for the rest
+            for job in jobs.values():
+                if not job.done():
+                    job.cancel()
+        self.share_round(answered)
+
+    def chat(self, user_message: str) -> Dict[str, str]:
+        """
+        Send a message to every persona and wait for all replies.
+
+        Returns:
+            Reply per persona name, in the order the personas were added; a
+            persona whose request failed is left out
+        """
+        replies = {r.persona_name: r.reply for r in self.replies(user_message) if r.error is None}
+        return OrderedDict((name, replies[name]) for name in self.members if name in replies)
+
+    def share_round(self, replies: Dict[str, str]):
+        """
+        Tell every persona what the others replied in the last round.
+
+        Args:
+            replies: Reply per persona name
+        """
+        for name, chat in self.members.items():
+            others = [f"{other} replied: {reply}" for other, reply in replies.items() if other != name]
+            if others:
+                chat.conversation_history.append({"role": "system", "content": "\n\n".join(others)})
+
+    def record_exchange(self, user_message: str, reply: str):
+        """
+        Record the same reply to a message in every persona's history, without calling the API.
+
+        Used for the crisis reply, so every persona knows what was said.
+        """
+        for chat in self.members.values():
+            chat.record_exchange(user_message, reply)
+
+    def reset_conversation(self):
+        """Reset every persona's conversation, keeping the group."""
+        for chat in self.members.values():
+            chat.reset_conversation()
+
+    def cancel(self) -> int:
+        """Cancel every reply still in flight; returns how many were cancelled."""
+        return get_pool().cancel_session(self.session_id)
+
+    def _introduce(self):
+        """Point every persona's system prompt at the current group."""
+        for name, chat in self.members.items():
+            others = [other for other in self.members if other != name]
+            description = self._descriptions[name]
+            if others:
+                description += group_note(name, others)
+            chat.update_persona_description(description)
+
+
+def group_chat_loop(client=None) -> bool:
+    """
+    Interactive group chat for the CLI.
+
+    Args:
+        client: Completion client to share (built if None)
+
+    Returns:
+        True if the user asked to quit the program, False to go back to one-on-one chat
+    """
+    from script import setup_persona_interactive
+
+    group = GroupSession(client=client)
+    while True:
+        try:
+            count = int(input("\nHow many people would you like to talk to at once? (2-5): ").strip() or "2")
+        except ValueError:
+            continue
+        if 2 <= count <= 5:
+            break
+
+    for _ in range(count):
+        persona_name, persona_description = setup_persona_interactive()
+        while persona_name in group.members:
+            persona_name = input(f"{persona_name} is already here - use a different name: ").strip() or persona_name + " 2"
+        group.add_persona(persona_name, persona_description)
+
+    print(f"\n✓ Group ready: {', '.join(group.members)}. Everyone answers at once; replies appear as they arrive.")
+    print("Commands: 'quit' to exit, 'reset' to clear the conversation, 'back' for one-on-one chat\n")
+
+    while True:
+        try:
+            user_input = input("You: ").strip()
+            if not user_input:
+                continue
+            if user_input.lower() in ['quit', 'exit', 'bye']:
+                print("\nGoodbye! Thanks for chatting.\n")
+                return True
+            if user_input.lower() == 'back':
+                return False
+            if user_input.lower() == 'reset':
+                group.reset_conversation()
+                continue
+
+            # Screen first: a crisis message must not go out to every persona
+            screening = screen(user_input) if screening_enabled() else None
+            if screening is not None and screening.level == CRISIS:
+                group.record_exchange(user_input, CRISIS_REPLY)
+                print(f"\n{CRISIS_REPLY}\n")
+                continue
+
+            started = time.monotonic()
+            for reply in group.replies(user_input):
+                if reply.error is not None:
+                    print(f"\n❌ {reply.persona_name.title()} could not answer: {reply.error}")
+                else:
+                    print(f"\n{reply.persona_name.title()}: {reply.reply}")
+            print(annotate("", screening), end="")
+            print(f"\n({time.monotonic() - started:.1f}s for {len(group.members)} replies)\n")
+
+        except KeyboardInterrupt:
+            group.cancel()
+            print("\n\nInterrupted. Goodbye!\n")
+            return True
@@ -0,0 +1,223 @@
+"""
+Conversation history with copy-on-write branches.
+
+A branch of a conversation ("retry that reply", "what if I'd said this
+instead") shares every message before the branch point with the original.
+Copying the list for each branch would make memory grow with the number of
+branches times the conversation length.
+
+ConversationHistory stores messages as a persistent linked list: each node
+points at the message before it, and a history is just a pointer to its
+last node. Forking a history copies that pointer, so:
+- a new branch costs one small object, however long the shared prefix is
+- appending to one branch never touches the others
+- switching branches is swapping one object for another
+
+The leading system prompt is held outside the list, so replacing it (as
+phase-aware prompting does before each turn) stays O(1) and does not copy
+the branch. Other edits in the middle of a history rebuild only the nodes
+after the edit.
+
+It behaves like a list of message dicts (append, pop, indexing, iteration,
+len, ==), so existing callers keep working. Hand list(history) to anything
+that serializes the messages.
+"""
+from collections.abc import MutableSequence, Sequence
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class _Node:
+    """One message and a link to the message before it; never modified once created."""
+    __slots__ = ("message", "parent", "depth")
+
+    def __init__(self, message: Dict[str, str], parent: Optional["_Node"]):
+        self.message = message
+        self.parent = parent
+        self.depth = 1 if parent is None else parent.depth + 1
+
+
+class ConversationHistory(MutableSequence):
+    """
+    A list of chat messages that can be forked without copying.
+
+    Appending and popping at the end are O(1); so are fork() and replacing
+    the leading system prompt. Indexing walks back from the end, which is
+    cheap for the recent messages callers look at.
+
+    Args:
+        messages: Initial messages
+    """
+    __slots__ = ("_system", "_tip")
+
+    def __init__(self, messages: Iterable[Dict[str, str]] = ()):
+        self._system: Optional[Dict[str, str]] = None
+        self._tip: Optional[_Node] = None
+        self.extend(messages)
+
+    def fork(self, length: Optional[int] = None) -> "ConversationHistory":
+        """
+        Start a branch that shares this history's messages.
+
+        Args:
+            length: Number of leading messages the branch keeps (default: all)
+
+        Returns:
+            A new history; changes to either one do not affect the other
+        """
+        branch = ConversationHistory()
+        branch._system = self._system
+        branch._tip = self._tip
+        if length is not None:
+            if not 0 <= length <= len(self):
+                raise IndexError(f"cannot branch at {length} of {len(self)} messages")
+            branch._truncate(length)
+        return branch
+
+    def shares_with(self, other: "ConversationHistory") -> int:
+        """Number of leading messages two histories share without copies."""
+        a, b = self._tip, other._tip
+        while a is not None and b is not None and a is not b:
+            if a.depth >= b.depth:
+                a = a.parent
+            else:
+                b = b.parent
+        shared = a.depth if a is not None and a is b else 0
+        return shared + (self._system is not None and self._system is other._system)
+
+    def _truncate(self, length: int):
+        if length == 0:
+            self._system = None
+        keep = length - (self._system is not None)
+        while self._tip is not None and self._tip.depth > keep:
+            self._tip = self._tip.parent
+
+    def _offset(self) -> int:
+        return 1 if self._system is not None else 0
+
+    def _index(self, index: int) -> int:
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("history index out of range")
+        return index
+
+    def _node_at(self, depth: int) -> _Node:
+        node = self._tip
+        while node.depth > depth:
+            node = node.parent
+        return node
+
+    def _rewrite(self, index: int, replacement: List[Dict[str, str]]):
+        """Copy-on-write: replace the message at index with replacement (0+ messages)."""
+        tail = []
+        while self._tip is not None and self._tip.depth > index - self._offset():
+            tail.append(self._tip.message)
+            self._tip = self._tip.parent
+        tail.reverse()
+        for message in replacement + tail[1:]:
+            self._tip = _Node(message, self._tip)
+
+    def __len__(self) -> int:
+        return self._offset() + (self._tip.depth if self._tip is not None else 0)
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        messages = []
+        node = self._tip
+        while node is not None:
+            messages.append(node.message)
+            node = node.parent
+        if self._system is not None:
+            messages.append(self._system)
+        return reversed(messages)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        index = self._index(index)
+        if self._system is not None and index == 0:
+            return self._system
+        return self._node_at(index - self._offset() + 1).message
+
+    def __setitem__(self, index, message):
+        if isinstance(index, slice):
+            messages = list(self)
+            messages[index] = message
+            self.clear()
+            self.extend(messages)
+            return
+        index = self._index(index)
+        if self._system is not None and index == 0:
+            self._system = message
+        elif index == len(self) - 1:
+            self._tip = _Node(message, self._tip.parent)
+        else:
+            self._rewrite(index, [message])
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            messages = list(self)
+            del messages[index]
+            self.clear()
+            self.extend(messages)
+            return
+        index = self._index(index)
+        if self._system is not None and index == 0:
+            self._system = None
+            # The next message becomes the first; it may be a system prompt itself
+            rest = list(self)
+            self.clear()
+            self.extend(rest)
+        else:
+            self._rewrite(index, [])
+
+    def insert(self, index: int, message: Dict[str, str]):
+        size = len(self)
+        index = max(0, min(size, index + size if index < 0 else index))
+        if index == 0 and self._system is None and message.get("role") == "system":
+            self._system = message
+        elif index == size:
+            self.append(message)
+        elif self._system is not None and index == 0:
+            rest = list(self)
+            self.clear()
+            self.extend([message] + rest)
+        else:
+            self._rewrite(index, [message, self[index]])
+
+    def append(self, message: Dict[str, str]):
+        if self._system is None and self._tip is None and message.get("role") == "system":
+            self._system = message
+        else:
+            self._tip = _Node(message, self._tip)
+
+    def extend(self, messages: Iterable[Dict[str, str]]):
+        for message in messages:
+            self.append(message)
+
+    def pop(self, index: int = -1) -> Dict[str, str]:
+        if index in (-1, len(self) - 1) and self._tip is not None:
+            message = self._tip.message
+            self._tip = self._tip.parent
+            return message
+        message = self[index]
+        del self[index]
+        return message
+
+    def clear(self):
+        self._system = None
+        self._tip = None
+
+    def copy(self) -> "ConversationHistory":
+        return self.fork()
+
+    def __add__(self, other) -> list:
+        return list(self) + list(other)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"ConversationHistory({list(self)!r})"
@@ -0,0 +1,195 @@
+"""
+Fast local intent classifier for short replies at scripted decision points.
+
+The breathing and body-scan flows ask questions whose answers only need to be
+classified, not understood ("Did you complete the breathing exercise?",
+"Would you like to try a different one?", "Was there anything else?").
+classify() recognises those replies locally - first with hand-written rules,
+then with a small lexical model stored in intent_model.json - so the app only
+calls the LLM when a generated response is actually needed.
+
+Intents:
+    yes   - affirmative ("yes", "I did", "sure, let's try")
+    no    - negative ("no", "I couldn't", "not really")
+    done  - nothing more to add ("that's all", "nothing else")
+    other - anything else; the caller should use the LLM
+
+To retrain the lexical model from labelled examples (one JSON object per line
+with "text" and "intent"):
+    python intents.py train examples.jsonl
+"""
+import json
+import math
+import os
+import re
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_model.json")
+
+# Longer replies carry more than a yes/no - leave them to the LLM
+MAX_WORDS = 12
+
+# Minimum lexical-model confidence to act on a prediction
+MIN_CONFIDENCE = 0.8
+
+# Polite filler that may trail a short answer without changing its meaning
+_FILLER = r"(?:\s+(?:thanks|thank you|really|i think|i guess|honestly|sorry|please))*"
+
+# What a short answer may be about: the exercise, or the one just offered
+_OBJECT = (r"(?:it|that|this|one|this one|that one|another(?: one)?|"
+           r"(?:the |this |that |another )?(?:breathing |body scan )?exercise|the breathing)")
+
+# Checked in order; the first match wins. Every rule must match the whole
+# reply, and words after a phrase are limited to _OBJECT and _FILLER, so
+# "I'd like to die" or "nothing more to live for" are never read as a
+# scripted answer. "done" comes first, because "no, that's all" also looks
+# negative, and "no, but my boss..." is left to the LLM.
+_RULES: List[Tuple[str, "re.Pattern"]] = [
+    ("done", re.compile(
+        r"^(?:(?:no+|nope|nah|ok(?:ay)?|so|well|i think)\s+)?"
+        r"(?:that'?s (?:all|it|everything|about it)|(?:there'?s )?nothing (?:else|more)|no more|"
+        r"(?:i )?(?:can'?t|don'?t) think of anything(?: else)?|no other (?:incidents?|situations?))"
+        r"(?:\s+(?:for now|to (?:add|say|share)|i (?:have|can think of)|that happened|happened))?" + _FILLER + r"$"
+    )),
+    ("no", re.compile(
+        r"^(?:no+|nope|nah|not really|not quite|not yet|no thanks|no thank you|"
+        r"i (?:did not|didn'?t|couldn'?t|could not|wasn'?t able to)"
+        r"(?: (?:really|quite|manage to|manage|do|finish|complete|try))*(?: " + _OBJECT + r")?|"
+        r"i'?d rather not|not (?:right )?now|maybe later)" + _FILLER + r"$"
+    )),
+    ("yes", re.compile(
+        r"^(?:y(?:es|eah|ep|up|a)|sure|ok(?:ay)?|of course|definitely|absolutely|"
+        r"i did|i (?:completed|finished)(?: it)?|completed|finished|all done)"
+        r"(?:\s+(?:i did|i (?:completed|finished)(?: it)?|let'?s (?:do|try) " + _OBJECT + r"(?: again)?|"
+        r"i'?d like (?:that|to (?:do|try) " + _OBJECT + r"(?: again)?)))?" + _FILLER + r"$"
+        r"|^(?:let'?s (?:do|try) " + _OBJECT + r"(?: again)?|i'?d like (?:that|to (?:do|try) " + _OBJECT + r"(?: again)?))"
+        + _FILLER + r"$"
+    )),
+]
+
+_TOKEN_RE = re.compile(r"[a-z']+")
+
+
+class IntentResult(NamedTuple):
+    intent: str
+    confidence: float
+    source: str  # "rule", "model" or "none"
+
+
+def _normalize(text: str) -> str:
+    text = text.lower().strip()
+    text = text.replace("’", "'")
+    return re.sub(r"[^\w\s']", " ", text).strip()
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens (apostrophes kept, so "didn't" stays one token)."""
+    return _TOKEN_RE.findall(_normalize(text))
+
+
+def train_model(examples: Iterable[Dict[str, str]], smoothing: float = 1.0) -> Dict:
+    """
+    Train a multinomial naive Bayes model over word tokens.
+
+    Args:
+        examples: Dicts with "text" and "intent"
+        smoothing: Additive (Laplace) smoothing
+
+    Returns:
+        A JSON-serialisable model for classify()
+    """
+    counts: Dict[str, Dict[str, int]] = {}
+    docs: Dict[str, int] = {}
+    vocabulary = set()
+    for example in examples:
+        intent = example["intent"]
+        docs[intent] = docs.get(intent, 0) + 1
+        token_counts = counts.setdefault(intent, {})
+        for token in tokenize(example["text"]):
+            token_counts[token] = token_counts.get(token, 0) + 1
+            vocabulary.add(token)
+
+    total_docs = sum(docs.values())
+    model = {"vocabulary_size": len(vocabulary), "intents": {}}
+    for intent, token_counts in counts.items():
+        total = sum(token_counts.values()) + smoothing * (len(vocabulary) + 1)
+        model["intents"][intent] = {
+            "prior": math.log(docs[intent] / total_docs),
+            "unknown": math.log(smoothing / total),
+            "tokens": {t: round(math.log((c + smoothing) / total), 4) for t, c in sorted(token_counts.items())},
+        }
+    return model
+
+
+_model_cache: Dict[str, Dict] = {}
+
+
+def load_model(path: str = MODEL_PATH) -> Dict:
+    """Load (and cache) the lexical model; an empty model if the file is missing."""
+    if path not in _model_cache:
+        try:
+            with open(path, encoding="utf-8") as f:
+                _model_cache[path] = json.load(f)
+        except FileNotFoundError:
+            _model_cache[path] = {"intents": {}}
+    return _model_cache[path]
+
+
+def _model_predict(tokens: List[str], model: Dict) -> Tuple[str, float]:
+    """Return the most likely intent and its posterior probability."""
+    scores = {}
+    for intent, params in model["intents"].items():
+        weights = params["tokens"]
+        scores[intent] = params["prior"] + sum(weights.get(t, params["unknown"]) for t in tokens)
+    if not scores:
+        return "other", 0.0
+
+    best = max(scores, key=scores.get)
+    # Softmax over log scores for a calibrated-enough confidence
+    top = scores[best]
+    total = sum(math.exp(s - top) for s in scores.values())
+    return best, 1.0 / total
+
+
+def classify(text: str, model: Dict = None) -> IntentResult:
+    """
+    Classify a short reply as yes / no / done / other.
+
+    Args:
+        text: The user's message
+        model: Optional lexical model (defaults to intent_model.json)
+
+    Returns:
+        IntentResult; intent is "other" whenever the LLM should handle the reply
+    """
+    normalized = _normalize(text)
+    tokens = tokenize(text)
+    if not tokens or len(tokens) > MAX_WORDS:
+        return IntentResult("other", 0.0, "none")
+
+    for intent, pattern in _RULES:
+        if pattern.search(normalized):
+            return IntentResult(intent, 1.0, "rule")
+
+    intent, confidence = _model_predict(tokens, model or load_model())
+    if intent == "other" or confidence < MIN_CONFIDENCE:
+        return IntentResult("other", confidence, "none")
+    return IntentResult(intent, confidence, "model")
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] != "train":
+        print("Usage: python intents.py train examples.jsonl")
+        sys.exit(1)
+
+    with open(sys.argv[2], encoding="utf-8") as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+    model = train_model(examples)
+    with open(MODEL_PATH, "w", encoding="utf-8") as f:
+        json.dump(model, f, indent=1, sort_keys=True)
+    print(f"Trained on {len(examples)} examples -> {MODEL_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Token accounting and token budgets per session and per process.
+
+Every PersonaChat keeps a TokenLedger. It counts the tokens each request
+used, and predicts what the next one will cost before it is sent:
+
+- prompt tokens are estimated locally, per message. Counts are cached on
+  the message text, so the system prompt and older messages, which are
+  resent with every turn, are only counted once.
+- once a reply arrives, the estimate is reconciled with the usage the API
+  reports. The ratio between the two corrects later estimates. Streams
+  closed early (see early_stop.py) or cancelled get no usage report; their
+  tokens are taken from the corrected estimate instead.
+
+Budgets (0, the default, means no limit):
+    POCKET_AI_SESSION_TOKEN_BUDGET       tokens one session may use
+    POCKET_AI_PROCESS_TOKENS_PER_HOUR    tokens all sessions of the process
+                                         may use in any hour
+
+Once COMPACT_AT (POCKET_AI_COMPACT_AT, default 0.75) of a budget is spent,
+or the next turn is predicted not to fit in what is left, requests are
+compacted: the system prompt and the opening exchange are kept, and only
+the newest messages that fit in POCKET_AI_COMPACT_TOKENS (default 1500) are
+sent. The history itself is not changed. When a budget is spent, the next
+request raises TokenBudgetExceeded instead of calling the API (a soft stop:
+the turn that crosses the budget still completes).
+
+Totals go to the metrics counters "tokens.*"; the app shows a session's
+ledger in the sidebar.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import metrics
+
+SESSION_TOKEN_BUDGET = int(os.getenv("POCKET_AI_SESSION_TOKEN_BUDGET", "0"))
+PROCESS_TOKENS_PER_HOUR = int(os.getenv("POCKET_AI_PROCESS_TOKENS_PER_HOUR", "0"))
+
+# Share of a budget after which requests are compacted
+COMPACT_AT = float(os.getenv("POCKET_AI_COMPACT_AT", "0.75"))
+
+# Prompt tokens a compacted request is cut down to (the opening exchange is always kept)
+COMPACT_PROMPT_TOKENS = int(os.getenv("POCKET_AI_COMPACT_TOKENS", "1500"))
+
+# gpt-4o-mini list prices, USD per million tokens
+PRICE_PER_MILLION = {"prompt": 0.15, "completion": 0.60}
+
+# Tokens the chat format adds per message and per request
+MESSAGE_OVERHEAD = 4
+REQUEST_OVERHEAD = 3
+
+# Reply length assumed for predictions until a reply has been seen
+DEFAULT_COMPLETION_TOKENS = 80
+
+# Weight of the newest sample in the moving averages
+ALPHA = 0.2
+
+# Cached message counts per ledger before the cache is cleared
+_CACHE_SIZE = 2000
+
+_count: Optional[Callable[[str], int]] = None
+
+
+# Shown in place of a reply once a session's budget is spent
+BUDGET_REPLY = ("We've covered a lot together, and this session has reached its limit for today. "
+                "Take a moment to notice how you feel right now, and come back whenever you're ready.")
+
+
+class TokenBudgetExceeded(Exception):
+    """Raised instead of sending a request once a token budget is spent."""
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in a text; tiktoken when it is installed, else about four characters per token."""
+    global _count
+    if _count is None:
+        try:
+            import tiktoken
+            encoding = tiktoken.get_encoding("o200k_base")
+            _count = lambda t: len(encoding.encode(t))
+        except Exception:
+            from mock_backend import estimate_tokens
+            _count = estimate_tokens
+    return _count(text)
+
+
+class ProcessBudget:
+    """
+    Tokens used by every session of the process over the last hour.
+
+    Args:
+        tokens_per_hour: Budget; 0 for none
+    """
+
+    def __init__(self, tokens_per_hour: int = PROCESS_TOKENS_PER_HOUR):
+        self.tokens_per_hour = tokens_per_hour
+        self._lock = threading.Lock()
+        self._window: Deque[Tuple[float, int]] = deque()
+        self._total = 0
+
+    def add(self, tokens: int):
+        """Count tokens a request used."""
+        with self._lock:
+            self._window.append((time.monotonic(), tokens))
+            self._total += tokens
+            self._prune()
+
+    def used(self) -> int:
+        """Tokens used in the last hour."""
+        with self._lock:
+            self._prune()
+            return self._total
+
+    def remaining(self) -> Optional[int]:
+        """Tokens left this hour, or None without a budget."""
+        if not self.tokens_per_hour:
+            return None
+        return self.tokens_per_hour - self.used()
+
+    def report(self) -> dict:
+        return {"tokens_last_hour": self.used(), "tokens_per_hour": self.tokens_per_hour or None}
+
+    def _prune(self):
+        cutoff = time.monotonic() - 3600
+        while self._window and self._window[0][0] < cutoff:
+            self._total -= self._window.popleft()[1]
+
+
+_process_budget: Optional[ProcessBudget] = None
+_process_budget_lock = threading.Lock()
+
+
+def get_process_budget() -> ProcessBudget:
+    """Return the process-wide budget (POCKET_AI_PROCESS_TOKENS_PER_HOUR)."""
+    global _process_budget
+    with _process_budget_lock:
+        if _process_budget is None:
+            _process_budget = ProcessBudget()
+        return _process_budget
+
+
+class TokenLedger:
+    """
+    Running token counts of one session, and the session's budget.
+
+    One ledger can be shared by several PersonaChats of the same session
+    (e.g. the members of a group, or a new chat after changing exercise).
+
+    Args:
+        budget: Tokens the session may use; 0 for none (default
+            POCKET_AI_SESSION_TOKEN_BUDGET)
+        process: Budget shared with the other sessions (default get_process_budget())
+    """
+
+    def __init__(self, budget: Optional[int] = None, process: Optional[ProcessBudget] = None):
+        self.budget = SESSION_TOKEN_BUDGET if budget is None else budget
+        self.process = process if process is not None else get_process_budget()
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # Requests without a usage report, counted from the estimate
+        self.estimated_requests = 0
+        self.compacted_requests = 0
+        # Reported / estimated prompt tokens, as a moving average
+        self.scale = 1.0
+        # Relative error of the last estimate that could be checked against usage
+        self.last_error: Optional[float] = None
+        self._completion_mean: Optional[float] = None
+
+    @property
+    def spent(self) -> int:
+        """Tokens used so far."""
+        return self.prompt_tokens + self.completion_tokens
+
+    def cost(self) -> float:
+        """Estimated spend so far, in USD."""
+        return (self.prompt_tokens * PRICE_PER_MILLION["prompt"]
+                + self.completion_tokens * PRICE_PER_MILLION["completion"]) / 1_000_000
+
+    def estimate(self, messages: List[Dict[str, str]]) -> int:
+        """Prompt tokens of a request, corrected by the usage seen so far."""
+        return round(self._raw(messages) * self.scale)
+
+    def predict(self, messages: List[Dict[str, str]]) -> int:
+        """Total tokens a request is expected to use: its prompt plus a typical reply."""
+        completion = self._completion_mean if self._completion_mean is not None else DEFAULT_COMPLETION_TOKENS
+        return self.estimate(messages) + round(completion)
+
+    def remaining(self) -> Optional[int]:
+        """Tokens left in the session or process budget, whichever is lower; None without budgets."""
+        session = self.budget - self.spent if self.budget else None
+        left = [r for r in (session, self.process.remaining()) if r is not None]
+        return min(left) if left else None
+
+    def plan(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Check the budgets before a request, compacting it if they are tight.
+
+        Args:
+            messages: The request's messages, system prompt first
+
+        Returns:
+            The messages to send
+
+        Raises:
+            TokenBudgetExceeded: If the session or process budget is spent
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return messages
+        if remaining <= 0:
+            metrics.incr("tokens.soft_stopped")
+            raise TokenBudgetExceeded("The token budget for this session has been used up")
+        if self._under_pressure() or self.predict(messages) > remaining:
+            compacted = self.compact(messages, COMPACT_PROMPT_TOKENS)
+            if len(compacted) < len(messages):
+                with self._lock:
+                    self.compacted_requests += 1
+                metrics.incr("tokens.compacted")
+            return compacted
+        return messages
+
+    def compact(self, messages: List[Dict[str, str]], max_tokens: int) -> List[Dict[str, str]]:
+        """
+        Drop older messages so a request fits in max_tokens.
+
+        The system prompt, the opening exchange (which carries the check-in)
+        and the last message are always kept; in between, the newest
+        messages that fit are.
+        """
+        head = 3 if messages and messages[0]["role"] == "system" else 2
+        if len(messages) <= head + 1:
+            return messages
+        kept = [messages[-1]]
+        used = self._raw(messages[:head] + kept)
+        for message in reversed(messages[head:-1]):
+            used += self._message_tokens(message)
+            if used * self.scale > max_tokens:
+                break
+            kept.append(message)
+        # Start the kept part on a user message, so roles keep alternating
+        while len(kept) > 1 and kept[-1]["role"] != "user":
+            kept.pop()
+        return messages[:head] + kept[::-1]
+
+    def record(self, messages: List[Dict[str, str]], reply: str, usage: Optional[Dict[str, int]]):
+        """
+        Count a finished (or stopped) request.
+
+        Args:
+            messages: The messages that were sent
+            reply: The reply text received
+            usage: Usage reported by the API, or None to use the estimate
+        """
+        raw = self._raw(messages)
+        with self._lock:
+            if usage is not None:
+                prompt, completion = usage["prompt_tokens"], usage["completion_tokens"]
+                if prompt:
+                    self.last_error = (raw * self.scale - prompt) / prompt
+                    self.scale += ALPHA * (prompt / raw - self.scale)
+            else:
+                prompt = round(raw * self.scale)
+                completion = round(count_tokens(reply) * self.scale) if reply else 0
+                self.estimated_requests += 1
+            self.requests += 1
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            if completion:
+                previous = self._completion_mean
+                self._completion_mean = completion if previous is None else previous + ALPHA * (completion - previous)
+        self.process.add(prompt + completion)
+        metrics.incr("tokens.requests")
+        metrics.incr("tokens.prompt", prompt)
+        metrics.incr("tokens.completion", completion)
+        if usage is None:
+            metrics.incr("tokens.estimated")
+
+    def report(self) -> dict:
+        """The ledger as plain numbers, for display."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "estimated_requests": self.estimated_requests,
+                "compacted_requests": self.compacted_requests,
+                "cost_usd": round(self.cost(), 6),
+                "budget": self.budget or None,
+                "estimate_error": None if self.last_error is None else round(self.last_error, 3),
+            }
+
+    def _under_pressure(self) -> bool:
+        if self.budget and self.spent >= COMPACT_AT * self.budget:
+            return True
+        limit = self.process.tokens_per_hour
+        return bool(limit) and self.process.used() >= COMPACT_AT * limit
+
+    def _message_tokens(self, message: Dict[str, str]) -> int:
+        content = message.get("content") or ""
+        count = self._counts.get(content)
+        if count is None:
+            if len(self._counts) >= _CACHE_SIZE:
+                self._counts.clear()
+            count = self._counts[content] = count_tokens(content) + MESSAGE_OVERHEAD
+        return count
+
+    def _raw(self, messages: List[Dict[str, str]]) -> int:
+        return sum(self._message_tokens(m) for m in messages) + REQUEST_OVERHEAD
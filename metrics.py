@@ -0,0 +1,59 @@
+"""
+Simple in-process counters shared by the Streamlit app and helper modules.
+
+Streamlit runs every browser session as a thread inside one process, so a
+module-level store is enough to aggregate numbers across all users.
+"""
+import threading
+from collections import defaultdict
+from typing import Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, int] = defaultdict(int)
+
+
+def incr(name: str, amount: int = 1):
+    """
+    Increment a named counter.
+
+    Args:
+        name: Counter name (e.g. "prefetch.hit")
+        amount: How much to add
+    """
+    with _lock:
+        _counters[name] += amount
+
+
+def get(name: str) -> int:
+    """Return the current value of a counter (0 if it was never incremented)."""
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def ratio(numerator: str, *others: str) -> float:
+    """
+    Return numerator / (numerator + others) for a set of counters.
+
+    Args:
+        numerator: Counter for the "good" outcome (e.g. "prefetch.hit")
+        others: Counters for the remaining outcomes (e.g. "prefetch.wasted")
+
+    Returns:
+        The ratio, or 0.0 if nothing has been counted yet
+    """
+    with _lock:
+        hits = _counters.get(numerator, 0)
+        total = hits + sum(_counters.get(name, 0) for name in others)
+    return hits / total if total else 0.0
+
+
+def snapshot() -> Dict[str, int]:
+    """Return a copy of all counters."""
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    """Clear all counters."""
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,119 @@
+"""
+An offline stand-in for the OpenAI client, used for benchmarks and local runs.
+
+MockOpenAI mimics the small part of the client PersonaChat uses
+(client.chat.completions.create, with and without stream=True) and simulates
+a realistic latency shape: a time-to-first-token that grows with the prompt
+size, then a steady per-token delay.
+
+Enable it for the app, the CLI or the API server with POCKET_AI_BACKEND=mock.
+The latency model can be tuned with:
+    POCKET_AI_MOCK_TTFT_MS          base time to first token (default 300)
+    POCKET_AI_MOCK_PREFILL_US       extra microseconds per prompt token (default 50)
+    POCKET_AI_MOCK_TOKEN_MS         delay per generated token (default 15)
+"""
+import os
+import time
+from types import SimpleNamespace
+from typing import Dict, Iterator, List
+
+MOCK_REPLY = (
+    "I hear you, and I'm glad you shared that with me. "
+    "It makes sense that you feel this way given everything going on. "
+    "Take a slow breath with me - we can look at this together, one step at a time."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def _prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+class _MockStream:
+    """Iterable of chunks with the close() method of openai.Stream."""
+
+    def __init__(self, chunks: Iterator):
+        self._chunks = chunks
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        self._chunks.close()
+
+
+class _MockCompletions:
+    def __init__(self, reply: str, ttft_ms: float, prefill_us: float, token_ms: float):
+        self.reply = reply
+        self.ttft_ms = ttft_ms
+        self.prefill_us = prefill_us
+        self.token_ms = token_ms
+
+    def create(self, model: str, messages: List[Dict[str, str]], max_tokens: int = 500,
+               stream: bool = False, stream_options: Dict = None, **kwargs):
+        prompt_tokens = _prompt_tokens(messages)
+        # Split on spaces so every "token" is a word plus its trailing space
+        words = self.reply.split(" ")
+        pieces = [w + " " for w in words[:-1]] + [words[-1]]
+        pieces = pieces[:max_tokens]
+        ttft = (self.ttft_ms + prompt_tokens * self.prefill_us / 1000) / 1000
+
+        if stream:
+            include_usage = bool(stream_options and stream_options.get("include_usage"))
+            return _MockStream(self._stream(model, pieces, ttft, prompt_tokens, include_usage))
+
+        time.sleep(ttft + len(pieces) * self.token_ms / 1000)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(
+                index=0,
+                message=SimpleNamespace(role="assistant", content="".join(pieces)),
+                finish_reason="stop" if len(pieces) < max_tokens else "length",
+            )],
+            usage=_usage(prompt_tokens, len(pieces)),
+        )
+
+    def _stream(self, model: str, pieces: List[str], ttft: float, prompt_tokens: int,
+                include_usage: bool) -> Iterator:
+        time.sleep(ttft)
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(self.token_ms / 1000)
+            yield SimpleNamespace(
+                model=model,
+                choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=piece), finish_reason=None)],
+                usage=None,
+            )
+        yield SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=None), finish_reason="stop")],
+            usage=None,
+        )
+        if include_usage:
+            yield SimpleNamespace(model=model, choices=[], usage=_usage(prompt_tokens, len(pieces)))
+
+
+class MockOpenAI:
+    """Drop-in replacement for openai.OpenAI that never touches the network."""
+
+    def __init__(self, reply: str = MOCK_REPLY, ttft_ms: float = None, prefill_us: float = None,
+                 token_ms: float = None, **kwargs):
+        completions = _MockCompletions(
+            reply=reply,
+            ttft_ms=ttft_ms if ttft_ms is not None else float(os.getenv("POCKET_AI_MOCK_TTFT_MS", "300")),
+            prefill_us=prefill_us if prefill_us is not None else float(os.getenv("POCKET_AI_MOCK_PREFILL_US", "50")),
+            token_ms=token_ms if token_ms is not None else float(os.getenv("POCKET_AI_MOCK_TOKEN_MS", "15")),
+        )
+        self.chat = SimpleNamespace(completions=completions)
@@ -0,0 +1,113 @@
+"""
+Phase state machine for the multi-phase exercises.
+
+The breathing and body-scan prompts describe a whole scripted flow. Sending
+all of it on every turn costs tokens and lets the model drift between steps.
+PhaseTracker follows the conversation locally and knows which phase the
+session is in. With POCKET_AI_PHASED_PROMPTS=1 the app sends only the
+current phase's instructions in the system prompt (see
+prompts.phase_instructions()).
+
+A phase names what the model should do in its next reply. The tracker moves
+on after assistant replies (by reply count or a scripted question the reply
+contains) and after local fast-path replies (see flows.FlowTracker).
+"""
+import os
+from typing import Optional
+
+# Breathing
+EXERCISE = "exercise"                    # greet, then give ONE exercise as JSON
+PRACTICE = "practice"                    # user is doing it; wait for Finished Exercise
+COMPLETION_ANSWER = "completion_answer"  # user says whether they completed it
+FEELING = "feeling"                      # completed: listen, conclude once
+DIFFICULTY = "difficulty"                # not completed: listen, offer a different one
+RETRY_ANSWER = "retry_answer"            # user says whether they want a different one
+CONCLUDED = "concluded"
+
+# Body scan (the incident phase ends by asking the Phase 2 question)
+INCIDENTS = "incidents"
+CONSOLE = "console"
+CHECK_FEELING = "check_feeling"
+EXPLAIN = "explain"
+CONCLUDE = "conclude"
+
+PHASES = {
+    "breathing": [EXERCISE, PRACTICE, COMPLETION_ANSWER, FEELING, DIFFICULTY, RETRY_ANSWER, CONCLUDED],
+    "body_scan": [INCIDENTS, CONSOLE, CHECK_FEELING, EXPLAIN, CONCLUDE],
+}
+
+# Assistant replies spent consoling before checking how the user feels
+CONSOLE_REPLIES = 3
+
+# Phase entered after each fast-path reply (see flows.SCRIPTED_REPLIES)
+_AFTER_LOCAL_REPLY = {
+    "breathing.completed": FEELING,
+    "breathing.not_completed": DIFFICULTY,
+    "breathing.declined_retry": CONCLUDED,
+    "body_scan.incidents_done": CONSOLE,
+}
+
+
+def phased_prompts_enabled() -> bool:
+    """Return True if only the current phase's instructions should be sent."""
+    return os.getenv("POCKET_AI_PHASED_PROMPTS", "0") == "1"
+
+
+def initial_phase(exercise: str) -> Optional[str]:
+    """First phase of an exercise, or None if it has no phases."""
+    phases = PHASES.get(exercise)
+    return phases[0] if phases else None
+
+
+class PhaseTracker:
+    """Tracks the current phase of one exercise session."""
+
+    def __init__(self, exercise: str):
+        self.exercise = exercise
+        self.phase = initial_phase(exercise)
+        # Assistant replies given in the current phase
+        self.replies_in_phase = 0
+
+    def on_assistant_reply(self, kind: str, text: str):
+        """
+        Advance after an LLM reply.
+
+        Args:
+            kind: Turn type that produced the reply
+            text: The reply
+        """
+        lowered = text.lower()
+        self.replies_in_phase += 1
+
+        if self.exercise == "breathing":
+            if "```json" in lowered:
+                self._enter(PRACTICE)
+            elif kind == "finished_exercise":
+                self._enter(COMPLETION_ANSWER)
+            elif self.phase == COMPLETION_ANSWER:
+                self._enter(DIFFICULTY if "difficult" in lowered else FEELING)
+            elif self.phase == FEELING:
+                self._enter(CONCLUDED)
+            elif self.phase == DIFFICULTY and "different" in lowered:
+                self._enter(RETRY_ANSWER)
+            elif self.phase == RETRY_ANSWER:
+                self._enter(CONCLUDED)
+
+        elif self.exercise == "body_scan":
+            if self.phase == INCIDENTS and "emotional impact" in lowered:
+                self._enter(CONSOLE)
+            elif self.phase == CONSOLE and self.replies_in_phase >= CONSOLE_REPLIES:
+                self._enter(CHECK_FEELING)
+            elif self.phase == CHECK_FEELING:
+                self._enter(EXPLAIN)
+            elif self.phase == EXPLAIN:
+                self._enter(CONCLUDE)
+
+    def on_local_reply(self, reply_key: str):
+        """Advance after the app answered a scripted decision itself."""
+        if reply_key in _AFTER_LOCAL_REPLY:
+            self._enter(_AFTER_LOCAL_REPLY[reply_key])
+
+    def _enter(self, phase: str):
+        self.phase = phase
+        self.replies_in_phase = 0
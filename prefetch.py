@@ -0,0 +1,153 @@
+"""
+Speculative prefetch of predictable next turns.
+
+Some turns are known well before the user triggers them (for example the
+fixed "[SYSTEM: User clicked 'Finished Exercise' ...]" instruction that follows
+a breathing exercise). The prefetcher starts those completions in the
+background and keeps each result together with the exact history it was
+built for. When the turn is actually sent, a matching result is used instead
+of a fresh API call; anything built for a different history is thrown away.
+Each prefetch keeps its own CompletionStats, so it never touches the numbers
+of a live turn on the same PersonaChat.
+"""
+import hashlib
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from early_stop import SentenceBudget
+from script import CompletionStats, PersonaChat
+
+# Shared by all sessions in the process
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+def _history_key(messages: List[Dict[str, str]]) -> str:
+    """Build a stable key for an exact message list."""
+    payload = json.dumps(messages, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class SpeculativePrefetcher:
+    """
+    Holds background completions for turns that are likely to be sent next.
+
+    One prefetcher belongs to one user session. Results are keyed on the full
+    message list (history + the predicted user message), so a result is only
+    ever used for the exact conversation it was generated for.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, Tuple[Future, threading.Event, CompletionStats]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.wasted = 0
+
+    def prefetch(self, chat_system: PersonaChat, user_message: str,
+                 sentence_budget: Optional[SentenceBudget] = None) -> bool:
+        """
+        Start a background completion for a predicted next user message.
+
+        Args:
+            chat_system: The session's PersonaChat (its history is snapshotted)
+            user_message: The message we expect to be sent next
+            sentence_budget: Optional budget for the reply (see early_stop.py)
+
+        Returns:
+            True if a new prefetch was started, False if one already exists
+        """
+        if chat_system is None or not chat_system.system_prompt:
+            return False
+
+        messages = list(chat_system.conversation_history) + [
+            {"role": "user", "content": user_message}
+        ]
+        key = _history_key(messages)
+
+        with self._lock:
+            if key in self._pending:
+                return False
+            cancel_event = threading.Event()
+            stats = CompletionStats()
+            future = _executor.submit(chat_system.complete, messages, cancel_event=cancel_event,
+                                      sentence_budget=sentence_budget, stats=stats)
+            self._pending[key] = (future, cancel_event, stats)
+
+        metrics.incr("prefetch.started")
+        return True
+
+    def chat(self, chat_system: PersonaChat, user_message: str,
+             cancel_event: Optional[threading.Event] = None,
+             sentence_budget: Optional[SentenceBudget] = None,
+             stats: Optional[CompletionStats] = None) -> str:
+        """
+        Send a message, using a prefetched reply when one matches the history.
+
+        Any prefetched result built for a different history is discarded,
+        because the history is about to change and it can never match again.
+
+        Args:
+            chat_system: The session's PersonaChat
+            user_message: The message from the user
+            cancel_event: Optional event that aborts a live request when set
+            sentence_budget: Optional budget for a live reply (see early_stop.py)
+            stats: Optional CompletionStats to fill in; for a prefetched reply,
+                those of the prefetch, with prefetched set
+
+        Returns:
+            The assistant's reply
+        """
+        messages = list(chat_system.conversation_history) + [
+            {"role": "user", "content": user_message}
+        ]
+        match = self._take(_history_key(messages))
+
+        if match is not None:
+            future, prefetch_stats = match
+            try:
+                assistant_message = future.result()
+            except Exception:
+                # The speculative call failed - fall back to a live request
+                metrics.incr("prefetch.failed")
+            else:
+                self.hits += 1
+                metrics.incr("prefetch.hit")
+                if stats is not None:
+                    stats.usage, stats.chunks = prefetch_stats.usage, prefetch_stats.chunks
+                    stats.stopped_early = prefetch_stats.stopped_early
+                    stats.prefetched = True
+                chat_system.record_exchange(user_message, assistant_message)
+                return assistant_message
+
+        return chat_system.chat(user_message, cancel_event=cancel_event, sentence_budget=sentence_budget,
+                                stats=stats)
+
+    def invalidate(self):
+        """Discard every pending prefetch (e.g. when the session is reset)."""
+        self._take(None)
+
+    def hit_rate(self) -> float:
+        """Fraction of prefetched results in this session that were used."""
+        total = self.hits + self.wasted
+        return self.hits / total if total else 0.0
+
+    def _take(self, key: Optional[str]) -> Optional[Tuple[Future, CompletionStats]]:
+        """Pop the entry for key and discard all the others."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        match = pending.pop(key, None) if key is not None else None
+        for future, cancel_event, _ in pending.values():
+            # Not-yet-started calls never run; running ones close their stream
+            future.cancel()
+            cancel_event.set()
+            self.wasted += 1
+            metrics.incr("prefetch.wasted")
+        return (match[0], match[2]) if match else None
+
+
+def global_hit_rate() -> float:
+    """Fraction of prefetched results used across all sessions in the process."""
+    return metrics.ratio("prefetch.hit", "prefetch.wasted")
@@ -0,0 +1,179 @@
+"""
+Opt-in per-rerun profiling for the Streamlit app.
+
+Every interaction re-executes app.py from the top. RerunProfiler times named
+sections of each rerun (step dispatch, JSON scan, rendering, LLM wait) and
+keeps the last few reruns for the debug sidebar panel. It can also capture a
+cProfile of every rerun of one session and write it to disk as a .prof file
+(open it with `python -m pstats`, snakeviz, or convert it to a flame graph
+with flameprof).
+
+Profiling is off unless POCKET_AI_PROFILE=1 is set. Opening the page with
+?profile=1 turns it on for one session only where the operator allowed it
+with POCKET_AI_PROFILE_ALLOWED=1; otherwise any visitor could switch on
+cProfile dumps and fill the disk. cProfile files go to POCKET_AI_PROFILE_DIR
+(default ./profiles); a session keeps only its newest
+POCKET_AI_PROFILE_MAX_FILES (default 50) and deletes older ones.
+
+A rerun can end early through st.rerun(), which skips the end of the script,
+so an unfinished record is closed when the next rerun begins.
+"""
+import cProfile
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+
+PROFILE_DIR = os.getenv("POCKET_AI_PROFILE_DIR", "profiles")
+
+# .prof files kept per session; older ones are deleted
+MAX_PROFILE_FILES = int(os.getenv("POCKET_AI_PROFILE_MAX_FILES", "50"))
+
+# Reruns kept for the sidebar panel
+HISTORY_SIZE = 20
+
+
+def profiling_requested(query_params) -> bool:
+    """Return True if profiling is enabled by environment, or by ?profile=1 where the operator allows it."""
+    if os.getenv("POCKET_AI_PROFILE") == "1":
+        return True
+    return os.getenv("POCKET_AI_PROFILE_ALLOWED") == "1" and query_params.get("profile") == "1"
+
+
+class RerunRecord:
+    """Timings of a single rerun."""
+
+    def __init__(self, number: int, step: str):
+        self.number = number
+        self.step = step
+        self.started = time.perf_counter()
+        self.total: Optional[float] = None
+        self.sections: Dict[str, float] = {}
+        self.open_sections: Dict[str, float] = {}
+
+    def close(self):
+        now = time.perf_counter()
+        for name, started in self.open_sections.items():
+            self.sections[name] = self.sections.get(name, 0.0) + now - started
+        self.open_sections.clear()
+        self.total = now - self.started
+
+
+class RerunProfiler:
+    """
+    Collects section timings for one session's reruns.
+
+    Stored in st.session_state, so it lives as long as the browser session.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.history: Deque[RerunRecord] = deque(maxlen=HISTORY_SIZE)
+        self.current: Optional[RerunRecord] = None
+        self.capture_cprofile = False
+        self.last_llm_seconds: Optional[float] = None
+        self._reruns = 0
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._dumps: Deque[str] = deque()
+
+    def begin(self, step: str):
+        """Start a new rerun, closing the previous one if st.rerun() cut it short."""
+        self.end()
+        self._reruns += 1
+        self.current = RerunRecord(self._reruns, step)
+        if self.capture_cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def end(self):
+        """Finish the current rerun (if any) and dump its cProfile data."""
+        if self.current is None:
+            return
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._dump(self._cprofile, self.current.number)
+            self._cprofile = None
+        self.current.close()
+        self.history.append(self.current)
+        self.current = None
+
+    def start_section(self, name: str):
+        """Start timing a section that cannot be wrapped in a with block."""
+        if self.current is not None:
+            self.current.open_sections[name] = time.perf_counter()
+
+    def stop_section(self, name: str):
+        """Stop timing a section started with start_section()."""
+        if self.current is None or name not in self.current.open_sections:
+            return
+        elapsed = time.perf_counter() - self.current.open_sections.pop(name)
+        self.current.sections[name] = self.current.sections.get(name, 0.0) + elapsed
+
+    @contextmanager
+    def section(self, name: str):
+        """Time a block of the rerun."""
+        self.start_section(name)
+        try:
+            yield
+        finally:
+            self.stop_section(name)
+
+    def summary(self) -> List[Dict]:
+        """Return per-section last/average/max milliseconds over the kept reruns."""
+        names: List[str] = []
+        for record in self.history:
+            for name in ["total"] + list(record.sections):
+                if name not in names:
+                    names.append(name)
+
+        rows = []
+        for name in names:
+            values = [
+                (record.total if name == "total" else record.sections[name]) * 1000
+                for record in self.history
+                if name == "total" or name in record.sections
+            ]
+            rows.append({
+                "section": name,
+                "last_ms": round(values[-1], 1),
+                "avg_ms": round(sum(values) / len(values), 1),
+                "max_ms": round(max(values), 1),
+                "reruns": len(values),
+            })
+        return rows
+
+    def profile_path(self) -> str:
+        """Directory that receives this session's .prof files."""
+        return os.path.join(PROFILE_DIR, self.session_id)
+
+    def _dump(self, profile: cProfile.Profile, number: int):
+        os.makedirs(self.profile_path(), exist_ok=True)
+        path = os.path.join(self.profile_path(), f"rerun-{number:05d}.prof")
+        profile.dump_stats(path)
+        self._dumps.append(path)
+        while len(self._dumps) > MAX_PROFILE_FILES:
+            try:
+                os.remove(self._dumps.popleft())
+            except OSError:
+                pass
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off; every call is a no-op."""
+
+    def begin(self, step: str):
+        pass
+
+    def end(self):
+        pass
+
+    def start_section(self, name: str):
+        pass
+
+    def stop_section(self, name: str):
+        pass
+
+    @contextmanager
+    def section(self, name: str):
+        yield
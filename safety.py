@@ -0,0 +1,168 @@
+"""
+Local crisis-signal screening for user messages.
+
+A remote moderation call in front of every completion would add a second
+round trip to every reply. screen() runs in-process in microseconds, so
+callers submit the completion first and screen the message while the
+request is in flight (see app.py and api_server.py). The screen never
+waits on the network and adds nothing to the time the user waits.
+
+Screening has two stages:
+- a matcher: every pattern below is compiled into one regular expression
+  with a named group per pattern, so a message is scanned once, however
+  many patterns there are
+- a scorer: it weights the matched categories, adds weight for signs of a
+  plan or means, and discounts matches that are negated ("I would never
+  hurt myself") or joking. A joke never takes a statement of acute risk
+  below crisis.
+
+The result has a level:
+    crisis   the reply is pre-empted: the model's answer is cancelled and a
+             pre-authored message with crisis resources is shown instead
+    concern  the model's reply is shown with a short supportive note added
+    none     nothing happens
+
+This is a safety net, not a diagnosis: the patterns favour recall on
+explicit first-person statements, and ambiguous distress only raises a
+concern.
+
+Set POCKET_AI_SAFETY_SCREEN=0 to turn screening off.
+"""
+import os
+import re
+from typing import List, NamedTuple, Tuple
+
+import metrics
+
+CRISIS = "crisis"
+CONCERN = "concern"
+NONE = "none"
+
+# Score at or above which the reply is pre-empted, and at or above which it is annotated
+CRISIS_SCORE = 3.0
+CONCERN_SCORE = 1.0
+
+# (category, weight, pattern); patterns run on lowercased text with straight apostrophes
+PATTERNS: List[Tuple[str, float, str]] = [
+    ("suicide", 3.0, r"\bkill(?:s|ed|ing)? my ?self\b"),
+    ("suicide", 3.0, r"\b(?:end|take|ending|taking) (?:my|my own) life\b"),
+    ("suicide", 3.0, r"\bsuicid(?:e|al)\b"),
+    ("suicide", 3.0, r"\b(?:want|wanna|going|ready|like|rather) (?:to )?(?:die|be dead)\b"),
+    ("suicide", 3.0, r"\bwish (?:i (?:was|were|could be|could|had)|i'?d) (?:dead|die|died)\b"),
+    ("suicide", 3.0, r"\bbetter off (?:dead|without me)\b"),
+    ("suicide", 3.0, r"\b(?:don'?t|do not|didn'?t|did not) want to (?:live|be alive|be here|exist|wake up)\b"),
+    ("suicide", 3.0, r"\b(?:never want to|hope i (?:don'?t|never)) wake up\b"),
+    ("suicide", 3.0, r"\b(?:isn'?t|is not|not|no longer) worth living\b"),
+    ("suicide", 3.0, r"\bnothing (?:more |left )?to live for\b"),
+    ("suicide", 3.0, r"\bkms\b"),
+    ("suicide", 3.0, r"\bend(?:ing)? it all\b"),
+    ("suicide", 2.0, r"\bno (?:reason|point) (?:to|in) (?:live|living|go(?:ing)? on)\b"),
+    ("self_harm", 3.0, r"\b(?:hurt|harm|cut|cutting|burn|burning|hurting|harming) my ?self\b"),
+    ("self_harm", 3.0, r"\bself[- ]?harm(?:ing)?\b"),
+    ("self_harm", 3.0, r"\boverdos(?:e|ed|ing)\b"),
+    ("harm_others", 3.0, r"\b(?:kill|hurt|stab|shoot) (?:him|her|them|someone|somebody|everyone|my (?:\w+ )?(?:boss|wife|husband|partner|mom|mum|dad|father|mother|brother|sister|kids?))\b"),
+    ("abuse", 2.5, r"\b(?:he|she|they) (?:hits?|beats?|hurts?|chokes?|threatens?) me\b"),
+    ("abuse", 2.5, r"\b(?:being|been|was) (?:abused|assaulted|raped)\b"),
+    ("abuse", 2.5, r"\b(?:not|don'?t feel) safe (?:at home|with (?:him|her|them))\b"),
+    ("abuse", 3.0, r"\bafraid for my life\b"),
+    ("hopelessness", 1.0, r"\b(?:hopeless|worthless|no way out)\b"),
+    ("hopelessness", 1.0, r"\bcan'?t (?:go on|take (?:it|this) any ?more|do this any ?more|keep going)\b"),
+    ("hopelessness", 1.0, r"\b(?:i'?m|i am|feel like) (?:a burden|nothing)\b"),
+    ("hopelessness", 1.0, r"\bnothing matters\b"),
+    ("plan", 1.5, r"\b(?:pills|rope|noose|gun|bridge|razor|blade|jump)\b"),
+    ("plan", 1.5, r"\b(?:tonight|a plan|my plan|suicide note|goodbye letter|said (?:my )?goodbyes?)\b"),
+]
+
+# Categories that call for crisis resources on their own
+_ACUTE = {"suicide", "self_harm", "harm_others", "abuse"}
+
+_MATCHER = re.compile("|".join(f"(?P<p{i}>{pattern})" for i, (_, _, pattern) in enumerate(PATTERNS)))
+
+# A negation shortly before a match ("I would never hurt myself")
+_NEGATION = re.compile(r"\b(?:never|not|no|don'?t|won'?t|wouldn'?t|didn'?t|isn'?t|aren'?t)\b(?:\s+\w+){0,2}\s*$")
+
+# Discounted, but never below crisis for an acute statement: jokes can hide a real signal
+_JOKING = re.compile(r"\b(?:lol|lmao|haha+|jk|just kidding|joking)\b")
+
+# Weight kept for a negated match, and for a joking message
+NEGATED_WEIGHT = 0.2
+JOKING_FACTOR = 0.5
+
+CRISIS_REPLY = (
+    "I'm really glad you told me, and I'm taking what you said seriously. "
+    "You don't have to go through this alone, and you deserve support from a real person right now.\n\n"
+    "- If you are in immediate danger, please call your local emergency number.\n"
+    "- In the US, call or text **988** (Suicide & Crisis Lifeline).\n"
+    "- In the UK and Ireland, call Samaritans on **116 123**.\n"
+    "- Elsewhere, **findahelpline.com** lists free, confidential helplines near you.\n\n"
+    "If you can, reach out to someone you trust and let them know how you're feeling. "
+    "I'm still here if you'd like to keep talking."
+)
+
+CONCERN_NOTE = (
+    "\n\n---\n*It sounds like you're carrying a lot right now. If it ever feels like too much, "
+    "you can reach a free, confidential helpline at findahelpline.com.*"
+)
+
+
+class ScreenResult(NamedTuple):
+    level: str
+    score: float
+    categories: Tuple[str, ...]
+
+
+def screening_enabled() -> bool:
+    """Return True unless screening was turned off with POCKET_AI_SAFETY_SCREEN=0."""
+    return os.getenv("POCKET_AI_SAFETY_SCREEN", "1") != "0"
+
+
+def _normalize(text: str) -> str:
+    return text.lower().replace("’", "'")
+
+
+def screen(text: str) -> ScreenResult:
+    """
+    Screen one user message.
+
+    Args:
+        text: The user's message
+
+    Returns:
+        The level, the score and the categories that matched
+    """
+    text = _normalize(text)
+    weights = {}
+    for match in _MATCHER.finditer(text):
+        category, weight, _ = PATTERNS[int(match.lastgroup[1:])]
+        if _NEGATION.search(text, max(0, match.start() - 40), match.start()):
+            weight *= NEGATED_WEIGHT
+        # Repeating a category does not add up; the strongest match counts
+        weights[category] = max(weights.get(category, 0.0), weight)
+
+    plan = weights.pop("plan", 0.0)
+    score = sum(weights.values())
+    # Means or timing only matter alongside a statement of intent
+    if any(weights.get(c, 0.0) >= 1.0 for c in ("suicide", "self_harm")):
+        score += plan
+    acute = any(weights.get(c, 0.0) >= CRISIS_SCORE for c in _ACUTE)
+    if score and _JOKING.search(text):
+        score = max(score * JOKING_FACTOR, CRISIS_SCORE if acute else 0.0)
+
+    if score >= CRISIS_SCORE and (acute or plan):
+        level = CRISIS
+    elif score >= CONCERN_SCORE:
+        level = CONCERN
+    else:
+        level = NONE
+
+    metrics.incr("safety.screened")
+    if level != NONE:
+        metrics.incr(f"safety.{level}")
+    return ScreenResult(level, round(score, 2), tuple(sorted(weights)))
+
+
+def annotate(reply: str, result: ScreenResult) -> str:
+    """Add the supportive note to a reply when the message raised a concern."""
+    if result is not None and result.level == CONCERN:
+        return reply + CONCERN_NOTE
+    return reply
@@ -1,11 +1,105 @@
 import os
+import threading
 from openai import OpenAI
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional
 from dotenv import load_dotenv
+import metrics
+from early_stop import SentenceBudget, SentenceWatcher
+from history import ConversationHistory
+from ledger import TokenBudgetExceeded, TokenLedger
+from prompts import persona_preamble
+from safety import CRISIS, CRISIS_REPLY, annotate, screen, screening_enabled
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Name of the branch every conversation starts on
+MAIN_BRANCH = "main"
+
+# Hard limit for a single API request, so a stalled upstream eventually fails
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("POCKET_AI_REQUEST_TIMEOUT", "60"))
+
+
+class CompletionCancelled(Exception):
+    """Raised when an in-flight completion is cancelled by its owner."""
+
+
+class CompletionStats:
+    """
+    What one completion did, filled in while it runs.
+
+    Pass one to chat(), complete() or stream_complete() to read the numbers of
+    that call. Each call has its own, so a prefetch running on the same
+    PersonaChat (see prefetch.py) cannot overwrite a live turn's numbers.
+    """
+
+    def __init__(self):
+        # Token usage reported by the API; None for a stream closed early or cancelled
+        self.usage: Optional[Dict[str, int]] = None
+        # Whether the streamed reply was cut at its sentence budget, and its chunk count
+        self.stopped_early = False
+        self.chunks = 0
+        # Whether the reply was a prefetched one rather than a request of its own
+        self.prefetched = False
+
+
+def _usage_dict(usage) -> Optional[Dict[str, int]]:
+    """Convert an API usage object into a plain dict."""
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+    }
+
+
+def build_client(api_key: str = None):
+    """
+    Build the completion client selected by POCKET_AI_BACKEND.
+    
+    Backends:
+        openai (default)          the hosted OpenAI API
+        mock                      offline MockOpenAI (see mock_backend.py)
+        record                    OpenAI, recording to POCKET_AI_CASSETTE (see cassette.py)
+        replay / replay-realtime  serve POCKET_AI_CASSETTE without the network
+        local                     an OpenAI-compatible server at POCKET_AI_BASE_URL (see backends.py)
+        routed                    failover and latency routing over POCKET_AI_BACKENDS (see backends.py)
+    
+    Args:
+        api_key: OpenAI API key. If None, will use OPENAI_API_KEY env variable.
+        
+    Returns:
+        An object exposing chat.completions.create()
+    """
+    backend = os.getenv("POCKET_AI_BACKEND", "openai")
+    
+    if backend == "mock":
+        from mock_backend import MockOpenAI
+        return MockOpenAI()
+    
+    if backend in ("replay", "replay-realtime"):
+        from cassette import ReplayClient
+        return ReplayClient(os.environ["POCKET_AI_CASSETTE"], realtime=backend == "replay-realtime")
+    
+    if backend == "local":
+        from backends import local_client
+        return local_client(REQUEST_TIMEOUT_SECONDS)
+    
+    if backend == "routed":
+        from backends import routed_client
+        return routed_client(REQUEST_TIMEOUT_SECONDS)
+    
+    if api_key:
+        client = OpenAI(api_key=api_key, timeout=REQUEST_TIMEOUT_SECONDS)
+    else:
+        client = OpenAI(timeout=REQUEST_TIMEOUT_SECONDS)  # Uses OPENAI_API_KEY env variable
+    
+    if backend == "record":
+        from cassette import RecordingClient
+        return RecordingClient(client, os.environ["POCKET_AI_CASSETTE"])
+    return client
+
 
 class PersonaChat:
     """
@@ -14,62 +108,76 @@ class PersonaChat:
     and how that person communicates.
     """
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, verbose: bool = True, client=None,
+                 ledger: Optional[TokenLedger] = None):
         """
         Initialize the PersonaChat with OpenAI API key.
         
         Args:
             api_key: OpenAI API key. If None, will use OPENAI_API_KEY env variable.
+            verbose: Print status messages (set to False for batch/server use)
+            client: Optional pre-built client exposing chat.completions.create().
+                If None, one is built by build_client().
+            ledger: Token ledger to count requests in, e.g. one shared by a
+                whole session (see ledger.py). If None, the chat gets its own.
         """
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
-        else:
-            self.client = OpenAI()  # Uses OPENAI_API_KEY env variable
+        self.client = client if client is not None else build_client(api_key)
         
-        self.conversation_history: List[Dict[str, str]] = []
         self.system_prompt: str = ""
         self.persona_name: str = ""
+        self.verbose = verbose
+        self._start_history([])
+        self.ledger = ledger if ledger is not None else TokenLedger()
     
-    def set_persona_environment(self, persona_name: str, persona_description: str):
+    def set_persona_environment(self, persona_name: str, persona_description: str, compact: Optional[bool] = None):
         """
         Set the AI environment based on the persona the user wants to talk to.
         
         Args:
             persona_name: Name/relationship of the persona (e.g., "father", "mother", "best friend")
             persona_description: Description of how this persona talks and behaves
+            compact: Use the short role preamble (defaults to POCKET_AI_PROMPT_MODE, see prompts.py)
         """
         self.persona_name = persona_name
         
         # Create a detailed system prompt based on the persona
-        self.system_prompt = f"""You are now role-playing as the user's {persona_name}.
-
-Persona Description:
-{persona_description}
-
-Important Instructions:
-- Stay in character as the {persona_name} at all times
-- Match the communication style described above
-- Be authentic and natural in your responses
-- Show care and concern appropriate to this relationship
-- Only reference information explicitly shared by the user - do NOT invent memories, past events, or experiences
-- Respond as this person would actually respond
-
-Remember: You ARE the {persona_name}. Respond directly as them, not as an AI describing them."""
+        self.system_prompt = persona_preamble(persona_name, persona_description, compact)
         
         # Initialize conversation with system prompt
-        self.conversation_history = [
-            {"role": "system", "content": self.system_prompt}
-        ]
+        self._start_history([{"role": "system", "content": self.system_prompt}])
+        
+        if self.verbose:
+            print(f"\n✓ Environment set successfully! You are now chatting with your {persona_name}.")
+            print(f"{'='*60}\n")
+    
+    def update_persona_description(self, persona_description: str, compact: Optional[bool] = None):
+        """
+        Replace the persona description but keep the conversation.
         
-        print(f"\n✓ Environment set successfully! You are now chatting with your {persona_name}.")
-        print(f"{'='*60}\n")
+        Used by phase-aware prompting, which swaps the instructions as the
+        exercise moves from one phase to the next.
+        
+        Args:
+            persona_description: New description of how the persona talks and behaves
+            compact: Use the short role preamble (defaults to POCKET_AI_PROMPT_MODE, see prompts.py)
+        """
+        self.system_prompt = persona_preamble(self.persona_name, persona_description, compact)
+        if self.conversation_history and self.conversation_history[0]["role"] == "system":
+            self.conversation_history[0] = {"role": "system", "content": self.system_prompt}
+        else:
+            self.conversation_history.insert(0, {"role": "system", "content": self.system_prompt})
     
-    def chat(self, user_message: str) -> str:
+    def chat(self, user_message: str, cancel_event: Optional[threading.Event] = None,
+             sentence_budget: Optional[SentenceBudget] = None,
+             stats: Optional[CompletionStats] = None) -> str:
         """
         Send a message and get a response from the persona.
         
         Args:
             user_message: The message from the user
+            cancel_event: Optional event; setting it aborts the request (see complete())
+            sentence_budget: Optional budget; the reply is cut once it is reached (see complete())
+            stats: Optional CompletionStats to fill in for this request
             
         Returns:
             The AI's response as the persona
@@ -77,48 +185,307 @@ Remember: You ARE the {persona_name}. Respond directly as them, not as an AI des
         if not self.system_prompt:
             return "Error: Please set up a persona environment first using set_persona_environment()"
         
+        # Hold on to this history: if the conversation is reset while the
+        # request is in flight, the late reply must not leak into the new one
+        history = self.conversation_history
+        
         # Add user message to conversation history
-        self.conversation_history.append({
+        history.append({
             "role": "user",
             "content": user_message
         })
         
         # Get response from OpenAI
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",  # You can change to "gpt-3.5-turbo" for faster/cheaper responses
-            messages=self.conversation_history,
-            temperature=0.8,  # Slightly higher for more natural, varied responses
-            max_tokens=500
-        )
-        
-        # Extract the assistant's reply
-        assistant_message = response.choices[0].message.content
+        try:
+            assistant_message = self.complete(list(history), cancel_event=cancel_event,
+                                              sentence_budget=sentence_budget, stats=stats)
+        except (CompletionCancelled, TokenBudgetExceeded):
+            # Keep the history consistent - the turn never happened
+            history.pop()
+            raise
         
         # Add assistant's response to conversation history
-        self.conversation_history.append({
+        history.append({
             "role": "assistant",
             "content": assistant_message
         })
         
         return assistant_message
     
+    def complete(self, messages: List[Dict[str, str]],
+                 cancel_event: Optional[threading.Event] = None,
+                 sentence_budget: Optional[SentenceBudget] = None,
+                 stats: Optional[CompletionStats] = None) -> str:
+        """
+        Run a completion against an explicit message list.
+        
+        Unlike chat(), this does not touch the conversation history, so it is
+        safe to call from a background thread (e.g. for speculative prefetch).
+        
+        When a cancel_event is given the reply is streamed, so that setting the
+        event closes the upstream connection between chunks instead of waiting
+        for (and paying for) the full reply. A sentence budget streams too, so
+        the reply can be cut once it is long enough (see early_stop.py).
+        
+        Every request is counted in the ledger, which may also compact it
+        or refuse it when a token budget is tight (see ledger.py).
+        
+        Args:
+            messages: Full message list to send, including the system prompt
+            cancel_event: Optional event that aborts the request when set
+            sentence_budget: Optional budget; the stream is closed once it is reached
+            stats: Optional CompletionStats to fill in for this request
+            
+        Returns:
+            The assistant's reply text
+            
+        Raises:
+            CompletionCancelled: If cancel_event was set before the reply finished
+            TokenBudgetExceeded: If the session's token budget is spent
+        """
+        if cancel_event is None and sentence_budget is None:
+            stats = stats if stats is not None else CompletionStats()
+            messages = self.ledger.plan(messages)
+            response = self.client.chat.completions.create(
+                model="gpt-4o-mini",  # You can change to "gpt-3.5-turbo" for faster/cheaper responses
+                messages=messages,
+                temperature=0.8,  # Slightly higher for more natural, varied responses
+                max_tokens=500
+            )
+            stats.usage = _usage_dict(response.usage)
+            
+            # Extract the assistant's reply
+            reply = response.choices[0].message.content
+            self.ledger.record(messages, reply or "", stats.usage)
+            return reply
+        
+        return "".join(self.stream_complete(messages, cancel_event=cancel_event,
+                                            sentence_budget=sentence_budget, stats=stats))
+    
+    def stream_complete(self, messages: List[Dict[str, str]],
+                        cancel_event: Optional[threading.Event] = None,
+                        sentence_budget: Optional[SentenceBudget] = None,
+                        stats: Optional[CompletionStats] = None) -> Iterator[str]:
+        """
+        Stream a completion against an explicit message list.
+        
+        Args:
+            messages: Full message list to send, including the system prompt
+            cancel_event: Optional event that aborts the request when set
+            sentence_budget: Optional budget; the stream is closed once it is
+                reached, never inside exercise JSON (see early_stop.py)
+            stats: Optional CompletionStats to fill in for this request
+            
+        Yields:
+            Pieces of the assistant's reply as they arrive
+            
+        Raises:
+            CompletionCancelled: If cancel_event was set before the reply finished
+            TokenBudgetExceeded: If the session's token budget is spent
+        """
+        if cancel_event is not None and cancel_event.is_set():
+            raise CompletionCancelled()
+        messages = self.ledger.plan(messages)
+        
+        watcher = SentenceWatcher(sentence_budget) if sentence_budget is not None else None
+        stats = stats if stats is not None else CompletionStats()
+        
+        stream = self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.8,
+            max_tokens=500,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        parts = []
+        try:
+            for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CompletionCancelled()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    piece = chunk.choices[0].delta.content
+                    stats.chunks += 1
+                    cut = watcher.feed(piece) if watcher is not None else None
+                    if cut is not None:
+                        if piece[:cut]:
+                            parts.append(piece[:cut])
+                            yield piece[:cut]
+                        stats.stopped_early = True
+                        metrics.incr("early_stop.stopped")
+                        return
+                    parts.append(piece)
+                    yield piece
+                if getattr(chunk, "usage", None):
+                    stats.usage = _usage_dict(chunk.usage)
+        finally:
+            # Closing the stream drops the upstream connection
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            # Without a usage report (stopped or cancelled) the ledger estimates
+            self.ledger.record(messages, "".join(parts), stats.usage)
+    
+    def stream_chat(self, user_message: str,
+                    cancel_event: Optional[threading.Event] = None,
+                    sentence_budget: Optional[SentenceBudget] = None) -> Iterator[str]:
+        """
+        Send a message and yield the persona's reply as it is generated.
+        
+        The full reply is added to the history once the stream finishes. If the
+        caller stops iterating early (e.g. the client disconnected), the turn is
+        dropped from the history.
+        
+        Args:
+            user_message: The message from the user
+            cancel_event: Optional event that aborts the request when set
+            sentence_budget: Optional budget; the reply is cut once it is reached
+            
+        Yields:
+            Pieces of the AI's response as the persona
+        """
+        if not self.system_prompt:
+            yield "Error: Please set up a persona environment first using set_persona_environment()"
+            return
+        
+        history = self.conversation_history
+        history.append({"role": "user", "content": user_message})
+        
+        parts = []
+        pieces = self.stream_complete(list(history), cancel_event=cancel_event, sentence_budget=sentence_budget)
+        try:
+            for piece in pieces:
+                parts.append(piece)
+                yield piece
+        except BaseException:
+            # Cancelled, failed or abandoned by the caller - the turn never happened
+            history.pop()
+            raise
+        finally:
+            pieces.close()
+        
+        history.append({"role": "assistant", "content": "".join(parts)})
+    
+    def record_exchange(self, user_message: str, assistant_message: str):
+        """
+        Append a user/assistant exchange to the history without calling the API.
+        
+        Args:
+            user_message: The message from the user
+            assistant_message: The reply to record for it
+        """
+        self.conversation_history.append({"role": "user", "content": user_message})
+        self.conversation_history.append({"role": "assistant", "content": assistant_message})
+    
+    def settle_exchange(self, user_message: str, assistant_message: str):
+        """
+        Make the last exchange read user_message -> assistant_message.
+        
+        Used when a reply is replaced after its request was cancelled or had
+        already finished: the history may hold the user message alone, the
+        user message and the discarded reply, or neither.
+        
+        Args:
+            user_message: The message from the user
+            assistant_message: The reply that was shown for it
+        """
+        history = self.conversation_history
+        user_entry = {"role": "user", "content": user_message}
+        assistant_entry = {"role": "assistant", "content": assistant_message}
+        if len(history) >= 2 and history[-2] == user_entry and history[-1]["role"] == "assistant":
+            history[-1] = assistant_entry
+        elif history and history[-1] == user_entry:
+            history.append(assistant_entry)
+        else:
+            history.extend([user_entry, assistant_entry])
+    
+    def branch(self, keep: Optional[int] = None, name: Optional[str] = None) -> str:
+        """
+        Start a new branch of the conversation and switch to it.
+        
+        The branch shares the kept messages with the branch it came from
+        instead of copying them (see history.py), so branching and switching
+        are cheap however long the conversation is. A request still in
+        flight on the old branch finishes there.
+        
+        Args:
+            keep: Number of leading messages to keep, counting the system
+                prompt (default: all). E.g. len(conversation_history) - 2
+                drops the last exchange, to retry it.
+            name: Name of the new branch (default: "branch 1", "branch 2", ...)
+            
+        Returns:
+            The new branch's name
+            
+        Raises:
+            ValueError: If a branch of that name already exists
+            IndexError: If keep is out of range
+        """
+        if name is None:
+            number = len(self.branches)
+            while f"branch {number}" in self.branches:
+                number += 1
+            name = f"branch {number}"
+        if name in self.branches:
+            raise ValueError(f"A branch named {name!r} already exists")
+        self.branches[name] = self.conversation_history.fork(keep)
+        self.switch_branch(name)
+        return name
+    
+    def switch_branch(self, name: str):
+        """
+        Continue the conversation on another branch.
+        
+        Raises:
+            KeyError: If there is no branch of that name
+        """
+        self.conversation_history = self.branches[name]
+        self.active_branch = name
+    
+    def delete_branch(self, name: str):
+        """
+        Drop a branch; messages it shares with other branches are kept.
+        
+        Raises:
+            ValueError: If it is the active branch
+        """
+        if name == self.active_branch:
+            raise ValueError("Cannot delete the active branch")
+        self.branches.pop(name, None)
+    
+    def turn_key(self, user_message: str) -> tuple:
+        """
+        Identify a turn for duplicate detection (see CompletionPool.submit_turn()).
+        
+        The same message on the same branch is a repeat; on a new branch,
+        e.g. to retry a reply, it is a new turn.
+        """
+        return (self.active_branch, user_message)
+    
+    def _start_history(self, messages: List[Dict[str, str]]):
+        """Start a fresh conversation with a single branch."""
+        self.conversation_history = ConversationHistory(messages)
+        self.branches: Dict[str, ConversationHistory] = {MAIN_BRANCH: self.conversation_history}
+        self.active_branch = MAIN_BRANCH
+    
     def reset_conversation(self):
-        """Reset the conversation while keeping the same persona."""
+        """Reset the conversation (dropping its branches) while keeping the same persona."""
         if self.system_prompt:
-            self.conversation_history = [
-                {"role": "system", "content": self.system_prompt}
-            ]
-            print(f"\n✓ Conversation reset. Still chatting with your {self.persona_name}.\n")
+            self._start_history([{"role": "system", "content": self.system_prompt}])
+            if self.verbose:
+                print(f"\n✓ Conversation reset. Still chatting with your {self.persona_name}.\n")
         else:
-            self.conversation_history = []
-            print("\n✓ Conversation reset.\n")
+            self._start_history([])
+            if self.verbose:
+                print("\n✓ Conversation reset.\n")
     
     def change_persona(self):
         """Clear the current persona to set up a new one."""
-        self.conversation_history = []
+        self._start_history([])
         self.system_prompt = ""
         self.persona_name = ""
-        print("\n✓ Persona cleared. Ready to set up a new environment.\n")
+        if self.verbose:
+            print("\n✓ Persona cleared. Ready to set up a new environment.\n")
 
 
 def setup_persona_interactive() -> tuple:
@@ -203,7 +570,10 @@ def main():
     
     # Chat loop
     print(f"Start chatting with your {persona_name}!")
-    print("Commands: 'quit' to exit, 'reset' to clear conversation, 'new' for new persona\n")
+    print("Commands: 'quit' to exit, 'reset' to clear conversation, 'new' for new persona, "
+          "'group' to talk to several people at once, 'retry' for another answer to your last message, "
+          "'branches' to list or 'switch NAME' to go back to an earlier version of the conversation, "
+          "'tokens' for the tokens used so far\n")
     
     while True:
         try:
@@ -228,9 +598,59 @@ def main():
                 chat_system.set_persona_environment(persona_name, persona_description)
                 continue
             
+            elif user_input.lower() == 'retry':
+                history = chat_system.conversation_history
+                if len(history) < 3 or history[-2]["role"] != "user":
+                    print("\nNothing to retry yet.\n")
+                    continue
+                last_message = history[-2]["content"]
+                previous = chat_system.active_branch
+                name = chat_system.branch(keep=len(history) - 2)
+                print(f"\n(Retrying on {name}; 'switch {previous}' goes back)")
+                response = chat_system.chat(last_message)
+                print(f"\n{persona_name.title()}: {response}\n")
+                continue
+            
+            elif user_input.lower() == 'branches':
+                for name, history in chat_system.branches.items():
+                    marker = "*" if name == chat_system.active_branch else " "
+                    print(f" {marker} {name} ({len(history)} messages)")
+                print()
+                continue
+            
+            elif user_input.lower().startswith('switch '):
+                name = user_input[len('switch '):].strip()
+                if name not in chat_system.branches:
+                    print(f"\nNo branch named {name!r}; type 'branches' to list them.\n")
+                    continue
+                chat_system.switch_branch(name)
+                print(f"\nNow on {name}.\n")
+                continue
+            
+            elif user_input.lower() == 'tokens':
+                ledger = chat_system.ledger
+                print(f"\n{ledger.requests} requests: {ledger.prompt_tokens} prompt + "
+                      f"{ledger.completion_tokens} reply tokens (about ${ledger.cost():.4f})")
+                print(f"Next message costs about {ledger.predict(list(chat_system.conversation_history))} tokens\n")
+                continue
+            
+            elif user_input.lower() == 'group':
+                from group import group_chat_loop
+                if group_chat_loop(chat_system.client):
+                    break
+                print(f"\nBack to chatting with your {persona_name}.\n")
+                continue
+            
+            # Screen for crisis signals; a crisis message is answered with crisis resources, not by the model
+            screening = screen(user_input) if screening_enabled() else None
+            if screening is not None and screening.level == CRISIS:
+                chat_system.record_exchange(user_input, CRISIS_REPLY)
+                print(f"\n{CRISIS_REPLY}\n")
+                continue
+            
             # Get and display response
             response = chat_system.chat(user_input)
-            print(f"\n{persona_name.title()}: {response}\n")
+            print(f"\n{persona_name.title()}: {annotate(response, screening)}\n")
             
         except KeyboardInterrupt:
             print("\n\nInterrupted. Goodbye!\n")
@@ -241,7 +661,8 @@ def main():
 
 
 # Example usage for integration into a larger application
-def create_persona_session(persona_name: str, persona_description: str, api_key: str = None) -> PersonaChat:
+def create_persona_session(persona_name: str, persona_description: str, api_key: str = None,
+                           verbose: bool = True, client=None) -> PersonaChat:
     """
     Programmatic way to create a persona chat session.
     Use this when integrating into a larger application where you already
@@ -251,6 +672,8 @@ def create_persona_session(persona_name: str, persona_description: str, api_key:
         persona_name: Name/relationship of the persona
         persona_description: Description of the persona's communication style
         api_key: Optional OpenAI API key
+        verbose: Print status messages (set to False for batch/server use)
+        client: Optional client to share between sessions (see PersonaChat)
         
     Returns:
         Configured PersonaChat instance ready to use
@@ -263,7 +686,7 @@ def create_persona_session(persona_name: str, persona_description: str, api_key:
         >>> response = chat.chat("Hey, how are you doing?")
         >>> print(response)
     """
-    chat = PersonaChat(api_key=api_key)
+    chat = PersonaChat(api_key=api_key, verbose=verbose, client=client)
     chat.set_persona_environment(persona_name, persona_description)
     return chat
 
@@ -0,0 +1,29 @@
+"""Tests for the Parquet event files (analytics.py) and their report (analytics_report.py)."""
+import os
+
+from analytics import EventSink
+from analytics_report import funnel, load
+
+
+def test_load_skips_temporary_files(tmp_path):
+    sink = EventSink(str(tmp_path), flush_seconds=3600)
+    sink.record("checkin", "s1", mood_rating=3)
+    sink.record("selection", "s1", exercise="breathing")
+    sink.flush()
+    # Left behind by a writer that crashed mid-flush, before and after temp files were hidden
+    for name in ("events-20260101-000000-1-1.parquet.tmp", ".events-20260101-000000-1-2.parquet.tmp"):
+        (tmp_path / name).write_bytes(b"partial")
+
+    events = load(str(tmp_path))
+
+    assert events.num_rows == 2
+    assert [row["sessions"] for row in funnel(events)][:2] == [1, 1]
+
+
+def test_flush_leaves_no_temporary_file(tmp_path):
+    sink = EventSink(str(tmp_path), flush_seconds=3600)
+    sink.record("checkin", "s1", mood_rating=3)
+    sink.flush()
+
+    names = os.listdir(tmp_path)
+    assert len(names) == 1 and names[0].startswith("events-") and names[0].endswith(".parquet")
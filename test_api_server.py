@@ -0,0 +1,26 @@
+"""Tests for the HTTP API (api_server.py)."""
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import api_server
+from mock_backend import MockOpenAI
+
+
+@pytest.mark.parametrize("body", ["[]", '"hi"', "1", "null", "{"])
+def test_body_that_is_not_a_json_object_is_rejected(monkeypatch, body):
+    monkeypatch.setattr(api_server, "get_shared_client", lambda: MockOpenAI(ttft_ms=0, prefill_us=0, token_ms=0))
+    monkeypatch.setattr(api_server, "_warm_up_in_background", lambda: None)
+
+    async def run():
+        async with TestClient(TestServer(api_server.create_app())) as http:
+            session_id = http.server.app["sessions"].create("mom", "kind").id
+            responses = []
+            for path in ("/sessions", "/groups", f"/sessions/{session_id}/messages"):
+                response = await http.post(path, data=body, headers={"Content-Type": "application/json"})
+                responses.append((response.status, await response.json()))
+            return responses
+
+    for status, payload in asyncio.run(run()):
+        assert status == 400 and payload == {"error": "Body must be JSON"}
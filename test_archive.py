@@ -0,0 +1,44 @@
+"""Tests for the past sessions archive (archive.py)."""
+import pytest
+
+import archive
+from archive import SessionArchive, WeakArchiveKey, new_archive_key, user_id_for
+
+
+@pytest.mark.parametrize("key", ["1234", "password", "aaaaaaaaaaaaaaaaaaaa", "  short key   "])
+def test_weak_keys_are_rejected(key):
+    with pytest.raises(WeakArchiveKey):
+        user_id_for(key)
+
+
+def test_user_id_depends_on_the_server_secret(monkeypatch):
+    key = new_archive_key()
+    monkeypatch.setenv("POCKET_AI_ARCHIVE_SECRET", "one")
+    first = user_id_for(key)
+    assert user_id_for(f"  {key}\n") == first
+    monkeypatch.setenv("POCKET_AI_ARCHIVE_SECRET", "two")
+    assert user_id_for(key) != first
+    assert new_archive_key() != key
+
+
+def test_archive_is_disabled_without_a_secret(monkeypatch, tmp_path):
+    monkeypatch.setenv("POCKET_AI_ARCHIVE_DB", str(tmp_path / "archive.db"))
+    monkeypatch.delenv("POCKET_AI_ARCHIVE_SECRET", raising=False)
+    monkeypatch.setattr(archive, "_archive", None)
+
+    assert archive.get_archive() is None
+    with pytest.raises(RuntimeError):
+        user_id_for(new_archive_key())
+
+
+@pytest.mark.parametrize("text", ['"unbalanced', 'NEAR(', 'content: * OR', "-"])
+def test_search_accepts_any_text(monkeypatch, tmp_path, text):
+    monkeypatch.setenv("POCKET_AI_ARCHIVE_SECRET", "test")
+    store = SessionArchive(str(tmp_path / "archive.db"))
+    user_id = user_id_for(new_archive_key())
+    store.start_session("s1", user_id, "breathing", "Mum", 3, ["chest"], "work")
+    store.add_messages("s1", user_id, [{"role": "user", "content": 'the "unbalanced" meeting at work'}])
+
+    hits = store.search(user_id, text)
+
+    assert [hit.session_id for hit in hits] == (["s1"] if "unbalanced" in text else [])
@@ -0,0 +1,31 @@
+"""Tests for multi-backend routing and failover (backends.py)."""
+from types import SimpleNamespace
+
+import pytest
+
+from backends import Backend, RoutingClient
+
+
+class _FlakyCompletions:
+    """Fails with a connection error the first `failures` times, then answers."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+
+    def create(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("connection reset")
+        return SimpleNamespace(model=kwargs["model"])
+
+
+def test_backend_that_answers_again_is_marked_up_without_a_health_checker():
+    backend = Backend("local", SimpleNamespace(chat=SimpleNamespace(completions=_FlakyCompletions(1))))
+    client = RoutingClient([backend], health_interval=0)
+
+    with pytest.raises(ConnectionError):
+        client.create(model="gpt-4o-mini", messages=[])
+    assert not backend.healthy
+
+    client.create(model="gpt-4o-mini", messages=[])
+    assert backend.healthy and client.report()[0]["healthy"]
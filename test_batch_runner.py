@@ -0,0 +1,35 @@
+"""Tests for the offline batch runner (batch_runner.py)."""
+import json
+
+import batch_runner
+from mock_backend import MockOpenAI
+
+SCENARIOS = [{"id": f"s{n}", "persona_name": "dad", "persona_description": "Warm and brief.", "turns": ["hi"]}
+             for n in range(3)]
+
+
+def test_scenarios_share_one_client(monkeypatch, tmp_path):
+    built = []
+
+    def build_client(api_key=None):
+        built.append(MockOpenAI(ttft_ms=0, prefill_us=0, token_ms=0))
+        return built[-1]
+
+    monkeypatch.setattr(batch_runner, "build_client", build_client)
+
+    summary = batch_runner.run_batch(SCENARIOS, str(tmp_path / "out.jsonl"), concurrency=3)
+
+    assert summary["ran"] == 3 and summary["failed"] == 0 and len(built) == 1
+
+
+def test_resume_after_a_truncated_line_keeps_the_file_valid(monkeypatch, tmp_path):
+    monkeypatch.setattr(batch_runner, "build_client", lambda api_key=None: MockOpenAI(ttft_ms=0, prefill_us=0, token_ms=0))
+    output = tmp_path / "out.jsonl"
+    output.write_text(json.dumps({"id": "s0", "status": "ok"}) + '\n{"id": "s1", "sta')
+
+    summary = batch_runner.run_batch(SCENARIOS, str(output), resume=True)
+
+    lines = output.read_text().splitlines()
+    assert summary["ran"] == 2 and summary["skipped"] == 1
+    assert lines[1] == '{"id": "s1", "sta'
+    assert sorted(json.loads(line)["id"] for line in lines[2:]) == ["s1", "s2"]
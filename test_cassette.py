@@ -0,0 +1,20 @@
+"""Tests for the record/replay transport (cassette.py)."""
+from cassette import RecordingClient, ReplayClient, load_cassette
+from early_stop import SentenceBudget
+from mock_backend import MockOpenAI
+from script import CompletionStats, PersonaChat
+
+
+def test_stream_stopped_early_is_recorded_and_replays(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    messages = [{"role": "system", "content": "You are a kind friend."}, {"role": "user", "content": "hi"}]
+    recorder = PersonaChat(verbose=False, client=RecordingClient(MockOpenAI(ttft_ms=0, prefill_us=0, token_ms=0), path))
+
+    stats = CompletionStats()
+    recorded = "".join(recorder.stream_complete(messages, sentence_budget=SentenceBudget(2), stats=stats))
+
+    assert stats.stopped_early
+    [interaction] = load_cassette(path)
+    assert interaction["stopped"] is True
+    replayer = PersonaChat(verbose=False, client=ReplayClient(path))
+    assert "".join(replayer.stream_complete(messages, sentence_budget=SentenceBudget(2))) == recorded
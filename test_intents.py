@@ -0,0 +1,21 @@
+"""Tests for the local intent classifier (intents.py)."""
+import pytest
+
+from intents import classify
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("yes I did", "yes"), ("I'd like to try another one", "yes"), ("let's try another breathing exercise", "yes"),
+    ("I couldn't do it", "no"), ("I wasn't able to finish the exercise", "no"),
+    ("no, that's all", "done"), ("nothing else to add", "done"), ("that's all for now", "done"),
+])
+def test_scripted_answers_are_recognised(text, intent):
+    assert classify(text) == (intent, 1.0, "rule")
+
+
+@pytest.mark.parametrize("text", [
+    "I'd like to die", "I didn't want to live anymore", "nothing more to live for", "that's it I give up",
+    "I couldn't stop thinking about killing myself",
+])
+def test_longer_statements_are_not_matched_by_the_rules(text):
+    assert classify(text).source != "rule"
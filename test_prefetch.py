@@ -0,0 +1,36 @@
+"""Tests for speculative prefetch (prefetch.py)."""
+from early_stop import SentenceBudget
+from mock_backend import MockOpenAI
+from prefetch import SpeculativePrefetcher
+from script import CompletionStats, PersonaChat
+from workers import CompletionPool
+
+
+def _chat():
+    chat = PersonaChat(verbose=False, client=MockOpenAI(ttft_ms=0, prefill_us=0, token_ms=0))
+    chat.set_persona_environment("dad", "Warm and brief.")
+    return chat
+
+
+def test_prefetch_does_not_overwrite_the_live_turns_numbers():
+    pool, chat, prefetcher = CompletionPool(max_workers=2), _chat(), SpeculativePrefetcher()
+    job = pool.submit_turn("s", "chat", chat.turn_key("hi"), prefetcher.chat, chat, "hi",
+                           sentence_budget=SentenceBudget(1), stats=CompletionStats())
+    job.result(timeout=5)
+    chunks = job.stats.chunks
+
+    # A prefetch for the next turn finishes on the same PersonaChat after the live turn
+    prefetcher.prefetch(chat, "[SYSTEM: next]", sentence_budget=SentenceBudget(3))
+    prefetcher._pending[next(iter(prefetcher._pending))][0].result(timeout=5)
+
+    assert job.stats.stopped_early and job.stats.chunks == chunks and not job.stats.prefetched
+
+
+def test_prefetch_hit_reports_the_prefetched_reply():
+    chat, prefetcher = _chat(), SpeculativePrefetcher()
+    prefetcher.prefetch(chat, "[SYSTEM: next]", sentence_budget=SentenceBudget(1))
+    stats = CompletionStats()
+
+    prefetcher.chat(chat, "[SYSTEM: next]", stats=stats)
+
+    assert stats.prefetched and stats.stopped_early and prefetcher.hits == 1
@@ -0,0 +1,28 @@
+"""Tests for per-rerun profiling (profiling.py)."""
+import os
+
+import profiling
+from profiling import RerunProfiler, profiling_requested
+
+
+def test_query_parameter_needs_the_operators_permission(monkeypatch):
+    monkeypatch.delenv("POCKET_AI_PROFILE", raising=False)
+    monkeypatch.delenv("POCKET_AI_PROFILE_ALLOWED", raising=False)
+    assert not profiling_requested({"profile": "1"})
+
+    monkeypatch.setenv("POCKET_AI_PROFILE_ALLOWED", "1")
+    assert profiling_requested({"profile": "1"})
+    assert not profiling_requested({})
+
+
+def test_only_the_newest_profiles_are_kept(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "MAX_PROFILE_FILES", 3)
+    profiler = RerunProfiler("s1")
+    profiler.capture_cprofile = True
+
+    for _ in range(5):
+        profiler.begin("chat")
+        profiler.end()
+
+    assert sorted(os.listdir(profiler.profile_path())) == [f"rerun-{n:05d}.prof" for n in (3, 4, 5)]
@@ -0,0 +1,64 @@
+"""Tests for crisis screening (safety.py) and its use by group conversations."""
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import api_server
+from mock_backend import MockOpenAI
+from safety import CRISIS, CRISIS_REPLY, screen
+
+
+@pytest.mark.parametrize("message", [
+    "I want to kill myself", "I'm killing myself", "I almost killed myself last year",
+    "it kills myself a little every day", "I could kill my self",
+])
+def test_kill_myself_in_every_form_is_a_crisis(message):
+    assert screen(message).level == CRISIS
+
+
+def test_kill_without_myself_is_not_a_crisis():
+    assert screen("this commute kills me").level != CRISIS
+
+
+@pytest.mark.parametrize("message", [
+    "I wish I was dead", "I wish I were dead", "I want to be dead", "I would rather be dead",
+    "I'd like to die", "life isn't worth living", "I didn't want to live anymore",
+    "nothing more to live for", "I never want to wake up", "I want to kms",
+])
+def test_wishing_to_be_dead_is_a_crisis(message):
+    assert screen(message).level == CRISIS
+
+
+def test_joking_does_not_take_an_acute_statement_below_crisis():
+    assert screen("I just want to die lol").level == CRISIS
+    assert screen("I feel so hopeless lol").score < screen("I feel so hopeless").score
+
+
+def test_group_crisis_message_is_never_sent_to_the_personas(monkeypatch):
+    client = MockOpenAI(ttft_ms=0, prefill_us=0, token_ms=0)
+    calls = []
+    create = client.chat.completions.create
+    client.chat.completions.create = lambda **kwargs: calls.append(kwargs) or create(**kwargs)
+    monkeypatch.setattr(api_server, "get_shared_client", lambda: client)
+    monkeypatch.setattr(api_server, "_warm_up_in_background", lambda: None)
+
+    async def run():
+        async with TestClient(TestServer(api_server.create_app())) as http:
+            response = await http.post("/groups", json={"personas": [
+                {"persona_name": "mom", "persona_description": "kind"},
+                {"persona_name": "dad", "persona_description": "quiet"},
+            ]})
+            group_id = (await response.json())["group_id"]
+            response = await http.post(f"/groups/{group_id}/messages", json={"message": "I killed myself inside"})
+            body = await response.json()
+            stream = await http.post(f"/groups/{group_id}/stream", json={"message": "I want to kill myself"})
+            return body, await stream.text(), http.server.app["sessions"].get(group_id)
+
+    body, events, session = asyncio.run(run())
+
+    assert body["replies"] == {} and body["reply"] == CRISIS_REPLY and body["screening"]["level"] == CRISIS
+    assert '"reply": ' in events and "event: done" in events
+    assert calls == []
+    for chat in session.chat.members.values():
+        assert chat.conversation_history[-1]["content"] == CRISIS_REPLY
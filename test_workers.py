@@ -0,0 +1,48 @@
+"""Tests for the completion worker pool (workers.py): turn serialization, duplicate submits, timing."""
+import time
+
+from mock_backend import MockOpenAI
+from script import PersonaChat
+from workers import CompletionPool
+
+
+def _chat():
+    chat = PersonaChat(verbose=False, client=MockOpenAI(ttft_ms=0, prefill_us=0, token_ms=0))
+    chat.set_persona_environment("dad", "Warm and brief.")
+    return chat
+
+
+def test_repeated_submit_reuses_the_turn():
+    pool, chat = CompletionPool(max_workers=2), _chat()
+    first = pool.submit_turn("s", "chat", chat.turn_key("hi"), chat.chat, "hi")
+    first.result(timeout=5)
+
+    assert pool.duplicate_of("s", "chat", chat.turn_key("hi")) is first
+    assert pool.submit_turn("s", "chat", chat.turn_key("hi"), chat.chat, "hi") is first
+    assert len(chat.conversation_history) == 3
+
+
+def test_retry_on_a_new_branch_right_after_the_reply_makes_a_new_call():
+    pool, chat = CompletionPool(max_workers=2), _chat()
+    first = pool.submit_turn("s", "chat", chat.turn_key("hi"), chat.chat, "hi")
+    first.result(timeout=5)
+
+    # "Try another reply": branch before the last exchange and send it again
+    chat.branch(keep=len(chat.conversation_history) - 2)
+    assert pool.duplicate_of("s", "chat", chat.turn_key("hi")) is None
+    retry = pool.submit_turn("s", "chat", chat.turn_key("hi"), chat.chat, "hi")
+    retry.result(timeout=5)
+
+    assert retry is not first
+    assert len(chat.conversation_history) == 3
+    assert chat.branches["main"].shares_with(chat.conversation_history) == 1
+
+
+def test_duration_stops_when_the_call_finishes():
+    pool = CompletionPool(max_workers=1)
+    job = pool.submit("s", "chat", lambda cancel_event: "done")
+    job.result(timeout=5)
+    time.sleep(0.05)
+
+    assert job.finished_at is not None
+    assert job.duration < 0.05 <= job.elapsed
@@ -0,0 +1,151 @@
+"""
+Input-token report for the exercise prompts, full vs. compact mode.
+
+Replays a short scripted conversation for every exercise in both prompt
+modes (see prompts.py). It prints the input tokens of every turn, which
+grow because the whole history is resent. It then times the same
+conversations on the offline mock backend. The mock's time to first token
+grows with prompt size (POCKET_AI_MOCK_PREFILL_US per token), so the latency
+column shows what the smaller prompts save under that model, not real
+OpenAI timings.
+
+Tokens are counted with tiktoken when it is installed (the gpt-4o-mini
+encoding); otherwise they are estimated at about four characters per token.
+
+Usage:
+    python token_report.py
+    python token_report.py --turns 8 --prefill-us 200
+    python token_report.py --no-latency
+"""
+import argparse
+import statistics
+import time
+from typing import Callable, Dict, List, Tuple
+
+from mock_backend import MockOpenAI, MOCK_REPLY, estimate_tokens
+from prompts import (body_scan_prompts, breathing_prompts, describe_checkin,
+                     empty_chair_prompts, reflection_prompts)
+from script import PersonaChat
+
+SAMPLE_CHECKIN = describe_checkin(2, ["Tension in body", "Tight chest or breathing"], "Work tasks or projects")
+
+# exercise -> (persona name, prompt builder, scripted user turns)
+EXERCISES: Dict[str, Tuple[str, Callable, List[str]]] = {
+    "empty_chair": (
+        "father",
+        lambda compact: empty_chair_prompts(
+            SAMPLE_CHECKIN, "father", "Quiet, proud, rarely says how he feels",
+            "Something I never got to say", "His workshop on a Sunday morning", compact=compact),
+        ["I always wanted you to be proud of me.", "Why didn't you ever say it?",
+         "I think I understand now.", "I miss you.", "Thank you for listening."],
+    ),
+    "breathing": (
+        "Breathing Guide",
+        lambda compact: breathing_prompts(SAMPLE_CHECKIN, [], compact=compact),
+        ["Hi, I'm ready.", "Okay, starting now.", "yes", "A bit calmer, thanks.", "Bye for now."],
+    ),
+    "body_scan": (
+        "Body Scan Guide",
+        lambda compact: body_scan_prompts(SAMPLE_CHECKIN, "shoulders", "Tense and heavy", compact=compact),
+        ["My manager criticised my work in a meeting.", "Also a fight with my partner.",
+         "that's all", "Yes, mostly worry.", "I'm okay, a little lighter."],
+    ),
+    "reflection": (
+        "Reflection Guide",
+        lambda compact: reflection_prompts(SAMPLE_CHECKIN, "Anxious", "Tight in my chest",
+                                           "A hard conversation at work", compact=compact),
+        ["I keep replaying what I'll say.", "I'm afraid of how they'll react.",
+         "Maybe I'm expecting the worst.", "That helps, actually.", "Thanks."],
+    ),
+}
+
+
+def _token_counter() -> Tuple[str, Callable[[str], int]]:
+    """Return a counter name and function; tiktoken if available, else the estimate."""
+    try:
+        import tiktoken
+    except ImportError:
+        return "estimated", estimate_tokens
+    encoding = tiktoken.get_encoding("o200k_base")
+    return "tiktoken o200k_base", lambda text: len(encoding.encode(text))
+
+
+def count_messages(messages: List[Dict[str, str]], count: Callable[[str], int]) -> int:
+    """Input tokens of a chat request (content plus per-message overhead)."""
+    return sum(count(m["content"]) + 4 for m in messages) + 3
+
+
+def turn_tokens(exercise: str, compact: bool, turns: int, count: Callable[[str], int]) -> List[int]:
+    """
+    Input tokens of every request in a scripted conversation.
+
+    Args:
+        exercise: Key of EXERCISES
+        compact: Prompt mode
+        turns: User turns after the opening (greeting) request
+        count: Token counter
+
+    Returns:
+        Token counts, the greeting request first
+    """
+    persona_name, build, user_turns = EXERCISES[exercise]
+    chat = PersonaChat(verbose=False, client=MockOpenAI())
+    persona_description, initial_prompt = build(compact)
+    chat.set_persona_environment(persona_name, persona_description, compact=compact)
+
+    counts = []
+    for message in [initial_prompt] + [user_turns[i % len(user_turns)] for i in range(turns)]:
+        counts.append(count_messages(chat.conversation_history + [{"role": "user", "content": message}], count))
+        chat.record_exchange(message, MOCK_REPLY)
+    return counts
+
+
+def turn_latencies(exercise: str, compact: bool, turns: int, client: MockOpenAI) -> List[float]:
+    """Seconds per request for the same conversation on the mock backend."""
+    persona_name, build, user_turns = EXERCISES[exercise]
+    chat = PersonaChat(verbose=False, client=client)
+    persona_description, initial_prompt = build(compact)
+    chat.set_persona_environment(persona_name, persona_description, compact=compact)
+
+    latencies = []
+    for message in [initial_prompt] + [user_turns[i % len(user_turns)] for i in range(turns)]:
+        started = time.perf_counter()
+        chat.chat(message)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt input tokens and mock latency for full and compact modes.")
+    parser.add_argument("--turns", type=int, default=5, help="User turns after the greeting")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="Mock base time to first token")
+    parser.add_argument("--prefill-us", type=float, default=50, help="Mock extra microseconds per prompt token")
+    parser.add_argument("--token-ms", type=float, default=2, help="Mock delay per generated token")
+    parser.add_argument("--no-latency", action="store_true", help="Only count tokens")
+    args = parser.parse_args()
+
+    counter_name, count = _token_counter()
+    client = MockOpenAI(ttft_ms=args.ttft_ms, prefill_us=args.prefill_us, token_ms=args.token_ms)
+    print(f"Input tokens per request ({counter_name}); turn 0 is the greeting\n")
+
+    turn_headers = "".join(f"{f't{i}':>7}" for i in range(args.turns + 1))
+    print(f"{'exercise':<13}{'mode':<9}{turn_headers}{'total':>9}{'saved':>8}{'mean_ms':>9}")
+
+    for exercise in EXERCISES:
+        full_total = None
+        for compact in (False, True):
+            counts = turn_tokens(exercise, compact, args.turns, count)
+            total = sum(counts)
+            saved = f"{1 - total / full_total:.0%}" if full_total else ""
+            full_total = full_total or total
+
+            mean_ms = ""
+            if not args.no_latency:
+                mean_ms = f"{statistics.mean(turn_latencies(exercise, compact, args.turns, client)) * 1000:.0f}"
+
+            row = "".join(f"{c:>7}" for c in counts)
+            print(f"{exercise:<13}{'compact' if compact else 'full':<9}{row}{total:>9}{saved:>8}{mean_ms:>9}")
+
+
+if __name__ == "__main__":
+    main()
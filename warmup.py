@@ -0,0 +1,268 @@
+"""
+One-time process warm-up and a readiness signal.
+
+After a restart, the first user used to pay for several cold-start costs:
+importing openai and the app's modules, building a client, DNS and TLS to
+the API, and Streamlit's first compile of app.py. warm_up() pays them once
+per process, before any traffic arrives:
+
+- imports every module app.py uses and loads the intent model
+- builds one shared completion client (get_shared_client()); every session
+  uses it, so they share its connection pool
+- opens a connection to the API with a free request (models.retrieve)
+- renders the prompt templates once
+- the launcher also compiles app.py into Streamlit's script cache
+
+start_keepalive() then repeats the free request whenever the process has
+been idle for POCKET_AI_KEEPALIVE_SECONDS (default 4, just under httpx's
+idle-connection expiry). This keeps the pooled connection open. Set it to 0
+to disable the pings.
+
+Readiness:
+    is_ready()                True once warm
+    GET /ready                on POCKET_AI_READY_PORT (default 5001), launcher only:
+                              200 when warm, 503 before
+    POCKET_AI_READY_FILE      if set, written when warm and removed at exit
+
+Start Streamlit through the launcher instead of `streamlit run app.py`
+(arguments are passed through to Streamlit):
+    python warmup.py --server.port 5000 --server.address 0.0.0.0 --server.headless true
+
+api_server.py warms up the same way on startup and serves GET /ready itself.
+"""
+import ast
+import atexit
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import metrics
+from script import build_client
+
+# The model PersonaChat calls (see PersonaChat.complete)
+WARM_MODEL = "gpt-4o-mini"
+
+
+def _app_modules() -> List[str]:
+    """This project's modules that app.py imports, read from its import statements."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(here, "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    return sorted(name for name in names if os.path.exists(os.path.join(here, f"{name}.py")))
+
+
+# Modules app.py imports on its first run; backends is imported by build_client() when used
+APP_MODULES = _app_modules()
+
+KEEPALIVE_SECONDS = float(os.getenv("POCKET_AI_KEEPALIVE_SECONDS", "4"))
+READY_PORT = int(os.getenv("POCKET_AI_READY_PORT", "5001"))
+
+_client = None
+_client_lock = threading.Lock()
+_warm_lock = threading.Lock()
+_warmed = False
+_ready = threading.Event()
+_keepalive_started = False
+
+# Seconds spent in each warm-up step
+timings: Dict[str, float] = {}
+
+
+def get_shared_client():
+    """Return the process-wide completion client, building it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = build_client()
+        return _client
+
+
+def _timed(step: str, fn):
+    started = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        # A failed step only means that cost is paid later, by a real request
+        print(f"Warm-up step '{step}' failed: {e}", file=sys.stderr)
+    timings[step] = round(time.perf_counter() - started, 3)
+
+
+def _import_app_modules():
+    for name in APP_MODULES:
+        importlib.import_module(name)
+    importlib.import_module("intents").load_model()
+    importlib.import_module("workers").get_pool()
+
+
+def _render_templates():
+    prompts = importlib.import_module("prompts")
+    checkin = prompts.describe_checkin(3, ["Tension in body"], "Work tasks or projects")
+    for compact in (False, True):
+        prompts.empty_chair_prompts(checkin, "friend", "kind", "a talk", "a park", compact=compact)
+        prompts.breathing_prompts(checkin, [], compact=compact)
+        prompts.body_scan_prompts(checkin, "shoulders", "tense", compact=compact)
+        prompts.reflection_prompts(checkin, "calm", "relaxed", "work", compact=compact)
+
+
+def ping():
+    """Make a free request so DNS is resolved and a TLS connection is pooled."""
+    models = getattr(get_shared_client(), "models", None)
+    if models is None:
+        # Mock and replay clients have no network connection to warm
+        return
+    models.retrieve(WARM_MODEL)
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Run the warm-up steps once per process; later calls return at once.
+
+    Returns:
+        Seconds spent per step
+    """
+    global _warmed
+    with _warm_lock:
+        if not _warmed:
+            _timed("imports", _import_app_modules)
+            _timed("client", get_shared_client)
+            _timed("connection", ping)
+            _timed("templates", _render_templates)
+            _warmed = True
+    return timings
+
+
+def start_keepalive(interval: float = KEEPALIVE_SECONDS):
+    """Ping the API whenever no completion was submitted during the last interval."""
+    global _keepalive_started
+    if interval <= 0 or _keepalive_started:
+        return
+    _keepalive_started = True
+
+    def loop():
+        last_seen = metrics.get("completions.submitted")
+        while True:
+            time.sleep(interval)
+            submitted = metrics.get("completions.submitted")
+            if submitted == last_seen:
+                try:
+                    ping()
+                except Exception:
+                    pass
+            last_seen = submitted
+
+    threading.Thread(target=loop, name="keepalive", daemon=True).start()
+
+
+def is_ready() -> bool:
+    """Return True once the process is warm and may receive traffic."""
+    return _ready.is_set()
+
+
+def mark_ready():
+    """Signal readiness (and write POCKET_AI_READY_FILE if configured)."""
+    _ready.set()
+    ready_file = os.getenv("POCKET_AI_READY_FILE")
+    if ready_file:
+        with open(ready_file, "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "ready_at": time.time(), "timings": timings}, f)
+        atexit.register(_remove_ready_file, ready_file)
+
+
+def _remove_ready_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class _ReadyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/ready":
+            self.send_error(404)
+            return
+        body = json.dumps({"ready": is_ready(), "timings": timings}).encode("utf-8")
+        self.send_response(200 if is_ready() else 503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_readiness(port: int = READY_PORT, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve GET /ready from a background thread."""
+    server = ThreadingHTTPServer((host, port), _ReadyHandler)
+    threading.Thread(target=server.serve_forever, name="readiness", daemon=True).start()
+    return server
+
+
+def _streamlit_port(args: List[str]) -> int:
+    """Read --server.port from Streamlit's command line (default 8501)."""
+    for i, arg in enumerate(args):
+        if arg.startswith("--server.port="):
+            return int(arg.split("=", 1)[1])
+        if arg == "--server.port" and i + 1 < len(args):
+            return int(args[i + 1])
+    return 8501
+
+
+def _wait_for_streamlit(port: int, timeout: float = 60) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=2):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def _compile_app(app_path: str):
+    """Fill Streamlit's script cache so the first session skips compiling app.py."""
+    from streamlit.runtime import Runtime
+    # Internal API; if it changes, the first session simply compiles the script
+    Runtime.instance()._script_cache.get_bytecode(app_path)
+
+
+def _warm_streamlit(app_path: str, port: int):
+    warm_up()
+    start_keepalive()
+    if not _wait_for_streamlit(port):
+        # Never report ready for a server that did not come up; let the supervisor restart us
+        print(f"Streamlit did not answer on port {port}; exiting", file=sys.stderr)
+        os._exit(1)
+    _timed("compile", lambda: _compile_app(app_path))
+    mark_ready()
+    print(f"Warm-up finished: {timings}", file=sys.stderr)
+
+
+def main():
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    streamlit_args = sys.argv[1:]
+
+    serve_readiness()
+    threading.Thread(
+        target=_warm_streamlit, args=(app_path, _streamlit_port(streamlit_args)), daemon=True
+    ).start()
+
+    from streamlit.web import cli as stcli
+    sys.argv = ["streamlit", "run", app_path] + streamlit_args
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    # Run from the importable module, so app.py sees the same shared state
+    import warmup
+    warmup.main()
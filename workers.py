@@ -0,0 +1,266 @@
+"""
+Bounded worker pool for LLM calls, with per-session cancellation.
+
+The Streamlit script thread submits a completion and returns immediately; the
+UI then polls the job on each rerun. Every job belongs to a session id, so
+when a session is reset, superseded or abandoned its in-flight requests can
+be cancelled (which closes the upstream stream, see PersonaChat.complete).
+
+Turns of one conversation must not overlap: two completions appending to
+the same PersonaChat history at once interleave their messages. Turns
+submitted with submit_turn() therefore run one at a time per session, and
+a repeat of the same input (a double-clicked button, a submit racing a
+rerun, a client retry) is answered by the turn already sent instead of a
+second LLM call.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+import metrics
+
+# Sessions that stop polling for this long are treated as abandoned (tab closed)
+ABANDONED_AFTER_SECONDS = 120
+
+# A repeated input counts as a duplicate while its turn runs and for this long after
+DUPLICATE_WINDOW_SECONDS = float(os.getenv("POCKET_AI_DUPLICATE_WINDOW", "2"))
+
+
+class CompletionJob:
+    """
+    A single submitted call, tied to the session that owns it.
+
+    The wrapped callable must accept a ``cancel_event`` keyword argument and
+    stop as soon as it is set.
+    """
+
+    def __init__(self, session_id: str, kind: str):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.kind = kind
+        self.cancel_event = threading.Event()
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        # The call's CompletionStats (see script.py), when it was given one as stats=
+        self.stats = None
+        self.future = None
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the job was submitted."""
+        return time.monotonic() - self.started_at
+
+    @property
+    def duration(self) -> float:
+        """Seconds from submit to finish (so far, while the call runs), however late it is collected."""
+        finished_at = self.finished_at if self.finished_at is not None else time.monotonic()
+        return finished_at - self.started_at
+
+    def done(self) -> bool:
+        """Return True once the call has finished, failed or been cancelled."""
+        return self.future.done()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """Return the call's result, re-raising any exception it raised."""
+        return self.future.result(timeout=timeout)
+
+    def cancel(self):
+        """Cancel the call: drop it if queued, abort the request if running."""
+        self.cancel_event.set()
+        self.future.cancel()
+
+
+class CompletionPool:
+    """
+    A bounded thread pool that tracks jobs per session.
+
+    Streamlit runs every browser session as a thread in one process, so one
+    pool is shared by everyone (see get_pool()).
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="completion")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Set[CompletionJob]] = {}
+        self._last_seen: Dict[str, float] = {}
+        # Per session: the lock its turns take, and its last turn with the input it was for
+        self._turn_locks: Dict[str, threading.Lock] = {}
+        self._last_turn: Dict[str, Tuple[Tuple[str, Hashable], CompletionJob]] = {}
+
+    def submit(self, session_id: str, kind: str, fn: Callable, *args, **kwargs) -> CompletionJob:
+        """
+        Run fn(*args, cancel_event=..., **kwargs) on the pool.
+
+        Args:
+            session_id: Owner of the job
+            kind: Turn type (e.g. "greeting", "chat", "finished_exercise")
+            fn: The call to make; must accept a cancel_event keyword
+
+        Returns:
+            The submitted CompletionJob
+        """
+        self.cancel_abandoned()
+
+        with self._lock:
+            job = self._start(session_id, kind, fn, args, kwargs)
+        return self._started(job)
+
+    def submit_turn(self, session_id: str, kind: str, message: Optional[Hashable],
+                    fn: Callable, *args, **kwargs) -> CompletionJob:
+        """
+        Like submit(), for a turn of the session's conversation.
+
+        The call waits for the session's earlier turns to finish before it
+        runs. If the same input was just submitted (see duplicate_of()), no
+        new call is made and the earlier turn's job is returned instead.
+
+        Args:
+            session_id: Owner of the job
+            kind: Turn type (e.g. "greeting", "chat", "finished_exercise")
+            message: The input the turn answers, used to spot duplicates.
+                Include whatever else tells turns apart, e.g. the conversation
+                branch, so a retry of the same text on a new branch is a new
+                turn. None to only serialize (e.g. for a stream that cannot
+                be shared)
+            fn: The call to make; must accept a cancel_event keyword
+
+        Returns:
+            The submitted CompletionJob, or the earlier one for a duplicate
+        """
+        self.cancel_abandoned()
+
+        with self._lock:
+            duplicate = self._duplicate_locked(session_id, kind, message)
+            if duplicate is not None:
+                metrics.incr("completions.duplicates_avoided")
+                return duplicate
+            turn_lock = self._turn_locks.setdefault(session_id, threading.Lock())
+            job = self._start(session_id, kind, _run_in_turn, (turn_lock, fn) + args, kwargs)
+            if message is not None:
+                self._last_turn[session_id] = ((kind, message), job)
+        return self._started(job)
+
+    def duplicate_of(self, session_id: str, kind: str, message: Hashable) -> Optional[CompletionJob]:
+        """
+        Find the turn a repeated submit duplicates, counting the call avoided.
+
+        A submit is a duplicate when it repeats the input of the session's
+        last turn while that turn is still running, or within
+        DUPLICATE_WINDOW_SECONDS of its reply. Failed and cancelled turns
+        are never duplicated, so a retry after them goes through.
+
+        Returns:
+            The earlier job, or None if this is a new turn
+        """
+        with self._lock:
+            duplicate = self._duplicate_locked(session_id, kind, message)
+        if duplicate is not None:
+            metrics.incr("completions.duplicates_avoided")
+        return duplicate
+
+    def _duplicate_locked(self, session_id: str, kind: str,
+                          message: Optional[Hashable]) -> Optional[CompletionJob]:
+        last = self._last_turn.get(session_id)
+        if message is None or last is None or last[0] != (kind, message):
+            return None
+        job = last[1]
+        if not job.done():
+            return job
+        if job.future.cancelled() or job.future.exception() is not None:
+            return None
+        finished_at = job.finished_at if job.finished_at is not None else time.monotonic()
+        return job if time.monotonic() - finished_at < DUPLICATE_WINDOW_SECONDS else None
+
+    def _start(self, session_id: str, kind: str, fn: Callable, args: tuple, kwargs: dict) -> CompletionJob:
+        """Submit a job; the caller holds self._lock."""
+        job = CompletionJob(session_id, kind)
+        job.stats = kwargs.get("stats")
+        job.future = self._executor.submit(fn, *args, cancel_event=job.cancel_event, **kwargs)
+        self._jobs.setdefault(session_id, set()).add(job)
+        self._last_seen[session_id] = time.monotonic()
+        return job
+
+    def _started(self, job: CompletionJob) -> CompletionJob:
+        job.future.add_done_callback(lambda _: self._forget(job))
+        metrics.incr("completions.submitted")
+        return job
+
+    def touch(self, session_id: str):
+        """Record that a session is still alive (call on every rerun)."""
+        with self._lock:
+            if session_id in self._jobs:
+                self._last_seen[session_id] = time.monotonic()
+
+    def cancel_session(self, session_id: str) -> int:
+        """
+        Cancel every unfinished job of a session.
+
+        Returns:
+            Number of jobs cancelled
+        """
+        with self._lock:
+            jobs = self._jobs.pop(session_id, set())
+            self._last_seen.pop(session_id, None)
+            self._turn_locks.pop(session_id, None)
+            # A reset conversation starts over; repeating its last input is a new turn
+            self._last_turn.pop(session_id, None)
+
+        cancelled = 0
+        for job in jobs:
+            if not job.done():
+                job.cancel()
+                cancelled += 1
+        if cancelled:
+            metrics.incr("completions.cancelled", cancelled)
+        return cancelled
+
+    def cancel_abandoned(self, max_idle: float = ABANDONED_AFTER_SECONDS) -> int:
+        """Cancel jobs of sessions that have not polled for max_idle seconds."""
+        now = time.monotonic()
+        with self._lock:
+            stale = [sid for sid, seen in self._last_seen.items() if now - seen > max_idle]
+            # Forget last turns that can no longer be duplicated
+            for sid, (_, job) in list(self._last_turn.items()):
+                if job.finished_at is not None and now - job.finished_at > DUPLICATE_WINDOW_SECONDS:
+                    del self._last_turn[sid]
+
+        return sum(self.cancel_session(sid) for sid in stale)
+
+    def _forget(self, job: CompletionJob):
+        """Drop a finished job from the session index."""
+        with self._lock:
+            job.finished_at = time.monotonic()
+            jobs = self._jobs.get(job.session_id)
+            if jobs is not None:
+                jobs.discard(job)
+                if not jobs:
+                    del self._jobs[job.session_id]
+                    self._last_seen.pop(job.session_id, None)
+                    self._turn_locks.pop(job.session_id, None)
+
+
+def _run_in_turn(turn_lock: threading.Lock, fn: Callable, *args, **kwargs) -> Any:
+    """Run fn once the session's earlier turns have finished."""
+    if not turn_lock.acquire(blocking=False):
+        metrics.incr("completions.serialized")
+        turn_lock.acquire()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        turn_lock.release()
+
+
+_pool: Optional[CompletionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> CompletionPool:
+    """Return the process-wide pool (size from POCKET_AI_WORKERS, default 8)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CompletionPool(max_workers=int(os.getenv("POCKET_AI_WORKERS", "8")))
+        return _pool